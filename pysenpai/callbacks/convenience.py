@@ -1,3 +1,12 @@
+import math
+from pysenpai.callbacks.defaults import IncrementalPassFailGrader
+from pysenpai.exceptions import ValidationFailure
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 def rounding_float_result_validator(ref, res, out):
     """
     This is a convenience callback for validating functions that return floating
@@ -11,6 +20,127 @@ def rounding_float_result_validator(ref, res, out):
     else:
         raise AssertionError
     
+def _numeric_shape(value):
+    """
+    Returns the shape of a nested sequence of numbers as a tuple, or None if the
+    sequence is ragged.
+    """
+
+    if not isinstance(value, (list, tuple)):
+        return ()
+    if not value:
+        return (0, )
+    shapes = {_numeric_shape(item) for item in value}
+    if len(shapes) != 1 or None in shapes:
+        return None
+    return (len(value), ) + shapes.pop()
+
+def _flatten_numeric(value, index=()):
+    """
+    Generates (index, number) pairs from a nested sequence of numbers.
+    """
+
+    if isinstance(value, (list, tuple)):
+        for i, item in enumerate(value):
+            yield from _flatten_numeric(item, index + (i, ))
+    else:
+        yield index, value
+
+def _format_mismatches(mismatches):
+    return "\n".join(
+        "{}: {!r}, {!r}".format(list(index), res, ref) for index, res, ref in mismatches
+    )
+
+def _compare_numpy(ref, res, rtol, atol, max_report):
+    ref_arr = numpy.asarray(ref, dtype=float)
+    res_arr = numpy.asarray(res, dtype=float)
+    if ref_arr.shape != res_arr.shape:
+        raise ValidationFailure(
+            "fail_shape_mismatch", ref_shape=ref_arr.shape, res_shape=res_arr.shape
+        )
+    close = numpy.isclose(res_arr, ref_arr, rtol=rtol, atol=atol, equal_nan=True)
+    if close.all():
+        return
+    bad = numpy.argwhere(~close)
+    raise ValidationFailure(
+        "fail_values_not_close",
+        count=len(bad),
+        total=ref_arr.size,
+        mismatches=_format_mismatches(
+            (tuple(index), res_arr[tuple(index)].item(), ref_arr[tuple(index)].item())
+            for index in bad[:max_report]
+        )
+    )
+
+def _compare_python(ref, res, rtol, atol, max_report):
+    ref_shape = _numeric_shape(ref)
+    res_shape = _numeric_shape(res)
+    if ref_shape != res_shape:
+        raise ValidationFailure("fail_shape_mismatch", ref_shape=ref_shape, res_shape=res_shape)
+    ref_items = _flatten_numeric(ref)
+    res_items = _flatten_numeric(res)
+    if ref_shape is None:
+        # ragged sequences need to have identical structure
+        ref_items = list(ref_items)
+        res_items = list(res_items)
+        if [index for index, _ in ref_items] != [index for index, _ in res_items]:
+            raise ValidationFailure("fail_shape_mismatch", ref_shape=None, res_shape=None)
+    mismatches = []
+    count = 0
+    total = 0
+    for (index, ref_v), (_, res_v) in zip(ref_items, res_items):
+        total += 1
+        try:
+            close = abs(res_v - ref_v) <= atol + rtol * abs(ref_v) or (
+                math.isnan(res_v) and math.isnan(ref_v)
+            )
+        except TypeError:
+            close = False
+        if not close:
+            count += 1
+            if len(mismatches) < max_report:
+                mismatches.append((index, res_v, ref_v))
+    if count:
+        raise ValidationFailure(
+            "fail_values_not_close",
+            count=count,
+            total=total,
+            mismatches=_format_mismatches(mismatches)
+        )
+
+def make_tolerance_validator(rtol=1e-05, atol=1e-08, max_report=5, use_parsed=False):
+    """
+    make_tolerance_validator([rtol=1e-05][, atol=1e-08][, max_report=5][, use_parsed=False]) -> function
+    
+    Creates a validator that compares numbers, nested numeric sequences and NumPy
+    arrays elementwise with the given relative and absolute tolerances, using the
+    same closeness rule as :func:`numpy.isclose`. If NumPy is available the
+    comparison is done in vectorized form, otherwise a pure Python comparison is
+    used. If *use_parsed* is True, the parsed output is compared instead of the
+    return value.
+    
+    The validator fails with fail_shape_mismatch if the shapes differ, without
+    comparing any values. If values differ, it fails with fail_values_not_close
+    and only the first *max_report* mismatching indices are given to the message
+    as the mismatches format argument, alongside count and total.
+    """
+    
+    def tolerance_validator(ref, res, out):
+        value = out if use_parsed else res
+        if numpy is not None:
+            try:
+                _compare_numpy(ref, value, rtol, atol, max_report)
+                return
+            except (TypeError, ValueError):
+                # ragged or non-numeric content, shape check is done below
+                pass
+        _compare_python(ref, value, rtol, atol, max_report)
+    
+    return tolerance_validator
+
+numeric_tolerance_validator = make_tolerance_validator()
+parsed_numeric_tolerance_validator = make_tolerance_validator(use_parsed=True)
+    
 def parsed_list_validator(ref, res, out):
     """
     This is a convenience callback for validating lists of parsed results against 
@@ -76,3 +206,12 @@ def output_bonus_grader(test_cases):
 
 def output_strict_grader(test_cases):
     return int(all(case.correct and case.output_correct for case in test_cases))
+
+class IncrementalOutputStrictGrader(IncrementalPassFailGrader):
+    """
+    Incremental version of :func:`output_strict_grader`. Give a new instance to
+    each test.
+    """
+
+    def passes(self, test_case):
+        return test_case.correct and test_case.output_correct
@@ -1,4 +1,21 @@
 import inspect
+import reprlib
+
+# Size caps used by the default presenters. Checkers can adjust these
+# attributes directly (e.g. value_repr.maxlist = 1000) if they need to show
+# more, or less, of large values.
+value_repr = reprlib.Repr()
+value_repr.maxlevel = 6
+value_repr.maxlist = 200
+value_repr.maxtuple = 200
+value_repr.maxset = 200
+value_repr.maxfrozenset = 200
+value_repr.maxdeque = 200
+value_repr.maxarray = 200
+value_repr.maxdict = 100
+value_repr.maxstring = 2000
+value_repr.maxlong = 400
+value_repr.maxother = 2000
 
 def result_validator(ref, res, out):
     """
@@ -39,6 +56,16 @@ def default_pylint_grader(stats):
         raise AssertionError
     return 1
 
+def capped_repr(value) -> str:
+    """
+    Returns the repr form of *value* with size caps applied from
+    :data:`value_repr`. Long sequences show their first items followed by ...,
+    long strings and big integers are shortened from the middle and structures
+    nested deeper than the allowed level are shown as ... as well.
+    """
+    
+    return value_repr.repr(value)
+
 def default_value_presenter(value) -> str:
     """
     This is the default presenter for student result values, parsed results, reference values
@@ -47,16 +74,25 @@ def default_value_presenter(value) -> str:
     using repr for each invidual item and items are separated with spaces. Dictionary items are 
     presented as :code:`"{}: {}"` where repr of both key and value are used.    
     
-    For more precise control of representing more complex structures, a custom presenter is
-    recommended.
+    Large values are truncated using :func:`capped_repr`. For more precise control of 
+    representing more complex structures, a custom presenter is recommended.
     """    
     
     if isinstance(value, (list, tuple)):
-        return " ".join([repr(x) for x in value])
+        shown = " ".join([capped_repr(x) for x in value[:value_repr.maxlist]])
+        if len(value) > value_repr.maxlist:
+            shown += " ..."
+        return shown
     elif isinstance(value, dict):
-        return "\n" + "\n".join(["{}: {}".format(repr(k), repr(v)) for k, v in value.items()])
+        items = list(value.items())
+        shown = "\n" + "\n".join(
+            ["{}: {}".format(capped_repr(k), capped_repr(v)) for k, v in items[:value_repr.maxdict]]
+        )
+        if len(items) > value_repr.maxdict:
+            shown += "\n..."
+        return shown
     else:
-        return repr(value)
+        return capped_repr(value)
     
 def default_input_presenter(value) -> str:
     """
@@ -71,16 +107,17 @@ def default_call_presenter(func_name, args) -> str:
     This function is used for showing the way the student function was called
     during a test. It forms a function call code line using the function name 
     and its arguments. If the call would be long (over 80 characters), it is 
-    split to multiple lines. 
+    split to multiple lines. Argument values are truncated using :func:`capped_repr`.
     """
     
+    arg_reprs = [capped_repr(arg) for arg in args]
     call = func_name + "("
-    if len(str(args)) > 80:
+    if sum(len(r) + 2 for r in arg_reprs) > 80:
         call += "\n"
-        call += ",\n".join("    " + repr(arg) for arg in args)
+        call += ",\n".join("    " + r for r in arg_reprs)
         call += "\n)"
     else:
-        call += ", ".join(repr(arg) for arg in args)
+        call += ", ".join(arg_reprs)
         call += ")"
     
     return "{{{highlight=python3\n" + call + "\n}}}"
@@ -109,6 +146,25 @@ def default_vars_presenter(module) -> str:
 def pass_fail_grader(test_cases):
     return int(all(case.correct for case in test_cases))
     
+class IncrementalPassFailGrader(object):
+    """
+    Incremental version of :func:`pass_fail_grader` that receives test cases one
+    at a time instead of needing the whole list. Give a new instance to each test.
+    Other all-or-nothing graders can be made by overriding :meth:`passes`.
+    """
+    
+    def __init__(self):
+        self.passed = True
+        
+    def passes(self, test_case):
+        return test_case.correct
+        
+    def add(self, test_case):
+        self.passed = self.passed and self.passes(test_case)
+        
+    def score(self):
+        return int(self.passed)
+    
 def static_pass_fail_grader(failed):
     return int(not failed)
     
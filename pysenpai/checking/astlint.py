@@ -0,0 +1,325 @@
+"""
+A lightweight lint backend for :func:`~pysenpai.checking.lint.pylint_test`
+that checks the syntax tree of the submission with a small set of rules
+instead of running PyLint. It covers the checks that matter most in beginner
+exercises, runs in milliseconds, and produces messages and stats that work
+with the existing lint messages and graders::
+
+    pylint_test(st_module, lang, backend=AstLinter())
+
+Rules are :class:`Rule` objects and each checker can choose its own set. New
+rules are easiest to make with the :func:`rule` decorator::
+
+    @rule("W9001", "print-in-function", "warning", "Function {name} prints", ast.FunctionDef)
+    def print_in_function(node, context):
+        for child in ast.walk(node):
+            if isinstance(child, ast.Name) and child.id == "print":
+                yield child, {"name": node.name}
+
+    linter = AstLinter(DEFAULT_RULES + [print_in_function])
+
+Message ids and symbols follow PyLint's where a rule has a PyLint equivalent.
+"""
+
+import ast
+import builtins
+import os
+from collections import Counter
+
+CATEGORIES = ("convention", "refactor", "warning", "error", "fatal")
+
+BUILTIN_NAMES = frozenset(name for name in dir(builtins) if not name.startswith("_"))
+
+
+class LintMessage(object):
+    """
+    One message found by :class:`AstLinter`. Has the same attributes as PyLint's
+    messages that are used in the lint messages.
+    """
+
+    def __init__(self, msg_id, symbol, category, msg, path, module, line, column=0, obj=""):
+        self.msg_id = msg_id
+        self.symbol = symbol
+        self.category = category
+        self.msg = msg
+        self.path = path
+        self.module = module
+        self.line = line
+        self.column = column
+        self.obj = obj
+
+    def __repr__(self):
+        return "<LintMessage {} {}:{}>".format(self.symbol, self.module, self.line)
+
+
+class LintStats(object):
+    """
+    Statistics of an :class:`AstLinter` run with the attributes that graders
+    and lint messages use from PyLint's stats: counts per category, *statement*,
+    *by_msg* and *global_note*, which is computed with PyLint's default
+    evaluation formula unless given.
+    """
+
+    def __init__(self, messages, statement, global_note=None):
+        counts = Counter(msg.category for msg in messages)
+        self.convention = counts["convention"]
+        self.refactor = counts["refactor"]
+        self.warning = counts["warning"]
+        self.error = counts["error"]
+        self.fatal = counts["fatal"]
+        self.info = 0
+        self.statement = statement
+        self.by_msg = dict(Counter(msg.symbol for msg in messages))
+        if global_note is not None:
+            self.global_note = global_note
+        elif self.fatal or not statement:
+            self.global_note = 0.0
+        else:
+            penalty = 5 * self.error + self.warning + self.refactor + self.convention
+            self.global_note = max(0.0, 10.0 - penalty / statement * 10)
+
+
+class Rule(object):
+    """
+    A lint rule. *check* is called with every node of the types in *node_types*
+    (with no types, only the module node) and a :class:`LintContext`, and
+    yields (node, format_args) pairs for problems. The message is *text*
+    formatted with format_args and it's reported with *msg_id*, *symbol* and
+    *category*, one of :data:`CATEGORIES`.
+    """
+
+    def __init__(self, msg_id, symbol, category, text, check, node_types=()):
+        if category not in CATEGORIES:
+            raise ValueError("Unknown lint category: {}".format(category))
+        self.msg_id = msg_id
+        self.symbol = symbol
+        self.category = category
+        self.text = text
+        self.check = check
+        self.node_types = tuple(node_types) or (ast.Module, )
+
+
+def rule(msg_id, symbol, category, text, *node_types):
+    """
+    rule(msg_id, symbol, category, text[, node_type1][, ...]) -> Rule
+
+    Decorator that turns a check function into a :class:`Rule`.
+    """
+
+    def decorator(check):
+        return Rule(msg_id, symbol, category, text, check, node_types)
+
+    return decorator
+
+
+class LintContext(object):
+    """
+    Information about the file being linted that is available to rules: the
+    syntax *tree*, source *lines* and the *parents* of nodes.
+    """
+
+    def __init__(self, tree, source):
+        self.tree = tree
+        self.lines = source.splitlines()
+        self.parents = {}
+        for node in ast.walk(tree):
+            for child in ast.iter_child_nodes(node):
+                self.parents[child] = node
+
+    def enclosing_scope(self, node):
+        node = self.parents.get(node)
+        while node is not None and not isinstance(node, SCOPE_TYPES):
+            node = self.parents.get(node)
+        return node
+
+
+SCOPE_TYPES = (ast.Module, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)
+FUNCTION_TYPES = (ast.FunctionDef, ast.AsyncFunctionDef)
+
+
+def _scope_nodes(scope):
+    # nodes that belong to the scope itself, not to nested functions or classes
+    stack = list(ast.iter_child_nodes(scope))
+    while stack:
+        node = stack.pop()
+        yield node
+        if not isinstance(node, SCOPE_TYPES):
+            stack.extend(ast.iter_child_nodes(node))
+
+def _assigned_names(node):
+    if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+        yield node.id, node
+    elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        yield node.name, node
+    elif isinstance(node, ast.arg):
+        yield node.arg, node
+    elif isinstance(node, (ast.Import, ast.ImportFrom)):
+        for alias in node.names:
+            if alias.name != "*":
+                yield (alias.asname or alias.name).split(".")[0], node
+
+
+@rule("W0612", "unused-variable", "warning", "Unused variable '{name}'", *FUNCTION_TYPES)
+def unused_variable(node, context):
+    declared = set()
+    stored = {}
+    for child in _scope_nodes(node):
+        if isinstance(child, (ast.Global, ast.Nonlocal)):
+            declared.update(child.names)
+        elif isinstance(child, ast.Name) and isinstance(child.ctx, ast.Store):
+            stored.setdefault(child.id, child)
+    loaded = {
+        child.id for child in ast.walk(node)
+        if isinstance(child, ast.Name) and not isinstance(child.ctx, ast.Store)
+    }
+    for name, child in stored.items():
+        if name not in loaded and name not in declared and not name.startswith("_"):
+            yield child, {"name": name}
+
+@rule("W0611", "unused-import", "warning", "Unused import {name}")
+def unused_import(node, context):
+    imported = {}
+    for child in ast.walk(node):
+        if isinstance(child, (ast.Import, ast.ImportFrom)):
+            for alias in child.names:
+                if alias.name != "*":
+                    imported.setdefault((alias.asname or alias.name).split(".")[0], child)
+    used = {child.id for child in ast.walk(node) if isinstance(child, ast.Name)}
+    used.update(
+        child.value.id for child in ast.walk(node)
+        if isinstance(child, ast.Attribute) and isinstance(child.value, ast.Name)
+    )
+    for name, child in imported.items():
+        if name not in used:
+            yield child, {"name": name}
+
+@rule("W0622", "redefined-builtin", "warning", "Redefining built-in '{name}'",
+      ast.Name, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.arg, ast.Import, ast.ImportFrom)
+def redefined_builtin(node, context):
+    for name, child in _assigned_names(node):
+        if name in BUILTIN_NAMES:
+            yield child, {"name": name}
+
+@rule("W0702", "bare-except", "warning", "No exception type(s) specified", ast.ExceptHandler)
+def bare_except(node, context):
+    if node.type is None:
+        yield node, {}
+
+@rule("W0603", "global-statement", "warning", "Using the global statement", ast.Global)
+def global_statement(node, context):
+    yield node, {}
+
+@rule("C0114", "missing-module-docstring", "convention", "Missing module docstring")
+def missing_module_docstring(node, context):
+    if node.body and ast.get_docstring(node) is None:
+        yield node, {}
+
+@rule("C0116", "missing-function-docstring", "convention", "Missing function or method docstring",
+      *FUNCTION_TYPES)
+def missing_function_docstring(node, context):
+    if not node.name.startswith("_") and ast.get_docstring(node) is None:
+        yield node, {}
+
+@rule("C0115", "missing-class-docstring", "convention", "Missing class docstring", ast.ClassDef)
+def missing_class_docstring(node, context):
+    if ast.get_docstring(node) is None:
+        yield node, {}
+
+@rule("W0104", "pointless-statement", "warning", "Statement seems to have no effect", ast.Expr)
+def pointless_statement(node, context):
+    if isinstance(node.value, (ast.Name, ast.Compare, ast.BinOp, ast.Attribute, ast.Subscript)):
+        yield node, {}
+
+@rule("W0102", "dangerous-default-value", "warning", "Dangerous default value {value} as argument",
+      ast.arguments)
+def dangerous_default_value(node, context):
+    for default in node.defaults + [d for d in node.kw_defaults if d is not None]:
+        if isinstance(default, (ast.List, ast.Dict, ast.Set)):
+            yield default, {"value": type(default).__name__.lower()}
+
+@rule("R1705", "no-else-return", "refactor", "Unnecessary \"else\" after \"return\"", ast.If)
+def no_else_return(node, context):
+    if node.orelse and node.body and isinstance(node.body[-1], ast.Return):
+        yield node, {}
+
+
+DEFAULT_RULES = [
+    unused_variable,
+    unused_import,
+    redefined_builtin,
+    bare_except,
+    global_statement,
+    missing_module_docstring,
+    missing_function_docstring,
+    missing_class_docstring,
+    pointless_statement,
+    dangerous_default_value,
+    no_else_return,
+]
+
+
+class AstLinter(object):
+    """
+    Lint backend that checks files with *rules*, a list of :class:`Rule`
+    objects (:data:`DEFAULT_RULES` by default). Rules can be added with
+    :meth:`register`. Syntax errors are reported as syntax-error and files that
+    can't be read as fatal.
+    """
+
+    def __init__(self, rules=None):
+        self.rules = list(DEFAULT_RULES if rules is None else rules)
+
+    def register(self, new_rule):
+        self.rules.append(new_rule)
+        return new_rule
+
+    def lint(self, path):
+        """
+        lint(path) -> (stats, messages)
+
+        Checks the file at *path* and returns a :class:`LintStats` object and a
+        list of :class:`LintMessage` objects sorted by line.
+        """
+
+        module = os.path.splitext(os.path.basename(path))[0]
+
+        def message(lint_rule, node, format_args):
+            return LintMessage(
+                lint_rule.msg_id, lint_rule.symbol, lint_rule.category,
+                lint_rule.text.format(**format_args), path, module,
+                getattr(node, "lineno", 1), getattr(node, "col_offset", 0)
+            )
+
+        try:
+            with open(path, encoding="utf-8") as source_file:
+                source = source_file.read()
+        except (OSError, UnicodeDecodeError) as e:
+            messages = [LintMessage("F0001", "fatal", "fatal", str(e), path, module, 0)]
+            return LintStats(messages, 0), messages
+
+        try:
+            tree = ast.parse(source, path)
+        except SyntaxError as e:
+            messages = [LintMessage(
+                "E0001", "syntax-error", "error", "Parsing failed: '{}'".format(e.msg),
+                path, module, e.lineno or 0, e.offset or 0
+            )]
+            return LintStats(messages, 0), messages
+
+        context = LintContext(tree, source)
+        by_type = {}
+        for lint_rule in self.rules:
+            for node_type in lint_rule.node_types:
+                by_type.setdefault(node_type, []).append(lint_rule)
+
+        messages = []
+        statement = 0
+        for node in ast.walk(tree):
+            if isinstance(node, ast.stmt):
+                statement += 1
+            for lint_rule in by_type.get(type(node), ()):
+                for found, format_args in lint_rule.check(node, context):
+                    messages.append(message(lint_rule, found, format_args))
+
+        messages.sort(key=lambda msg: (msg.line, msg.column))
+        return LintStats(messages, statement), messages
@@ -0,0 +1,149 @@
+"""
+Running tests that only need the source file, i.e. :func:`~pysenpai.checking.lint.pylint_test`
+and :func:`~pysenpai.checking.static.static_test`, in a separate process while
+the checker continues with its functional tests. A background test is started
+with :func:`start_pylint_test` or :func:`start_static_test` as soon as the module
+path is known, and its messages are added to the evaluation report when
+:meth:`BackgroundTest.join` is called. Call join where the test would have been
+called normally to keep the report in the same order::
+
+    lint = start_pylint_test(files[0], lang)
+    st_module = load_module(files[0], lang)
+    test_function(st_module, ...)
+    lint_score = lint.join()
+
+Arguments given to the tests, such as static validators, must be picklable,
+which in practice means module level functions.
+"""
+
+import importlib.util
+import os
+import sys
+import types
+from concurrent.futures import ProcessPoolExecutor
+
+from pysenpai.messages import load_messages, Codes
+from pysenpai.output import json_output, output
+
+BACKGROUND_WORKERS = 2
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=BACKGROUND_WORKERS)
+    return _executor
+
+def _child_module(module_path, execute):
+    name = os.path.splitext(os.path.basename(module_path))[0]
+    if not execute:
+        return types.SimpleNamespace(__file__=os.path.abspath(module_path), __name__=name)
+
+    from pysenpai.utils.internal import InputProvider, StringOutput
+
+    spec = importlib.util.spec_from_file_location(name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    save = sys.stdout
+    sys.stdout = StringOutput()
+    sys.stdin = InputProvider([])
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        sys.stdout = save
+    return module
+
+def _run_in_child(test_func, module_path, execute, args, kwargs):
+    # a forked worker starts with a copy of the checker's report and its
+    # settings, messages are returned whole and fitted into the budget by the
+    # checker when they are added to its report
+    json_output["tests"] = []
+    json_output.set_deduplication(False)
+    json_output.set_size_budget(None)
+    st_module = _child_module(module_path, execute)
+    result = test_func(st_module, *args, **kwargs)
+    return result, json_output["tests"]
+
+
+class BackgroundTest(object):
+    """
+    Handle for a test running in a background process. *category*, *title_key*
+    (formatted with *title_args*) and *lang* are used for reporting the test's
+    failure if the process itself fails.
+    """
+
+    def __init__(self, future, category, title_key, lang, title_args=None):
+        self.future = future
+        self.category = category
+        self.title_key = title_key
+        self.title_args = title_args or {}
+        self.lang = lang
+
+    def done(self):
+        return self.future.done()
+
+    def join(self):
+        """
+        Waits for the test to finish, adds its messages to the end of the
+        evaluation report and returns the test function's return value.
+        """
+
+        try:
+            result, tests = self.future.result()
+        except Exception as e:
+            msgs = load_messages(self.lang, self.category)
+            json_output.new_test(
+                msgs.get_msg(self.title_key, self.lang)["content"].format(**self.title_args)
+            )
+            json_output.new_run()
+            output(msgs.get_msg("GenericErrorMsg", self.lang), Codes.ERROR,
+                ename=e.__class__.__name__,
+                emsg=str(e),
+                fname=""
+            )
+            return None
+
+        for test in tests:
+            json_output.new_test(test["title"])
+            for run in test["runs"]:
+                json_output.new_run()
+                for msg in run["output"]:
+                    json_output.new_msg(msg["msg"], msg["flag"], msg["triggers"], msg["hints"])
+        return result
+
+
+def start_pylint_test(module_path, lang="en", **options):
+    """
+    start_pylint_test(module_path[, lang="en"][, kwarg1][, ...]) -> BackgroundTest
+
+    Starts :func:`~pysenpai.checking.lint.pylint_test` for the file at
+    *module_path* in a background process. Keyword arguments are passed to
+    pylint_test. The student code is not executed.
+    """
+
+    from pysenpai.checking.lint import pylint_test
+
+    future = _get_executor().submit(
+        _run_in_child, pylint_test, module_path, False, (), dict(options, lang=lang)
+    )
+    return BackgroundTest(future, "lint", "LintTest", lang)
+
+def start_static_test(module_path, func_names, lang, validators, **options):
+    """
+    start_static_test(module_path, func_names, lang, validators[, kwarg1][, ...]) -> BackgroundTest
+
+    Starts :func:`~pysenpai.checking.static.static_test` for the file at
+    *module_path* in a background process. Keyword arguments are passed to
+    static_test. The module is imported in the background process to get the
+    source code of its functions, with empty standard input.
+    """
+
+    from pysenpai.checking.static import static_test
+
+    future = _get_executor().submit(
+        _run_in_child, static_test, module_path, True, (func_names, lang, validators), options
+    )
+    return BackgroundTest(
+        future, "static", "StaticTest", lang, {"fname": func_names.get(lang, "")}
+    )
@@ -0,0 +1,261 @@
+"""
+Interactive dialogue tests. A dialogue is a list of steps, each of which waits
+for the student program to show a prompt and then sends it an input line. The
+program is run as __main__ in a child interpreter so that the prompts can be
+checked as they appear, and a program that stops responding only fails the
+step it's stuck on. Dialogues are run concurrently with asyncio subprocesses
+and their results are reported in the order they were given.
+"""
+
+import asyncio
+import codecs
+import os
+import re
+import sys
+
+import pysenpai.callbacks.defaults as defaults
+from pysenpai.messages import load_messages, Codes
+from pysenpai.output import json_output, output
+from pysenpai.checking.isolated import DEFAULT_CONCURRENCY, ProgramRun
+from pysenpai.checking.testcase import TestRun
+from pysenpai.tracing import emit, TEST_START, TEST_END, CASE_START, CASE_END, VALIDATION
+
+DEFAULT_STEP_TIMEOUT = 2
+
+
+class DialogueStep(object):
+    """
+    One step of a dialogue. The step waits until the program's output contains
+    *prompt*, which is either a string or a compiled regular expression, and
+    then sends *response* as an input line. If *response* is None, nothing is
+    sent, which is useful for checking output that is not followed by input.
+    *timeout* is the number of seconds the program is given to show the prompt.
+
+    Output is matched from where the previous step's prompt ended, so each
+    prompt must come after the previous one.
+    """
+
+    def __init__(self, prompt, response=None, timeout=DEFAULT_STEP_TIMEOUT):
+        if isinstance(prompt, str):
+            self.pattern = re.compile(re.escape(prompt))
+        else:
+            self.pattern = prompt
+        self.prompt = prompt
+        self.response = response
+        self.timeout = timeout
+
+
+class Dialogue(object):
+    """
+    A dialogue test case made of :class:`DialogueStep` objects. After the last
+    step, standard input is closed and the program is given *end_timeout*
+    seconds to end.
+
+    After the dialogue has been run, *correct* tells whether it went through,
+    *transcript* contains the program's output with the sent inputs inserted
+    after their prompts, and *latencies* contains the time in seconds each
+    prompt took to appear. For failed dialogues, *reason* is the message key
+    of the problem, *step* the index of the step that failed (if any) and
+    *run* a :class:`~pysenpai.checking.isolated.ProgramRun` with the program's
+    exit information. *weight* and *tag* are used like in other test cases.
+    """
+
+    def __init__(self, steps, weight=1, tag="", end_timeout=DEFAULT_STEP_TIMEOUT):
+        self.steps = steps
+        self.weight = weight
+        self.tag = tag
+        self.end_timeout = end_timeout
+        self.correct = False
+        self.transcript = ""
+        self.latencies = []
+        self.reason = None
+        self.step = None
+        self.run = None
+
+
+async def _read_until(process, decoder, text, pos, pattern, timeout):
+    # returns (text, match, reason) where reason is set if there's no match
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        match = pattern.search(text, pos)
+        if match:
+            return text, match, None
+        try:
+            chunk = await asyncio.wait_for(process.stdout.read(4096), deadline - loop.time())
+        except asyncio.TimeoutError:
+            return text, None, "PromptTimeout"
+        if not chunk:
+            return text + decoder.decode(b"", final=True), None, "PromptMissing"
+        text += decoder.decode(chunk).replace("\r\n", "\n")
+
+async def run_dialogue(path, dialogue):
+    """
+    Runs *dialogue* with the program at *path* and records the results into
+    the dialogue object.
+    """
+
+    loop = asyncio.get_running_loop()
+    env = dict(os.environ, PYTHONIOENCODING="utf-8")
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-u", os.path.abspath(path),
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=os.path.dirname(os.path.abspath(path)),
+        env=env
+    )
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    # all output read so far, prompts are searched for starting from pos and
+    # output up to echoed has been added to the transcript
+    text = ""
+    pos = 0
+    echoed = 0
+    transcript = []
+    sent = []
+
+    try:
+        for i, step in enumerate(dialogue.steps):
+            start = loop.time()
+            text, match, reason = await _read_until(
+                process, decoder, text, pos, step.pattern, step.timeout
+            )
+            if match is None:
+                dialogue.reason, dialogue.step = reason, i
+                break
+
+            dialogue.latencies.append(loop.time() - start)
+            pos = match.end()
+            if step.response is not None:
+                # inputs go into the transcript after everything shown so far
+                line = "{}\n".format(step.response)
+                transcript.append(text[echoed:])
+                transcript.append(line)
+                echoed = len(text)
+                sent.append(step.response)
+                process.stdin.write(line.encode("utf-8"))
+                await process.stdin.drain()
+        else:
+            process.stdin.close()
+            try:
+                rest = await asyncio.wait_for(process.stdout.read(), dialogue.end_timeout)
+                text += decoder.decode(rest, final=True).replace("\r\n", "\n")
+            except asyncio.TimeoutError:
+                dialogue.reason = "ProgramTimeout"
+    except (BrokenPipeError, ConnectionResetError):
+        # the program ended while input was being sent
+        dialogue.reason, dialogue.step = "PromptMissing", i
+
+    if dialogue.reason in (None, "PromptMissing"):
+        # output has ended, give the program time to exit
+        try:
+            await asyncio.wait_for(process.wait(), dialogue.end_timeout)
+        except asyncio.TimeoutError:
+            dialogue.reason = dialogue.reason or "ProgramTimeout"
+    killed = process.returncode is None
+    if killed:
+        process.kill()
+    stderr = await process.stderr.read()
+    await process.wait()
+    transcript.append(text[echoed:])
+    dialogue.transcript = "".join(transcript)
+
+    run = ProgramRun(
+        path, sent, dialogue.transcript, stderr.decode("utf-8", errors="replace"),
+        process.returncode, timed_out=killed
+    )
+    if dialogue.reason is None and run.ename:
+        dialogue.reason = run.ename
+    elif dialogue.reason == "PromptMissing" and run.ename:
+        # the program crashed instead of showing the prompt
+        dialogue.reason = run.ename
+    dialogue.run = run
+    dialogue.correct = dialogue.reason is None
+
+def run_dialogues(path, dialogues, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Runs all *dialogues* with the program at *path*, at most *concurrency* at
+    a time.
+    """
+
+    async def run_all():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited(dialogue):
+            async with semaphore:
+                await run_dialogue(path, dialogue)
+
+        await asyncio.gather(*[limited(dialogue) for dialogue in dialogues])
+
+    asyncio.run(run_all())
+
+
+def test_dialogues(st_module, dialogues, lang="en",
+                   custom_msgs={},
+                   concurrency=DEFAULT_CONCURRENCY,
+                   grader=defaults.pass_fail_grader,
+                   prompt_presenter=defaults.default_value_presenter):
+    """
+    test_dialogues(st_module, dialogues[, lang="en"][, kwarg1][, ...]) -> score
+
+    Tests an interactive student program with a list of :class:`Dialogue`
+    objects. The program file of *st_module* is run once per dialogue as
+    __main__ in a child interpreter, with at most *concurrency* dialogues
+    running at the same time. Each dialogue is reported as a test run:
+
+    * If the dialogue went through and the program ended normally, the
+      CorrectResult message is shown.
+    * If a prompt didn't appear in time, or the program ended before showing it,
+      the PromptTimeout or PromptMissing message is shown with the step's number,
+      timeout and prompt (shown using *prompt_presenter*).
+    * If the program ended with an exception, the message corresponding to the
+      exception is shown, along with the line that caused it.
+    * If the program didn't end after the dialogue, ProgramTimeout is shown.
+
+    The transcript of the dialogue is always shown as debug information. The
+    dialogues are graded with *grader* (see :class:`~pysenpai.checking.testcase.TestRun`),
+    and the score is returned.
+    """
+
+    msgs = load_messages(lang, "dialogue")
+    msgs.update(custom_msgs)
+
+    json_output.new_test(
+        msgs.get_msg("TargetName", lang)["content"].format(name=st_module.__name__)
+    )
+    emit(TEST_START, test="dialogue", target=st_module.__name__)
+
+    dialogues = list(dialogues)
+    run_dialogues(st_module.__file__, dialogues, concurrency)
+
+    test_run = TestRun(dialogues, grader)
+    for i, dialogue in enumerate(test_run):
+        json_output.new_run()
+        emit(CASE_START, index=i, tag=dialogue.tag)
+        emit(VALIDATION, correct=dialogue.correct, reason=dialogue.reason)
+        if dialogue.correct:
+            output(msgs.get_msg("CorrectResult", lang), Codes.CORRECT)
+        elif dialogue.reason in ("PromptTimeout", "PromptMissing"):
+            step = dialogue.steps[dialogue.step]
+            output(msgs.get_msg(dialogue.reason, lang), Codes.INCORRECT,
+                step=dialogue.step + 1,
+                timeout=step.timeout,
+                prompt=prompt_presenter(step.prompt)
+            )
+        elif dialogue.reason == "ProgramTimeout":
+            output(msgs.get_msg("ProgramTimeout", lang), Codes.INCORRECT,
+                timeout=dialogue.end_timeout
+            )
+        else:
+            output(msgs.get_msg(dialogue.reason, lang, default="GenericErrorMsg"), Codes.ERROR,
+                ename=dialogue.run.ename,
+                emsg=dialogue.run.emsg
+            )
+            output(msgs.get_msg("PrintExcLine", lang), Codes.DEBUG,
+                lineno=dialogue.run.lineno, line=dialogue.run.line
+            )
+        output(msgs.get_msg("PrintTranscript", lang), Codes.DEBUG, transcript=dialogue.transcript)
+        emit(CASE_END, index=i, correct=dialogue.correct)
+
+    emit(TEST_END, test="dialogue", target=st_module.__name__)
+    return test_run.grade()
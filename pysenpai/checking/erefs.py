@@ -0,0 +1,130 @@
+import hashlib
+import pickle
+
+import pysenpai.callbacks.defaults as defaults
+import pysenpai.callbacks.convenience as convenience
+
+# Validators that compare with plain equality after normalization, mapped to
+# the student value they compare against the reference (result or parsed)
+EXACT_VALIDATORS = {
+    defaults.result_validator: "res",
+    convenience.parsed_result_validator: "parsed",
+}
+
+
+def _normalize(value):
+    # same normalization that the exact validators do before comparing
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
+def _is_hashable(value):
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+def _function_id(func):
+    code = getattr(func, "__code__", None)
+    return "{}.{}:{}".format(
+        getattr(func, "__module__", ""),
+        getattr(func, "__qualname__", getattr(func, "__name__", repr(func))),
+        hashlib.sha256(code.co_code).hexdigest() if code is not None else ""
+    )
+
+
+class ErefTable(object):
+    """
+    Table of false reference results for the legacy test functions. Results of
+    the *error_refs* functions are computed at most once per test vector and
+    can be shared across checker runs by giving a dictionary-like *cache* (e.g.
+    a :mod:`shelve` object) that maps test vector keys to results. Keys are
+    digests of the pickled test vector, the tested *target* and the false
+    reference functions (names and code), so one cache can be shared by
+    several tests and results are recomputed when the functions change.
+
+    When the *validator* is one of the exact validators, matching false
+    references are looked up by hashing the student result instead of calling
+    the validator for each of them. Other validators are called normally.
+    """
+
+    def __init__(self, error_refs, validator, cache=None, target=""):
+        self.error_refs = error_refs
+        self.validator = validator
+        self.cache = {} if cache is None else cache
+        self.field = EXACT_VALIDATORS.get(validator)
+        self._indexes = {}
+        self._signature = "\n".join([target] + [_function_id(func) for func in error_refs])
+
+    def key(self, vector):
+        """
+        Returns the cache key of the test vector *vector*. Vectors that can't
+        be pickled are identified by their repr.
+        """
+
+        digest = hashlib.sha256(self._signature.encode("utf-8"))
+        try:
+            digest.update(pickle.dumps(vector, protocol=4))
+        except Exception:
+            digest.update(repr(vector).encode("utf-8", "replace"))
+        return digest.hexdigest()
+
+    def results(self, vector_key, call):
+        """
+        Returns the list of (function name, result) pairs for the test vector
+        identified by *vector_key*. If they have not been computed yet, *call*
+        is used to call each false reference function.
+        """
+
+        try:
+            return self.cache[vector_key]
+        except KeyError:
+            results = [(eref_func.__name__, call(eref_func)) for eref_func in self.error_refs]
+            self.cache[vector_key] = results
+            return results
+
+    def _index(self, vector_key, results):
+        try:
+            return self._indexes[vector_key]
+        except KeyError:
+            pass
+
+        index = {}
+        unhashable = []
+        for position, (name, result) in enumerate(results):
+            normalized = _normalize(result)
+            if _is_hashable(normalized):
+                index.setdefault(normalized, []).append(position)
+            else:
+                unhashable.append(position)
+        self._indexes[vector_key] = index, unhashable
+        return index, unhashable
+
+    def matches(self, vector, call, res, parsed):
+        """
+        Returns names of the false reference functions whose result matches the
+        student's result *res* / parsed output *parsed* for the test vector
+        *vector*, in the order the functions were given.
+        """
+
+        vector_key = self.key(vector)
+        results = self.results(vector_key, call)
+        student = _normalize(res if self.field == "res" else parsed)
+        if self.field is None or not _is_hashable(student):
+            candidates = range(len(results))
+        else:
+            index, unhashable = self._index(vector_key, results)
+            candidates = sorted(index.get(student, []) + unhashable)
+
+        names = []
+        for position in candidates:
+            name, result = results[position]
+            try:
+                self.validator(result, res, parsed)
+                names.append(name)
+            except AssertionError:
+                pass
+        return names
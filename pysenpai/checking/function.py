@@ -7,8 +7,12 @@ from pysenpai.exceptions import NoAdditionalInfo
 from pysenpai.output import json_output
 from pysenpai.messages import load_messages, Codes
 from pysenpai.output import output
-from pysenpai.utils.internal import StringOutput, get_exception_line
+from pysenpai.utils.internal import LazyPresentation, InputProvider, ModuleSnapshot, StringOutput, get_exception_line
+from pysenpai.utils.vfs import virtual_fs
+from pysenpai.tracing import emit, TEST_START, TEST_END, CASE_START, CASE_END, CALL_START, CALL_END, OUTPUT_CAPTURED, VALIDATION
 from pysenpai.checking import TestCase
+from pysenpai.checking.testcase import TestRun
+from pysenpai.checking.erefs import ErefTable
 
 class FunctionTestCase(TestCase):
     
@@ -45,7 +49,12 @@ def test_function(st_module, func_names, test_cases, ref_func,
                   result_object_extractor=None,
                   argument_cloner=defaults.default_argument_cloner,
                   repeat=1,
-                  new_test=defaults.default_new_test): 
+                  new_test=defaults.default_new_test,
+                  debug_on_fail_only=False,
+                  restore_state=False,
+                  eref_cache=None,
+                  files=None,
+                  fail_fast=0): 
     """
     test_function(st_module, func_names, test_cases, ref_func[, lang="en"][, kwarg1][, ...])
     
@@ -68,7 +77,7 @@ def test_function(st_module, func_names, test_cases, ref_func,
       to the default function test messages
     * *inputs* - input vectors to be given to the function; must have as many vectors 
       as test_cases. Inputs are automatically joined by newlines and made into a 
-      StringIO object that replaces standard input. Necessary when testing functions 
+      :class:`~pysenpai.utils.internal.InputProvider` that replaces standard input. Necessary when testing functions 
       that accept user input.
     * *hide_output* - a flag to show/hide student function prints in the test 
       output. By default student output is hidden. 
@@ -127,6 +136,26 @@ def test_function(st_module, func_names, test_cases, ref_func,
     * *new_test* - a function that is called at the start of each test case. Can be
       used to reset the state of persistent objects within the checker. Receives 
       arguments and inputs when called.
+    * *debug_on_fail_only* - if set to True, the test vector and student result are
+      only shown for cases that fail. Default is False. Presenters are only called
+      for values that are actually shown, so this also saves the cost of rendering
+      large values for passing cases.
+    * *restore_state* - if set to True, the state of the student module is recorded
+      before the first test case and restored at the start of each case, so that 
+      changes the student function makes to module globals don't carry over to
+      later cases. See :class:`~pysenpai.utils.internal.ModuleSnapshot`.
+    * *eref_cache* - a dictionary-like object (e.g. from :mod:`shelve`) for storing
+      false reference results across checker runs, keyed by test vector, function
+      name and false reference functions. See 
+      :class:`~pysenpai.checking.erefs.ErefTable`.
+    * *files* - a dictionary of fixture files that the student function sees 
+      through an in-memory file system during each call. A test case can have
+      its own fixtures in its files attribute. Files written by the student 
+      function are available in :data:`pysenpai.utils.vfs.virtual_fs` while the
+      case is validated. See :mod:`~pysenpai.utils.vfs`.
+    * *fail_fast* - if set to a positive number, testing stops after that many 
+      failed cases. The case that stops the test is not given additional tests 
+      (false references, custom tests, recurrence test and information functions).
     
     Test progression is divided into two steps: one-time preparations and actual 
     test cases. One-time preparations proceed as follows.
@@ -144,14 +173,16 @@ def test_function(st_module, func_names, test_cases, ref_func,
        
     The number of test cases is determined from the length of the test vector. Even if 
     the tested function takes no arguments, your test vector must contain an empty list
-    for each test case! 
+    for each test case! The test cases can also be given as a generator (or a 
+    function that returns one), in which case each case is created only when the 
+    previous one is done. 
     
     Each test case is processed as follows. During the test, sys.stdout is restored
     whenever a message is shown to the student.
     
     #. new_test callback is called
     #. Stored output is cleared and output is redirected to the StringOutput object
-    #. If there are inputs, a StringIO object is formed to replace sys.stdin
+    #. If there are inputs, an InputProvider object is formed to replace sys.stdin
     #. A copy of arguments is made using argument_cloner
     #. The student function is called
     
@@ -216,6 +247,10 @@ def test_function(st_module, func_names, test_cases, ref_func,
     json_output.new_test(
         msgs.get_msg("FunctionName", lang)["content"].format(name=func_names[lang])
     )
+    emit(TEST_START, test="function", target=func_names[lang])
+    
+    eref_table = ErefTable(error_refs, validator, eref_cache, "function:" + func_names[lang])
+    snapshot = ModuleSnapshot(st_module) if restore_state else None
     
     # Redirect output to string-like object
     o = StringOutput()
@@ -228,31 +263,46 @@ def test_function(st_module, func_names, test_cases, ref_func,
     if parent_object is None:
         parent_object = st_module
     
-    for i, test in enumerate(test_cases):
+    # a case has failed if its result or its output was incorrect
+    output_failed = False
+    test_run = TestRun(test_cases, fail_fast=fail_fast,
+        failed=lambda test: not test.correct or output_failed
+    )
+    
+    for i, test in enumerate(test_run):
         json_output.new_run()
+        emit(CASE_START, index=i)
+        output_failed = False
 
         # Test preparations
         sys.stdout = o
         o.clear()
 
+        if snapshot is not None:
+            snapshot.restore()
         new_test(argument_cloner(test.args), test.inputs)
 
         try:
             inps = test.inputs[i]
-            sys.stdin = io.StringIO("\n".join([str(x) for x in inps]))
+            sys.stdin = InputProvider(inps)
         except IndexError:
             inps = []
 
         stored_args = argument_cloner(test.args)
 
         # Calling the student function
+        emit(CALL_START, target=func_names[lang])
         try:
             st_func = getattr(parent_object, func_names[lang])
             if inspect.isfunction(st_func) or inspect.ismethod(st_func) or inspect.isclass(st_func):
-                res = test.wrap(st_func)
+                with virtual_fs.activated(getattr(test, "files", None) or files):
+                    res = test.wrap(st_func)
             else:
                 sys.stdout = save
+                emit(CALL_END, target=func_names[lang], error="IsNotFunction")
                 output(msgs.get_msg("IsNotFunction", lang), Codes.ERROR, name=func_names[lang])
+                emit(CASE_END, index=i, correct=False)
+                emit(TEST_END, test="function", target=func_names[lang])
                 return
         except Exception as e:
             if validate_exception:
@@ -262,29 +312,34 @@ def test_function(st_module, func_names, test_cases, ref_func,
                 etype, evalue, etrace = sys.exc_info()
                 ename = evalue.__class__.__name__
                 emsg = str(evalue)
+                emit(CALL_END, target=func_names[lang], error=ename)
                 elineno, eline = get_exception_line(st_module, etrace)
-                output(msgs.get_msg(ename, lang, default="GenericErrorMsg"), Codes.ERROR,
-                    args=arg_presenter(stored_args),
-                    inputs=input_presenter(inps),
+                format_args = dict(getattr(evalue, "format_args", {}),
+                    args=LazyPresentation(arg_presenter, stored_args),
+                    inputs=LazyPresentation(input_presenter, inps),
                     emsg=emsg,
                     ename=ename
                 )
+                output(msgs.get_msg(ename, lang, default="GenericErrorMsg"), Codes.ERROR, **format_args)
                 output(msgs.get_msg("PrintExcLine", lang), Codes.DEBUG,
                     lineno=elineno, line=eline
                 )
                 output(msgs.get_msg("PrintTestVector", lang), Codes.DEBUG,
-                    args=arg_presenter(stored_args),
-                    call=call_presenter(func_names[lang], stored_args)
+                    args=LazyPresentation(arg_presenter, stored_args),
+                    call=LazyPresentation(call_presenter, func_names[lang], stored_args)
                 )
                 if inputs:
                     output(msgs.get_msg("PrintInputVector", lang), Codes.DEBUG,
-                        inputs=input_presenter(inps)
+                        inputs=LazyPresentation(input_presenter, inps)
                     )
 
+                emit(CASE_END, index=i, correct=False)
                 continue
             
         # Validating function results
         sys.stdout = save
+        emit(CALL_END, target=func_names[lang])
+        emit(OUTPUT_CAPTURED, length=len(o.content))
         values_printed = False
         if not hide_output:
             output(msgs.get_msg("PrintStudentOutput", lang), Codes.INFO, output=o.content)
@@ -293,101 +348,103 @@ def test_function(st_module, func_names, test_cases, ref_func,
             st_out = test.parse(o.content)
         except OutputParseError as e:
             output(msgs.get_msg("OutputParseError", lang), Codes.INCORRECT,
-                args=arg_presenter(stored_args),
-                inputs=input_presenter(inps),
+                args=LazyPresentation(arg_presenter, stored_args),
+                inputs=LazyPresentation(input_presenter, inps),
                 output=o.content,
                 reason=str(e)
             )
             output(msgs.get_msg("PrintTestVector", lang), Codes.DEBUG, 
-                args=arg_presenter(stored_args), 
-                call=call_presenter(func_names[lang], stored_args)
+                args=LazyPresentation(arg_presenter, stored_args), 
+                call=LazyPresentation(call_presenter, func_names[lang], stored_args)
             )
             if inputs:
                 output(
                     msgs.get_msg("PrintInputVector", lang),
                     Codes.DEBUG,
-                    inputs=input_presenter(inps)
+                    inputs=LazyPresentation(input_presenter, inps)
                 )
             output(msgs.get_msg("OutputPatternInfo", lang), Codes.INFO)
             output(msgs.get_msg("PrintStudentOutput", lang), Codes.INFO, output=o.content)
+            emit(CASE_END, index=i, correct=False)
             continue
             
         # Validate results
         try: 
             test.validate(res, st_out, o.content)
+            emit(VALIDATION, correct=True)
             output(msgs.get_msg("CorrectResult", lang), Codes.CORRECT)
         except AssertionError as e:
             # Result was incorrect
-            output(msgs.get_msg(e, lang, "IncorrectResult"), Codes.INCORRECT)
+            emit(VALIDATION, correct=False, reason=str(e))
+            output(msgs.get_msg(e, lang, "IncorrectResult"), Codes.INCORRECT, **getattr(e, "format_args", {}))
             output(msgs.get_msg("PrintTestVector", lang), Codes.DEBUG,
-                args=arg_presenter(stored_args),
-                call=call_presenter(func_names[lang], stored_args)
+                args=LazyPresentation(arg_presenter, stored_args),
+                call=LazyPresentation(call_presenter, func_names[lang], stored_args)
             )
             if inputs:
                 output(msgs.get_msg("PrintInputVector", lang), Codes.DEBUG, 
-                    inputs=input_presenter(inps)
+                    inputs=LazyPresentation(input_presenter, inps)
                 )
             output(msgs.get_msg("PrintStudentResult", lang), Codes.DEBUG, 
-                res=res_presenter(res),
-                parsed=parsed_presenter(st_out),
+                res=LazyPresentation(res_presenter, res),
+                parsed=LazyPresentation(parsed_presenter, st_out),
                 output=o.content
             )
-            output(msgs.get_msg("PrintReference", lang), Codes.DEBUG, ref=ref_presenter(test.ref_result))
+            output(msgs.get_msg("PrintReference", lang), Codes.DEBUG, ref=LazyPresentation(ref_presenter, test.ref_result))
             values_printed = True
-            if error_refs or custom_tests or test_recurrence:
-                output(msgs.get_msg("AdditionalTests", lang), Codes.INFO)
-                
-            # Run false references
-            for eref_func in error_refs:
+            # testing stops after this case, so additional tests are skipped
+            if not test_run.final_failure:
+                if error_refs or custom_tests or test_recurrence:
+                    output(msgs.get_msg("AdditionalTests", lang), Codes.INFO)
+            
+                # Run false references
                 if ref_needs_inputs:
-                    eref = eref_func(argument_cloner(stored_args), inps)
+                    call_eref = lambda eref_func: eref_func(argument_cloner(stored_args), inps)
                 else:
-                    eref = eref_func(*argument_cloner(stored_args))
-                try: 
-                    validator(eref, res, st_out)
-                    output(msgs.get_msg(eref_func.__name__, lang), Codes.INFO)
-                except AssertionError as e:
-                    pass
+                    call_eref = lambda eref_func: eref_func(*argument_cloner(stored_args))
+                for eref_name in eref_table.matches((stored_args, inps), call_eref, res, st_out):
+                    output(msgs.get_msg(eref_name, lang), Codes.INFO)
                     
-            # Run custom tests
-            for custom_test in custom_tests:
-                try: 
-                    custom_test(res, st_out, o.content, ref, stored_args, inps)
-                except AssertionError as e:
-                    output(msgs.get_msg(e, lang, custom_test.__name__), Codes.INFO)
+                # Run custom tests
+                for custom_test in custom_tests:
+                    try: 
+                        custom_test(res, st_out, o.content, ref, stored_args, inps)
+                    except AssertionError as e:
+                        output(msgs.get_msg(e, lang, custom_test.__name__), Codes.INFO)
             
-            # Result recurrence test
-            if test_recurrence and (res == prev_res or st_out and st_out == prev_out):
-                output(msgs.get_msg("RepeatingResult", lang), Codes.INFO)
+                # Result recurrence test
+                if test_recurrence and (res == prev_res or st_out and st_out == prev_out):
+                    output(msgs.get_msg("RepeatingResult", lang), Codes.INFO)
             
-            # Run info functions
-            if info_funcs:
-                output(msgs.get_msg("AdditionalInfo", lang), Codes.INFO)
-                for info_func in info_funcs:
-                    try:
-                        output(msgs.get_msg(info_func.__name__, lang), Codes.INFO,
-                            func_res=info_func(res, st_out, o.content, test.ref_result, stored_args, inps)
-                        )
-                    except NoAdditionalInfo:
-                        pass
+                # Run info functions
+                if info_funcs:
+                    output(msgs.get_msg("AdditionalInfo", lang), Codes.INFO)
+                    for info_func in info_funcs:
+                        try:
+                            output(msgs.get_msg(info_func.__name__, lang), Codes.INFO,
+                                func_res=info_func(res, st_out, o.content, test.ref_result, stored_args, inps)
+                            )
+                        except NoAdditionalInfo:
+                            pass
         else:
             # Result was correct
-            output(msgs.get_msg("PrintTestVector", lang), Codes.DEBUG,
-                args=arg_presenter(stored_args),
-                call=call_presenter(func_names[lang], stored_args)
-            )
-            if inputs:
-                output(msgs.get_msg("PrintInputVector", lang), Codes.DEBUG,
-                    inputs=input_presenter(inps)
+            if not debug_on_fail_only:
+                output(msgs.get_msg("PrintTestVector", lang), Codes.DEBUG,
+                    args=LazyPresentation(arg_presenter, stored_args),
+                    call=LazyPresentation(call_presenter, func_names[lang], stored_args)
                 )
-            output(
-                msgs.get_msg("PrintStudentResult", lang),
-                Codes.DEBUG,
-                res=res_presenter(res),
-                parsed=parsed_presenter(st_out),
-                utput=o.content
-            )
-            values_printed = True
+                if inputs:
+                    output(msgs.get_msg("PrintInputVector", lang), Codes.DEBUG,
+                        inputs=LazyPresentation(input_presenter, inps)
+                    )
+                output(
+                    msgs.get_msg("PrintStudentResult", lang),
+                    Codes.DEBUG,
+                    res=LazyPresentation(res_presenter, res),
+                    parsed=LazyPresentation(parsed_presenter, st_out),
+                    utput=o.content
+                )
+                values_printed = True
                 
         # Validate student output    
         if message_validator:
@@ -395,19 +452,28 @@ def test_function(st_module, func_names, test_cases, ref_func,
                 message_validator(o.content, stored_args, inps)
                 output(msgs.get_msg("CorrectMessage", lang), Codes.CORRECT)
             except AssertionError as e:                
+                output_failed = True
                 output(msgs.get_msg(e, lang, "IncorrectMessage"), Codes.INCORRECT)
                 output(msgs.get_msg("MessageInfo", lang), INFO)
                 output(msgs.get_msg("PrintStudentOutput", lang), Codes.INFO, output=o.content)
                 if not values_printed:
                     output(msgs.get_msg("PrintTestVector", lang), Codes.DEBUG,
-                        args=arg_presenter(stored_args),
-                        inputs=input_presenter(inps),
-                        call=call_presenter(func_names[lang], stored_args)
+                        args=LazyPresentation(arg_presenter, stored_args),
+                        inputs=LazyPresentation(input_presenter, inps),
+                        call=LazyPresentation(call_presenter, func_names[lang], stored_args)
                     )
                     if inputs:
                         output(msgs.get_msg("PrintInputVector", lang), Codes.DEBUG,
-                            inputs=input_presenter(inps)
+                            inputs=LazyPresentation(input_presenter, inps)
                         )
         
+        emit(CASE_END, index=i, correct=test.correct and not output_failed)
         prev_res = res
         prev_out = st_out
+    
+    if test_run.stopped:
+        output(msgs.get_msg("FailFastStop", lang), Codes.INFO, failed=test_run.failed)
+    
+    if snapshot is not None:
+        snapshot.restore()
+    emit(TEST_END, test="function", target=func_names[lang])
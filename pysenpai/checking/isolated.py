@@ -0,0 +1,175 @@
+"""
+Helpers for running student programs in child interpreters instead of the
+checker's own. A program that crashes, calls sys.exit or hangs can only end
+its own run, and several input vectors can be run at the same time. The
+programs are run with asyncio subprocesses, and the number of programs running
+at once is limited by *concurrency*.
+
+The child interpreter runs the program the same way as the checker's own
+test functions: under its module name rather than as __main__, with an
+:class:`~pysenpai.utils.internal.InputProvider` as standard input, and with
+sys.exit reported as a SystemExit error.
+"""
+
+import asyncio
+import json
+import linecache
+import os
+import re
+import sys
+
+import pysenpai
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_TIMEOUT = 10
+
+TB_FILE_PAT = re.compile(r'  File "(?P<file>.+)", line (?P<lineno>\d+)')
+
+# the last line of a child's stderr that carries the exception's format_args
+FORMAT_ARGS_MARK = "[pysenpai format_args] "
+
+# Runs the program given as the first argument as a module named by the second
+# argument. Standard input is a JSON list of inputs for an InputProvider.
+CHILD_RUNNER = """
+import importlib.util, json, sys, traceback
+from pysenpai.utils.internal import InputProvider
+path, name = sys.argv[1:3]
+sys.argv = [path]
+sys.stdin = InputProvider(json.loads(sys.stdin.read()))
+spec = importlib.util.spec_from_file_location(name, path)
+module = importlib.util.module_from_spec(spec)
+sys.modules[name] = module
+try:
+    spec.loader.exec_module(module)
+except BaseException as e:
+    sys.stdout.flush()
+    traceback.print_exc()
+    try:
+        sys.stderr.write({mark!r} + json.dumps(getattr(e, "format_args", {{}})) + "\\n")
+    except (TypeError, ValueError):
+        pass
+    sys.exit(1)
+""".format(mark=FORMAT_ARGS_MARK)
+
+
+class ProgramRun(object):
+    """
+    The result of running a program once. *output* and *stderr* are the
+    decoded output streams. If the program ended with an uncaught exception,
+    *ename* and *emsg* are read from the traceback, and *lineno* and *line*
+    point to the last line of the program file that was involved. The
+    exception's *format_args* are available if the child reported them. A
+    program that exits with a non-zero status without a traceback is reported
+    as SystemExit, and a program that was killed after the timeout as
+    ProgramTimeout.
+    """
+
+    def __init__(self, path, inputs, output, stderr, returncode, timed_out=False):
+        self.inputs = inputs
+        self.output = output
+        self.format_args = {}
+        lines = stderr.rstrip("\n").split("\n")
+        if lines[-1].startswith(FORMAT_ARGS_MARK):
+            self.format_args = json.loads(lines.pop()[len(FORMAT_ARGS_MARK):])
+            stderr = "\n".join(lines) + "\n"
+        self.stderr = stderr
+        self.returncode = returncode
+        self.timed_out = timed_out
+        self.ename = None
+        self.emsg = ""
+        self.lineno = "?"
+        self.line = ""
+        if timed_out:
+            self.ename = "ProgramTimeout"
+        elif returncode:
+            self._parse_traceback(path)
+
+    def _parse_traceback(self, path):
+        lines = self.stderr.rstrip().splitlines()
+        last_frame = None
+        for i, tb_line in enumerate(lines):
+            match = TB_FILE_PAT.match(tb_line)
+            if match:
+                last_frame = i
+                if os.path.abspath(match.group("file")) == os.path.abspath(path):
+                    self.lineno = int(match.group("lineno"))
+
+        if last_frame is None:
+            self.ename = "SystemExit"
+            self.emsg = str(self.returncode)
+            return
+
+        # the exception is the first unindented line after the last frame
+        for i in range(last_frame + 1, len(lines)):
+            if lines[i] and not lines[i][0].isspace():
+                ename, sep, emsg = lines[i].partition(": ")
+                self.ename = ename.rsplit(".", 1)[-1]
+                self.emsg = "\n".join([emsg] + lines[i + 1:])
+                break
+        else:
+            self.ename = "SystemExit"
+            self.emsg = str(self.returncode)
+
+        if self.lineno != "?":
+            linecache.checkcache(path)
+            self.line = linecache.getline(path, self.lineno).strip()
+
+
+def _decode(data):
+    return data.decode("utf-8", errors="replace").replace("\r\n", "\n")
+
+def _child_env():
+    # the child must be able to import pysenpai even if it's not installed
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(pysenpai.__file__)))
+    python_path = os.environ.get("PYTHONPATH")
+    return dict(os.environ,
+        PYTHONIOENCODING="utf-8",
+        PYTHONPATH=os.pathsep.join([package_root, python_path]) if python_path else package_root
+    )
+
+async def run_program(path, inputs, timeout=DEFAULT_TIMEOUT, name=None):
+    """
+    Runs the program at *path* in a child interpreter as a module called
+    *name* (the file name without extension by default), with an
+    InputProvider of *inputs* as its standard input. Returns a
+    :class:`ProgramRun`.
+    """
+
+    path = os.path.abspath(path)
+    name = name or os.path.splitext(os.path.basename(path))[0]
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-c", CHILD_RUNNER, path, name,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=os.path.dirname(path),
+        env=_child_env()
+    )
+    stdin = json.dumps([str(x) for x in inputs]).encode("utf-8")
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(stdin), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        return ProgramRun(path, inputs, "", "", process.returncode, timed_out=True)
+
+    return ProgramRun(path, inputs, _decode(stdout), _decode(stderr), process.returncode)
+
+def run_programs(path, input_vectors, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT, name=None):
+    """
+    Runs the program at *path* once for each input vector in *input_vectors*,
+    at most *concurrency* at a time, as a module called *name* (see
+    :func:`run_program`). Returns a list of :class:`ProgramRun` objects in the
+    same order as the input vectors.
+    """
+
+    async def run_all():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited(inputs):
+            async with semaphore:
+                return await run_program(path, inputs, timeout, name)
+
+        return await asyncio.gather(*[limited(inputs) for inputs in input_vectors])
+
+    return asyncio.run(run_all())
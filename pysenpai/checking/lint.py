@@ -1,13 +1,86 @@
+import ast
+import hashlib
 import inspect
 import io
+import json
+import os
 import sys
+from collections import Counter
 from pylint import lint
 
 import pysenpai.callbacks.defaults as defaults
 from pysenpai.output import json_output
 from pysenpai.messages import load_messages, Codes
 from pysenpai.output import output
+from pysenpai.checking.astlint import LintMessage, LintStats
 from pysenpai.utils.internal import StringOutput, get_exception_line
+from pysenpai.tracing import emit, TEST_START, TEST_END, CALL_START, CALL_END
+
+# Environment variable that points checkers to a results file written by
+# LintResults.save, see pysen-regrade --prelint
+LINT_RESULTS_ENV = "PYSEN_LINT_RESULTS"
+
+_shared_results = None
+
+# options that only affect how PyLint is run, not its results
+_RUN_OPTIONS = ("--output-format", "--jobs", "-j")
+
+def _find_rcfile():
+    try:
+        from pylint.config import find_default_config_files
+    except ImportError:
+        from pylint.config import find_pylintrc
+        return find_pylintrc()
+    return next(iter(find_default_config_files()), None)
+
+def lint_config(extra_options=[], directory=None):
+    """
+    lint_config([extra_options=[]][, directory=None]) -> dict
+    
+    Returns the effective configuration of a PyLint run with *extra_options* in
+    *directory* (the current working directory by default): the options that
+    affect the results, the configuration file given with --rcfile or found by
+    PyLint's configuration discovery, and a digest of that file's content.
+    Saved :class:`LintResults` are only used by :func:`pylint_test` when their
+    configuration matches.
+    """
+    
+    options = []
+    rcfile = None
+    option_iter = iter(extra_options)
+    for option in option_iter:
+        name, sep, value = option.partition("=")
+        if name == "--rcfile":
+            rcfile = value if sep else next(option_iter, None)
+        elif name in _RUN_OPTIONS:
+            if not sep:
+                next(option_iter, None)
+        else:
+            options.append(option)
+    
+    save_cwd = os.getcwd()
+    try:
+        if directory:
+            os.chdir(directory)
+        if rcfile is None:
+            rcfile = _find_rcfile()
+        if rcfile:
+            rcfile = os.path.abspath(rcfile)
+    finally:
+        os.chdir(save_cwd)
+    
+    digest = None
+    if rcfile:
+        try:
+            with open(rcfile, "rb") as source:
+                digest = hashlib.sha256(source.read()).hexdigest()
+        except OSError:
+            pass
+    return {"options": options, "rcfile": rcfile, "digest": digest}
+
+def _run_pylint(options_list):
+    result = lint.Run(options_list, exit=False)
+    return result.linter.stats, result.linter.reporter.messages
 
 # NOTE: extra_options, custom_msgs are read only
 # therefore setting defaults to empty lists / dictionaries is safe here. 
@@ -16,7 +89,8 @@ def pylint_test(st_module,
                 extra_options=[],
                 grader=defaults.default_pylint_grader,
                 info_only=True,
-                custom_msgs={}):
+                custom_msgs={},
+                backend=None):
     
     """
     pylint_test(st_module[, lang="en"][, kwarg1][, ...])
@@ -31,6 +105,18 @@ def pylint_test(st_module,
     
     See https://pylint.readthedocs.io/en/latest/user_guide/run.html for information
     regarding configuration and options.
+    
+    If a *backend* is given, it's used instead of PyLint. A backend is an object
+    with a lint method that takes the file path and returns a stats object and a
+    list of messages compatible with PyLint's, such as 
+    :class:`~pysenpai.checking.astlint.AstLinter`. *extra_options* are not used
+    with backends.
+    
+    If the environment variable PYSEN_LINT_RESULTS names a file saved with
+    :meth:`LintResults.save` that has results for the module's file, and those
+    results were made with the same effective configuration (see
+    :func:`lint_config`) as *extra_options* give here, they are used instead of
+    running PyLint again.
     """
     
     passed = True
@@ -39,47 +125,62 @@ def pylint_test(st_module,
     
     json_output.new_test(msgs.get_msg("LintTest", lang)["content"])
     json_output.new_run()
+    emit(TEST_START, test="lint", target=st_module.__name__)
     
-    options_list = extra_options + ["--output-format=json", st_module.__file__]
+    if backend is None:
+        backend = _load_shared_results()
+        if backend is not None and not backend.covers(st_module.__file__, lint_config(extra_options)):
+            backend = None
+    
+    if backend is None:
+        options_list = extra_options + ["--output-format=json", st_module.__file__]
+        run_lint = lambda: _run_pylint(options_list)
+    else:
+        run_lint = lambda: backend.lint(st_module.__file__)
     
     save_o = sys.stdout
     save_e = sys.stderr
     
     o = StringOutput()
-    e = StringOutput()
+    e = StringOutput(fd=2)
     
     sys.stdout = o
     sys.stderr = e
     
+    linter_name = "pylint" if backend is None else type(backend).__name__
+    emit(CALL_START, target=linter_name)
     try:
-        result = lint.Run(options_list, exit=False)
+        stats, messages = run_lint()
     except:
         etype, evalue, etrace = sys.exc_info()
         sys.stdout = save_o
         sys.stderr = save_e
         ename = evalue.__class__.__name__
         emsg = str(evalue)
+        emit(CALL_END, target=linter_name, error=ename)
         output(msgs.get_msg(ename, lang, default="GenericErrorMsg"), Codes.ERROR, emsg=emsg, ename=ename)
+        emit(TEST_END, test="lint", target=st_module.__name__)
         return 
 
     sys.stdout = save_o
     sys.stderr = save_e
+    emit(CALL_END, target=linter_name)
             
     try:
-        score = grader(result.linter.stats)
+        score = grader(stats)
     except AssertionError as e:
         score = 0
         if info_only:
-            output(msgs.get_msg(e, lang, "LintFailMessage"), Codes.INFO, stats=result.linter.stats)
+            output(msgs.get_msg(e, lang, "LintFailMessage"), Codes.INFO, stats=stats)
         else:
-            output(msgs.get_msg(e, lang, "LintFailMessage"), Codes.INCORRECT, stats=result.linter.stats)
+            output(msgs.get_msg(e, lang, "LintFailMessage"), Codes.INCORRECT, stats=stats)
             passed = False
     else:
-        output(msgs.get_msg("LintSuccess", lang), Codes.CORRECT, stats=result.linter.stats)
+        output(msgs.get_msg("LintSuccess", lang), Codes.CORRECT, stats=stats)
         
     output(msgs.get_msg("LintMessagesBegin", lang), Codes.INFO)
     
-    for msg in result.linter.reporter.messages:
+    for msg in messages:
         if msg.category == "convention":
             output(msgs.get_msg("LintConvention", lang), Codes.LINT_C, lintmsg=msg)
         elif msg.category == "refactor":
@@ -91,4 +192,165 @@ def pylint_test(st_module,
         elif msg.category == "fatal":
             output(msgs.get_msg("LintFatal", lang), Codes.ERROR, lintmsg=msg)
 
+    emit(TEST_END, test="lint", target=st_module.__name__)
     return score
+
+
+class LintResults(object):
+    """
+    Lint results of many files, made by :func:`lint_many`. The object works as
+    a backend for :func:`pylint_test`, so each submission is reported and
+    graded exactly like it would be after its own PyLint run. *results* maps
+    absolute file paths to (stats, messages) tuples and *config* is the
+    :func:`lint_config` the files were linted with.
+    """
+
+    def __init__(self, results, config=None):
+        self.results = results
+        self.config = config
+
+    def covers(self, path, config=None):
+        """
+        Returns True if there are results for *path* and, if *config* is
+        given, they were made with that configuration.
+        """
+
+        if config is not None and config != self.config:
+            return False
+        return os.path.abspath(path) in self.results
+
+    def lint(self, path):
+        return self.results[os.path.abspath(path)]
+
+    def save(self, path):
+        """
+        Saves the results into a JSON file at *path*.
+        """
+
+        files = {}
+        for file_path, (stats, messages) in self.results.items():
+            files[file_path] = {
+                "statement": stats.statement,
+                "global_note": stats.global_note,
+                "messages": [
+                    {
+                        "msg_id": msg.msg_id,
+                        "symbol": msg.symbol,
+                        "category": msg.category,
+                        "msg": msg.msg,
+                        "module": msg.module,
+                        "line": msg.line,
+                        "column": msg.column,
+                        "obj": msg.obj
+                    } for msg in messages
+                ]
+            }
+        with open(path, "w", encoding="utf-8") as target:
+            json.dump({"config": self.config, "files": files}, target)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads results saved with :meth:`save`.
+        """
+
+        with open(path, encoding="utf-8") as source:
+            document = json.load(source)
+
+        results = {}
+        for file_path, entry in document["files"].items():
+            messages = [LintMessage(path=file_path, **msg) for msg in entry["messages"]]
+            stats = LintStats(messages, entry["statement"], entry.get("global_note"))
+            results[file_path] = (stats, messages)
+        return cls(results, document["config"])
+
+
+def _load_shared_results():
+    global _shared_results
+    results_path = os.environ.get(LINT_RESULTS_ENV)
+    if not results_path:
+        return None
+    if _shared_results is None:
+        try:
+            _shared_results = LintResults.load(results_path)
+        except (OSError, ValueError, KeyError):
+            _shared_results = LintResults({})
+    return _shared_results
+
+def _count_statements(path):
+    try:
+        with open(path, encoding="utf-8") as source:
+            tree = ast.parse(source.read(), path)
+    except (OSError, UnicodeDecodeError, SyntaxError):
+        return 0
+    return sum(isinstance(node, ast.stmt) for node in ast.walk(tree))
+
+def _evaluate(linter, stats):
+    # per file note with the evaluation formula PyLint was configured with
+    evaluation = getattr(getattr(linter, "config", None), "evaluation", None)
+    if not evaluation or not stats.statement:
+        return stats.global_note
+    values = {
+        name: getattr(stats, name)
+        for name in ("fatal", "error", "warning", "refactor", "convention", "info", "statement")
+    }
+    try:
+        return float(eval(evaluation, {}, values))
+    except Exception:
+        return stats.global_note
+
+def lint_many(paths, extra_options=[], jobs=0, directory=None):
+    """
+    lint_many(paths[, extra_options=[]][, jobs=0][, directory=None]) -> LintResults
+    
+    Lints all files in *paths* in one PyLint session that uses *jobs* processes
+    (0 means one per CPU), so PyLint's startup and inference caches are shared
+    between files. The messages and stats are split per file and returned as a
+    :class:`LintResults` object. Statement counts are taken from PyLint's
+    per-module stats, or counted from the syntax tree when several files have
+    the same module name. Global notes are computed per file with PyLint's
+    configured evaluation formula.
+    
+    PyLint is run in *directory* (the current working directory by default),
+    which is where its configuration discovery starts. It should be a directory
+    where the checkers would find the same configuration, because the results
+    are only used by checkers whose :func:`lint_config` matches.
+    """
+    
+    paths = [os.path.abspath(path) for path in paths]
+    config = lint_config(extra_options, directory)
+    options_list = extra_options + ["--jobs={}".format(jobs), "--output-format=json"] + paths
+    
+    save_o = sys.stdout
+    save_e = sys.stderr
+    save_cwd = os.getcwd()
+    sys.stdout = StringOutput()
+    sys.stderr = StringOutput(fd=2)
+    try:
+        if directory:
+            os.chdir(directory)
+        result = lint.Run(options_list, exit=False)
+    finally:
+        os.chdir(save_cwd)
+        sys.stdout = save_o
+        sys.stderr = save_e
+    
+    by_path = {path: [] for path in paths}
+    for msg in result.linter.reporter.messages:
+        msg_path = os.path.abspath(getattr(msg, "abspath", None) or msg.path)
+        by_path.setdefault(msg_path, []).append(msg)
+    
+    names = Counter(os.path.splitext(os.path.basename(path))[0] for path in paths)
+    by_module = getattr(result.linter.stats, "by_module", {})
+    results = {}
+    for path, messages in by_path.items():
+        name = os.path.splitext(os.path.basename(path))[0]
+        if names[name] == 1 and name in by_module:
+            statement = by_module[name].get("statement", 0)
+        else:
+            statement = _count_statements(path)
+        stats = LintStats(messages, statement)
+        stats.global_note = _evaluate(result.linter, stats)
+        results[path] = (stats, messages)
+    
+    return LintResults(results, config)
@@ -0,0 +1,94 @@
+"""
+Test ordering strategies for :func:`~pysenpai.checking.testcase.run_test_cases`.
+An ordering decides the order in which test cases are run. The order in which
+the results are reported to the student is always the declared order.
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+DEFAULT_STATS_FILE = ".pysenpai_case_stats.json"
+
+
+class FailureStatsOrdering(object):
+    """
+    Runs the test cases that have failed most often in earlier runs first, so
+    that combined with fail_fast, incorrect submissions are rejected after as
+    few cases as possible. Failure rates are kept in a local JSON file at
+    *path*, per checker and test target, and per case using the case's tag or
+    its declared index if it doesn't have one. Cases that have no history keep
+    their declared order after the cases that have failed before.
+
+    If *sample* is set, that many cases picked at even intervals from the
+    declared order are run first. This pre-pass covers the whole suite quickly
+    while there are no statistics yet.
+
+    Statistics are updated by reading, modifying and atomically replacing the
+    file, so concurrent checker runs may occasionally lose an update, which is
+    acceptable for statistics.
+    """
+
+    def __init__(self, path=DEFAULT_STATS_FILE, checker=None, sample=0):
+        self.path = path
+        if checker is None:
+            checker = os.path.basename(getattr(sys.modules["__main__"], "__file__", "") or "")
+        self.checker = checker
+        self.sample = sample
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as stats_file:
+                return json.load(stats_file)
+        except (OSError, ValueError):
+            return {}
+
+    def _section(self, test_target):
+        return "{}:{}".format(self.checker, test_target)
+
+    @staticmethod
+    def case_key(test, index):
+        return test.tag or str(index)
+
+    def order(self, test_cases, test_target):
+        """
+        Returns the declared *test_cases* (a list) in the order they should be
+        run in.
+        """
+
+        stats = self._load().get(self._section(test_target), {})
+
+        def failure_rate(index):
+            runs, fails = stats.get(self.case_key(test_cases[index], index), (0, 0))
+            return fails / runs if runs else 0
+
+        indices = list(range(len(test_cases)))
+        first = []
+        if self.sample and len(test_cases) > self.sample:
+            stride = len(test_cases) / self.sample
+            sampled = {int(i * stride) for i in range(self.sample)}
+            first = sorted(sampled)
+            indices = [i for i in indices if i not in sampled]
+
+        # sort is stable so ties keep the declared order
+        indices.sort(key=failure_rate, reverse=True)
+        return [test_cases[i] for i in first + indices]
+
+    def update(self, test_target, results):
+        """
+        Records the *results* of a test run, a list of (case key, failed) pairs,
+        into the statistics file.
+        """
+
+        all_stats = self._load()
+        stats = all_stats.setdefault(self._section(test_target), {})
+        for key, failed in results:
+            runs, fails = stats.get(key, (0, 0))
+            stats[key] = [runs + 1, fails + int(failed)]
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, "w", encoding="utf-8") as stats_file:
+            json.dump(all_stats, stats_file)
+        os.replace(temp_path, self.path)
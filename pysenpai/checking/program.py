@@ -8,7 +8,12 @@ import pysenpai.callbacks.convenience as convenience
 from pysenpai.exceptions import OutputParseError
 from pysenpai.messages import load_messages, Codes
 from pysenpai.output import json_output, output
-from pysenpai.utils.internal import StringOutput, get_exception_line, reset_locals
+from pysenpai.utils.internal import InputProvider, StringOutput, get_exception_line, reset_locals
+from pysenpai.utils.vfs import virtual_fs
+from pysenpai.checking.erefs import ErefTable
+from pysenpai.checking.testcase import TestRun
+from pysenpai.checking.isolated import DEFAULT_CONCURRENCY, DEFAULT_TIMEOUT, run_programs
+from pysenpai.tracing import emit, TEST_START, TEST_END, CASE_START, CASE_END, CALL_START, CALL_END, OUTPUT_CAPTURED, VALIDATION
 
 
 # NOTE: custom_msgs, error_refs, custom_tests, info_funcs are read only
@@ -25,7 +30,13 @@ def test_program(st_module, test_vector, ref_func,
                  presenter=defaults.default_presenters,
                  output_parser=defaults.default_parser,
                  message_validator=None,
-                 new_test=defaults.default_new_test):
+                 new_test=defaults.default_new_test,
+                 eref_cache=None,
+                 isolate=False,
+                 concurrency=DEFAULT_CONCURRENCY,
+                 timeout=DEFAULT_TIMEOUT,
+                 files=None,
+                 fail_fast=0):
     """
     test_program(st_module, test_vector, ref_func[, lang="en"][, kwarg1][, ...])
     
@@ -38,8 +49,8 @@ def test_program(st_module, test_vector, ref_func,
     
     * *st_module* - a module object that's being tested
     * *test_vector* - input vectors to be given as inputs; Inputs are automatically 
-      joined by newlines and made into a StringIO object that replaces standard
-      input.
+      joined by newlines and made into an :class:`~pysenpai.utils.internal.InputProvider`
+      that replaces standard input.
     * *ref_func* - reference function that is given the input vector as arguments
       and should return values that match what is expected from the student program. 
       It should **not** consume inputs (i.e. don't call :func:`input`).
@@ -84,17 +95,44 @@ def test_program(st_module, test_vector, ref_func,
     * *new_test* - a function that is called at the start of each test case. Can be
       used to reset the state of persistent objects within the checker. Receives 
       arguments (as None) and inputs when called.
+    * *eref_cache* - a dictionary-like object (e.g. from :mod:`shelve`) for storing
+      false reference results across checker runs, keyed by input vector, program
+      name and false reference functions. See 
+      :class:`~pysenpai.checking.erefs.ErefTable`.
+    * *isolate* - if True, the student program is run in a child interpreter for
+      each test case instead of being reloaded in the checker's own. A crash, 
+      sys.exit or endless loop then only ends that test case's run, and several
+      cases are run at the same time. The program is still run under its module
+      name with the same input handling, so errors (including running out of 
+      inputs and sys.exit) are reported like in the default mode, and the 
+      captured output goes through the same parsing and validation. See 
+      :mod:`~pysenpai.checking.isolated`.
+    * *concurrency* - the maximum number of child interpreters running at the same
+      time when *isolate* is True. 
+    * *timeout* - seconds each child interpreter is allowed to run when *isolate* 
+      is True. Programs that run longer are killed and the ProgramTimeout message 
+      is shown.
+    * *files* - a dictionary of fixture files that the student program sees 
+      through an in-memory file system each time it's run. Files written by the 
+      program are available in :data:`pysenpai.utils.vfs.virtual_fs` while the 
+      case is validated. Not supported when *isolate* is True, giving both raises
+      ValueError. See :mod:`~pysenpai.utils.vfs`.
+    * *fail_fast* - if set to a positive number, testing stops after that many 
+      failed cases. The case that stops the test is not given additional tests 
+      (false references, custom tests, recurrence test and information functions).
     
     The number of test cases is determined from the length of the test vector. Even if 
     the testing with no inputs at all, your test vector must contain an empty list
-    for each test case! 
+    for each test case! If the test vector is a list, all reference results are 
+    obtained before running any tests. If it's a generator (or a function that returns
+    one), inputs and references are produced one case at a time as the test proceeds. 
     
     Each test case is processed as follows. During the test, sys.stdout is restored
     whenever a message is shown to the student.
     
     #. new_test callback is called
     #. Stored output is cleared and output is redirected to the StringOutput object
-    #. StringIO object is formed from the test vector to replace sys.stdin
+    #. InputProvider object is formed from the test vector to replace sys.stdin
     #. The student program is reloaded using :func:`importlib.reload`. 
     
        * If there is an error, the appropriate error message is retrieved from the 
@@ -132,6 +170,8 @@ def test_program(st_module, test_vector, ref_func,
          the MessageInfo message and the student program's raw output.
     """
 
+    if isolate and files is not None:
+        raise ValueError("Fixture files are not supported for isolated programs")
 
     # One time preparations
     save = sys.stdout
@@ -155,49 +195,90 @@ def test_program(st_module, test_vector, ref_func,
     json_output.new_test(
         msgs.get_msg("ProgramName", lang)["content"].format(name=st_module.__name__)
     )
+    emit(TEST_START, test="program", target=st_module.__name__)
 
+    eref_table = ErefTable(error_refs, validator, eref_cache, "program:" + st_module.__name__)
+    
     o = StringOutput()
     sys.stdout = o
     
-    tests = []
-    for v in test_vector:
-        tests.append((v, ref_func(*v)))
+    if isinstance(test_vector, (list, tuple)) or isolate:
+        tests = [(v, ref_func(*v)) for v in test_vector]
+    else:
+        # generator sources are consumed one case at a time
+        tests = ((v, ref_func(*v)) for v in test_vector)
+    
+    if isolate:
+        runs = run_programs(
+            st_module.__file__, [inputs for inputs, ref in tests], concurrency, timeout,
+            name=st_module.__name__
+        )
+    else:
+        runs = None
     
     prev_out = None
     
+    # a case has passed if both its result and its output were correct
+    case_correct = False
+    test_run = TestRun(tests, fail_fast=fail_fast, failed=lambda case: not case_correct)
+    
     # Running the tests
-    for inputs, ref in tests:
+    for i, (inputs, ref) in enumerate(test_run):
         json_output.new_run()
+        emit(CASE_START, index=i)
+        case_correct = False
         new_test(None, inputs)
-        reset_locals(st_module)
+        if runs is None:
+            reset_locals(st_module)
         
         # Test preparations
         sys.stdout = o
         o.clear()
             
-        sys.stdin = io.StringIO("\n".join([str(x) for x in inputs]))
+        sys.stdin = InputProvider(inputs)
         
         # Running the student module
-        try:
-            importlib.reload(st_module)
-        except:
-            sys.stdout = save
-            etype, evalue, etrace = sys.exc_info()
-            ename = evalue.__class__.__name__
-            emsg = str(evalue)
-            elineno, eline = get_exception_line(st_module, etrace)
-            output(msgs.get_msg(ename, lang, default="GenericErrorMsg"), Codes.ERROR,
+        emit(CALL_START, target=st_module.__name__)
+        error = None
+        if runs is not None:
+            run = runs[i]
+            o.write(run.output)
+            if run.ename:
+                error = run.ename, run.emsg, run.lineno, run.line, dict(run.format_args, timeout=timeout)
+        else:
+            try:
+                with virtual_fs.activated(files):
+                    importlib.reload(st_module)
+            except:
+                etype, evalue, etrace = sys.exc_info()
+                elineno, eline = get_exception_line(st_module, etrace)
+                error = (
+                    evalue.__class__.__name__, str(evalue), elineno, eline, 
+                    getattr(evalue, "format_args", {})
+                )
+        
+        sys.stdout = save
+        if error:
+            ename, emsg, elineno, eline, format_args = error
+            emit(CALL_END, target=st_module.__name__, error=ename)
+            format_args = dict(format_args,
                 inputs=input_presenter(inputs),
                 emsg=emsg,
                 ename=ename
             )
-            output(msgs.get_msg("PrintExcLine", lang), Codes.DEBUG, lineno=elineno, line=eline)
+            output(msgs.get_msg(ename, lang, default="GenericErrorMsg"), Codes.ERROR, **format_args)
+            # timeouts and exits outside the program file have no line to show
+            if elineno != "?":
+                output(msgs.get_msg("PrintExcLine", lang), Codes.DEBUG, lineno=elineno, line=eline)
             output(msgs.get_msg("PrintInputVector", lang), Codes.DEBUG, inputs=input_presenter(inputs))
+            emit(CASE_END, index=i, correct=False)
+            emit(TEST_END, test="program", target=st_module.__name__)
             return 
             
         # Validating program results
         values_printed = False
-        sys.stdout = save
+        emit(CALL_END, target=st_module.__name__)
+        emit(OUTPUT_CAPTURED, length=len(o.content))
         if not hide_output:
             output(msgs.get_msg("PrintStudentOutput", lang), Codes.INFO, output=o.content)
                 
@@ -215,15 +296,19 @@ def test_program(st_module, test_vector, ref_func,
             )
             output(msgs.get_msg("OutputPatternInfo", lang), Codes.INFO)
             output(msgs.get_msg("PrintStudentOutput", lang), Codes.INFO, output=o.content)
+            emit(CASE_END, index=i, correct=False)
             continue
 
         # Validation
         try: 
             validator(ref, None, st_out)
+            case_correct = True
+            emit(VALIDATION, correct=True)
             output(msgs.get_msg("CorrectResult", lang), Codes.CORRECT)
         except AssertionError as e:
             # Result was incorrect
-            output(msgs.get_msg(e, lang, "IncorrectResult"), Codes.INCORRECT)
+            emit(VALIDATION, correct=False, reason=str(e))
+            output(msgs.get_msg(e, lang, "IncorrectResult"), Codes.INCORRECT, **getattr(e, "format_args", {}))
             output(msgs.get_msg("PrintInputVector", lang), Codes.DEBUG, inputs=input_presenter(inputs))
             output(msgs.get_msg("PrintStudentResult", lang), Codes.DEBUG,
                 parsed=parsed_presenter(st_out), output=o.content
@@ -231,39 +316,37 @@ def test_program(st_module, test_vector, ref_func,
             output(msgs.get_msg("PrintStudentOutput", lang), Codes.INFO, output=o.content)  
             output(msgs.get_msg("PrintReference", lang), Codes.DEBUG, ref=ref_presenter(ref))
             values_printed = True
-            if error_refs or custom_tests or test_recurrence:
-                output(msgs.get_msg("AdditionalTests", lang), Codes.INFO)
+            # testing stops after this case, so additional tests are skipped
+            if not test_run.final_failure:
+                if error_refs or custom_tests or test_recurrence:
+                    output(msgs.get_msg("AdditionalTests", lang), Codes.INFO)
             
-            # Run false references
-            for eref_func in error_refs:
-                eref = eref_func(*inputs)
-                try: 
-                    validator(eref, None, st_out)
-                    output(msgs.get_msg(eref_func.__name__, lang), Codes.INFO)
-                except AssertionError as e:
-                    pass
+                # Run false references
+                call_eref = lambda eref_func: eref_func(*inputs)
+                for eref_name in eref_table.matches(inputs, call_eref, None, st_out):
+                    output(msgs.get_msg(eref_name, lang), Codes.INFO)
                     
-            # Run custom tests
-            for test in custom_tests:
-                try: 
-                    test(None, st_out, o.content, ref, None, inputs)
-                except AssertionError as e:
-                    output(msgs.get_msg(e, lang, test.__name__), Codes.INFO)
+                # Run custom tests
+                for test in custom_tests:
+                    try: 
+                        test(None, st_out, o.content, ref, None, inputs)
+                    except AssertionError as e:
+                        output(msgs.get_msg(e, lang, test.__name__), Codes.INFO)
                     
-            # Test for result recurrence
-            if test_recurrence and st_out == prev_out:
-                output(msgs.get_msg("RepeatingResult", lang), Codes.INFO)
+                # Test for result recurrence
+                if test_recurrence and st_out == prev_out:
+                    output(msgs.get_msg("RepeatingResult", lang), Codes.INFO)
 
-            # Run info functions
-            if info_funcs:
-                output(msgs.get_msg("AdditionalInfo", lang), Codes.INFO)
-                for info_func in info_funcs:
-                    try:
-                        output(msgs.get_msg(info_func.__name__, lang), Codes.INFO,
-                            func_res=info_func(None, st_out, o.content, ref, None, inputs)
-                        )
-                    except NoAdditionalInfo:
-                        pass
+                # Run info functions
+                if info_funcs:
+                    output(msgs.get_msg("AdditionalInfo", lang), Codes.INFO)
+                    for info_func in info_funcs:
+                        try:
+                            output(msgs.get_msg(info_func.__name__, lang), Codes.INFO,
+                                func_res=info_func(None, st_out, o.content, ref, None, inputs)
+                            )
+                        except NoAdditionalInfo:
+                            pass
         else:
             # Result was correct
             output(msgs.get_msg("PrintInputVector", lang), Codes.DEBUG, inputs=input_presenter(inputs))
@@ -280,6 +363,7 @@ def test_program(st_module, test_vector, ref_func,
                 message_validator(o.content, None, inputs)
                 output(msgs.get_msg("CorrectMessage", lang), Codes.CORRECT)
             except AssertionError as e:
+                case_correct = False
                 output(msgs.get_msg(e, lang, "IncorrectMessage"), Codes.INCORRECT)
                 output(msgs.get_msg("MessageInfo", lang), Codes.INFO)
                 if not values_printed:
@@ -288,4 +372,9 @@ def test_program(st_module, test_vector, ref_func,
                         inputs=input_presenter(inputs)
                     )
                 
+        emit(CASE_END, index=i, correct=case_correct)
         prev_out = None
+    
+    if test_run.stopped:
+        output(msgs.get_msg("FailFastStop", lang), Codes.INFO, failed=test_run.failed)
+    emit(TEST_END, test="program", target=st_module.__name__)
@@ -8,7 +8,8 @@ import pysenpai.callbacks.convenience as convenience
 from pysenpai.output import json_output
 from pysenpai.messages import load_messages, Codes
 from pysenpai.output import output
-from pysenpai.utils.internal import StringOutput, get_exception_line, reset_locals
+from pysenpai.utils.internal import InputProvider, StringOutput, get_exception_line, reset_locals
+from pysenpai.tracing import emit, TEST_START, TEST_END, CASE_START, CASE_END, CALL_START, CALL_END, OUTPUT_CAPTURED, VALIDATION
 
 # NOTE: custom_msgs, inputs, error_refs, custom_tests, info_funcs are read only
 # therefore setting defaults to empty lists / dictionaries is safe here. 
@@ -78,7 +79,7 @@ def test_code_snippet(st_code, constructor, ref_func,
     Currently code snippet tests only run once. They proceed as follows:
     
     #. Real stdout is saved, messages are updated from custom messages given by
-       the checker and presenters are set. Inputs are written into a StringIO 
+       the checker and presenters are set. Inputs are given to an InputProvider 
        and stdin is pointed there.
     #. The reference result is obtained from the reference function.
     #. Student submission is constructed into a temporary module using the constructor.
@@ -136,16 +137,18 @@ def test_code_snippet(st_code, constructor, ref_func,
         code_presenter = presenter
         
     json_output.new_test(msgs.get_msg("SnippetTest", lang)["content"])
+    emit(TEST_START, test="snippet", target="temp_module")
     
     o = StringOutput()
     sys.stdout = o
     
     json_output.new_run()
+    emit(CASE_START, index=0)
     
     sys.stdout = o
     o.clear()
         
-    sys.stdin = io.StringIO("\n".join([str(x) for x in inputs]))
+    sys.stdin = InputProvider(inputs)
     
     ref = ref_func(inputs)
     
@@ -158,6 +161,7 @@ def test_code_snippet(st_code, constructor, ref_func,
         output(msgs.get_msg("PrintConstructedCode", lang), Codes.INFO, code=code_presenter(full_code))
     
     # Load the module and obtain output
+    emit(CALL_START, target="temp_module")
     try:
         temp_module = importlib.import_module("temp_module")
     except:
@@ -165,18 +169,24 @@ def test_code_snippet(st_code, constructor, ref_func,
         etype, evalue, etrace = sys.exc_info()
         ename = evalue.__class__.__name__
         emsg = str(evalue)
-        output(msgs.get_msg(ename, lang, default="GenericErrorMsg"), Codes.ERROR,
+        emit(CALL_END, target="temp_module", error=ename)
+        format_args = dict(getattr(evalue, "format_args", {}),
             ename=ename,
             emsg=emsg,
             inputs=input_presenter(inputs)
         )
+        output(msgs.get_msg(ename, lang, default="GenericErrorMsg"), Codes.ERROR, **format_args)
         if inputs:
             output(msgs.get_msg("PrintInputVector", lang), Codes.DEBUG, inputs=presenter(inputs))
+        emit(CASE_END, index=0, correct=False)
+        emit(TEST_END, test="snippet", target="temp_module")
         return False
 
     # Resume output to normal stdout and show output if not hidden
     values_printed = False
     sys.stdout = save
+    emit(CALL_END, target="temp_module")
+    emit(OUTPUT_CAPTURED, length=len(o.content))
     if not hide_output:
         output(msgs.get_msg("PrintStudentOutput", lang), Codes.INFO, output=o.content)
 
@@ -192,16 +202,20 @@ def test_code_snippet(st_code, constructor, ref_func,
         output(msgs.get_msg("PrintInputVector", lang), Codes.DEBUG, inputs=input_presenter(inputs))
         output(msgs.get_msg("OutputPatternInfo", lang), Codes.INFO)
         output(msgs.get_msg("PrintStudentOutput", lang), Codes.INFO, output=o.content)
+        emit(CASE_END, index=0, correct=False)
+        emit(TEST_END, test="snippet", target="temp_module")
         return False
 
     # Validate the result
     try:
         validator(ref, temp_module, st_out)
+        emit(VALIDATION, correct=True)
         output(msgs.get_msg("CorrectResult", lang), Codes.CORRECT)
     except AssertionError as e:
         # Result was incorrect
         correct = False
-        output(msgs.get_msg(e, lang, "IncorrectResult"), Codes.INCORRECT)
+        emit(VALIDATION, correct=False, reason=str(e))
+        output(msgs.get_msg(e, lang, "IncorrectResult"), Codes.INCORRECT, **getattr(e, "format_args", {}))
         if inputs:
             output(msgs.get_msg("PrintInputVector", lang), Codes.DEBUG,
                 inputs=presenter(inputs)
@@ -268,4 +282,6 @@ def test_code_snippet(st_code, constructor, ref_func,
                 output(msgs.get_msg("PrintStudentOutput", lang), Codes.INFO, output=o.content)  
                 output(msgs.get_msg("PrintInputVector", lang), Codes.DEBUG, inputs=input_presenter(inputs))
 
+    emit(CASE_END, index=0, correct=correct)
+    emit(TEST_END, test="snippet", target="temp_module")
     return correct
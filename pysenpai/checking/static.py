@@ -7,6 +7,7 @@ from pysenpai.output import json_output
 from pysenpai.messages import load_messages, Codes
 from pysenpai.output import output
 from pysenpai.utils.internal import StringOutput, get_exception_line
+from pysenpai.tracing import emit, TEST_START, TEST_END, VALIDATION
 
 # NOTE: custom_msgs is read only
 # therefore setting defaults to empty dictionary is safe here. 
@@ -42,6 +43,7 @@ def static_test(st_module, func_names, lang, validators,
         msgs.get_msg("StaticTest", lang)["content"].format(fname=func_names.get(lang, ""))
     )
     json_output.new_run()
+    emit(TEST_START, test="static", target=func_names.get(lang, ""))
     
     try:
         if func_names:
@@ -58,6 +60,7 @@ def static_test(st_module, func_names, lang, validators,
             emsg=emsg,
             ename=ename
         )
+        emit(TEST_END, test="static", target=func_names.get(lang, ""))
         return
         
     failed = 0
@@ -65,7 +68,9 @@ def static_test(st_module, func_names, lang, validators,
     for validator in validators:
         try: 
             validator(source, doc, comments)
+            emit(VALIDATION, correct=True, validator=validator.__name__)
         except AssertionError as e:
+            emit(VALIDATION, correct=False, reason=str(e), validator=validator.__name__)
             if info_only:
                 output(msgs.get_msg(e, lang, validator.__name__), Codes.INFO)
                 passed += 1
@@ -76,4 +81,5 @@ def static_test(st_module, func_names, lang, validators,
     if passed == len(validators):
         output(msgs.get_msg("CorrectResult", lang), Codes.CORRECT)
         
+    emit(TEST_END, test="static", target=func_names.get(lang, ""))
     return grader(failed)
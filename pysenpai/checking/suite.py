@@ -0,0 +1,158 @@
+"""
+Declarative test suite files. Instead of building thousands of test case
+objects when the checker starts, the cases are written once into a compact
+binary file with :func:`write_suite` and read back with :class:`TestSuite`,
+which memory maps the file and creates each test case only when the runner
+gets to it::
+
+    write_suite("sum.suite", [
+        {"args": [1, 2], "ref": 3},
+        {"args": [5, -5], "ref": 0, "weight": 2, "tag": "zero", "erefs": [(-10, "sign_error")]},
+    ])
+
+    suite = TestSuite("sum.suite", FunctionTestCase, validator=my_validator)
+    run_test_cases("function", "add", st_module, suite, lang)
+
+Each case is a dictionary with the keys in :data:`SUITE_FIELDS`, all of which
+are optional. Values are stored with :mod:`marshal`, so they must be built from
+None, booleans, numbers, strings, bytes, lists, tuples, sets and dictionaries.
+The file has the records one after another followed by an index of their
+offsets and a footer, so suites can be written from generators without keeping
+the cases in memory.
+"""
+
+import marshal
+import mmap
+import struct
+
+from pysenpai.checking.testcase import DEFAULT_PRESENTERS, FunctionTestCase
+
+SUITE_MAGIC = b"PYSENSUITE\x00\x01"
+SUITE_FIELDS = ("args", "inputs", "ref", "weight", "tag", "erefs", "data")
+FIELD_DEFAULTS = (None, None, None, 1, "", None, None)
+
+# index offset and case count, followed by the marshal version
+_FOOTER = struct.Struct("<QQH")
+_OFFSET = struct.Struct("<Q")
+
+
+def _record(case):
+    if not isinstance(case, dict):
+        # test case objects can be converted into suites as well
+        case = {
+            "args": case.args,
+            "inputs": case.inputs,
+            "ref": case.ref_result,
+            "weight": case.weight,
+            "tag": case.tag,
+            "erefs": case.eref_results,
+            "data": case.data
+        }
+    unknown = set(case) - set(SUITE_FIELDS)
+    if unknown:
+        raise ValueError("Unknown test suite fields: {}".format(", ".join(sorted(unknown))))
+
+    values = [case.get(field, default) for field, default in zip(SUITE_FIELDS, FIELD_DEFAULTS)]
+    if values[5]:
+        values[5] = [tuple(eref) for eref in values[5]]
+    # trailing default values are left out
+    while values and values[-1] == FIELD_DEFAULTS[len(values) - 1]:
+        values.pop()
+    return marshal.dumps(tuple(values))
+
+def write_suite(path, cases):
+    """
+    write_suite(path, cases) -> int
+
+    Writes *cases*, an iterable of dictionaries with keys from
+    :data:`SUITE_FIELDS` or existing test case objects, into a suite file at
+    *path*. Returns the number of cases written.
+    """
+
+    offsets = []
+    with open(path, "wb") as target:
+        target.write(SUITE_MAGIC)
+        for case in cases:
+            offsets.append(target.tell())
+            target.write(_record(case))
+        offsets.append(target.tell())
+        for offset in offsets:
+            target.write(_OFFSET.pack(offset))
+        target.write(_FOOTER.pack(offsets[-1], len(offsets) - 1, marshal.version))
+    return len(offsets) - 1
+
+
+class TestSuite(object):
+    """
+    Test cases read from a suite file at *path*. The object is a sequence of
+    test cases of *case_class* that are created on demand from the memory mapped
+    file, so it can be given to :func:`~pysenpai.checking.testcase.run_test_cases`
+    like a list. *case_options*, e.g. validator and output_validator, are passed
+    to every test case. All cases share one presenter table, made from the
+    default presenters updated with *presenters*.
+    """
+
+    def __init__(self, path, case_class=FunctionTestCase, presenters=None, **case_options):
+        self.path = path
+        self.case_class = case_class
+        self.case_options = case_options
+        if presenters:
+            self.presenters = dict(DEFAULT_PRESENTERS, **presenters)
+        else:
+            self.presenters = DEFAULT_PRESENTERS
+
+        with open(path, "rb") as source:
+            self._map = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(SUITE_MAGIC)] != SUITE_MAGIC:
+            self._map.close()
+            raise ValueError("{} is not a test suite file".format(path))
+
+        self._index, self._count, version = _FOOTER.unpack_from(self._map, len(self._map) - _FOOTER.size)
+        if version != marshal.version:
+            self._map.close()
+            raise ValueError("{} was written with an incompatible Python version".format(path))
+
+    def __len__(self):
+        return self._count
+
+    def record(self, i):
+        """
+        Returns case *i* as a dictionary of :data:`SUITE_FIELDS`.
+        """
+
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("test suite index out of range")
+        start, = _OFFSET.unpack_from(self._map, self._index + i * _OFFSET.size)
+        end, = _OFFSET.unpack_from(self._map, self._index + (i + 1) * _OFFSET.size)
+        values = marshal.loads(self._map[start:end])
+        return dict(zip(SUITE_FIELDS, values + FIELD_DEFAULTS[len(values):]))
+
+    def __getitem__(self, i):
+        record = self.record(i)
+        case = self.case_class(
+            record["ref"],
+            args=record["args"],
+            inputs=record["inputs"],
+            data=record["data"],
+            weight=record["weight"],
+            tag=record["tag"],
+            eref_results=record["erefs"],
+            **self.case_options
+        )
+        case.presenters = self.presenters
+        return case
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self[i]
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
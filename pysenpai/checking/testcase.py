@@ -1,3 +1,4 @@
+import copy
 import importlib
 import inspect
 import io
@@ -9,9 +10,22 @@ from pysenpai.exceptions import NoAdditionalInfo, NotCallable, OutputParseError
 from pysenpai.output import json_output
 from pysenpai.messages import load_messages, Codes
 from pysenpai.output import output
-from pysenpai.utils.internal import StringOutput, get_exception_line
+from pysenpai.utils.internal import LazyPresentation, InputProvider, ModuleSnapshot, StringOutput, get_exception_line
+from pysenpai.utils.vfs import virtual_fs
+from pysenpai.tracing import emit, TEST_START, TEST_END, CASE_START, CASE_END, CALL_START, CALL_END, OUTPUT_CAPTURED, VALIDATION
 from pysenpai.checking import TestCase
 
+# Presenter table shared by all test cases that don't set their own presenters
+DEFAULT_PRESENTERS = {
+    "arg": defaults.default_value_presenter,
+    "input": defaults.default_input_presenter,
+    "data": defaults.default_value_presenter,
+    "ref": defaults.default_value_presenter,
+    "res": defaults.default_value_presenter,
+    "parsed": defaults.default_value_presenter,
+    "call": defaults.default_call_presenter
+}
+
 class TestCase(object):
     
     def __init__(self, ref_result, 
@@ -24,11 +38,13 @@ class TestCase(object):
                  output_validator=None,
                  eref_results=None,
                  internal_config=None,
-                 presenters=None):
+                 presenters=None,
+                 files=None):
                  
         self.args = args or []
         self.inputs = inputs or []
         self.data = data
+        self.files = files
         self.weight = weight
         self.tag = tag
         self.ref_result = ref_result
@@ -38,20 +54,14 @@ class TestCase(object):
         self.correct = False
         self.output_correct = False
         self.internal_config = internal_config
-        self.presenters = {
-            "arg": defaults.default_value_presenter,
-            "input": defaults.default_input_presenter,
-            "data": defaults.default_value_presenter,
-            "ref": defaults.default_value_presenter,
-            "res": defaults.default_value_presenter,
-            "parsed": defaults.default_value_presenter,
-            "call": defaults.default_call_presenter
-        }
         if presenters:
-            self.presenters.update(presenters)
+            self.presenters = dict(DEFAULT_PRESENTERS, **presenters)
+        else:
+            self.presenters = DEFAULT_PRESENTERS
     
     def configure_presenters(self, patch):
-        self.presenters.update(patch)
+        # presenter tables can be shared, so they are never changed in place
+        self.presenters = dict(self.presenters, **patch)
     
     def present_object(self, category, value):
         return self.presenters[category](value)
@@ -109,16 +119,103 @@ class ProgramTestCase(TestCase):
                  output_validator=None,
                  eref_results=None,
                  internal_config=None,
-                 presenters=None):
+                 presenters=None,
+                 files=None):
         
         super().__init__(
-            ref_result, args, inputs, data, weight, tag, validator, output_validator, eref_results, internal_config, presenters
+            ref_result, args, inputs, data, weight, tag, validator, output_validator, eref_results, internal_config, presenters,
+            files
         )
 
     def wrap(self, module, target):
         importlib.reload(module)
 
 
+def case_failed(test):
+    """
+    Returns True if *test* failed either result or output validation.
+    """
+    
+    return not test.correct or bool(getattr(test, "output_validator", None)) and not test.output_correct
+
+
+class TestRun(object):
+    """
+    Iterates over test cases for a test runner and keeps track of the results
+    for grading. *test_cases* can be any iterable, including a generator, and
+    is only advanced when the runner is done with the previous case. 
+    
+    The *grader* is either a function that receives the list of test cases
+    that were run, or an incremental grader object with add(test_case) and
+    score() methods, in which case the cases are not kept. Without a grader,
+    :meth:`grade` returns None. If *fail_fast* is a positive number, iteration
+    stops after that many failed cases and the rest of the cases are never
+    created. Whether a case failed is decided by *failed*, which is called with
+    the case when the runner is done with it (:func:`case_failed` by default).
+    """
+    
+    def __init__(self, test_cases, grader=None, fail_fast=0, failed=case_failed):
+        self.test_cases = test_cases
+        self.grader = grader
+        self.fail_fast = fail_fast
+        self.is_failed = failed
+        self.incremental = hasattr(grader, "add")
+        self.cases = []
+        self.failed = 0
+        self.stopped = False
+        
+    def __iter__(self):
+        for test in self.test_cases:
+            yield test
+            self.record(test)
+            if self.fail_fast and self.failed >= self.fail_fast:
+                self.stopped = True
+                return
+            
+    def record(self, test):
+        if self.incremental:
+            self.grader.add(test)
+        elif self.grader is not None:
+            self.cases.append(test)
+        if self.is_failed(test):
+            self.failed += 1
+            
+    @property
+    def final_failure(self):
+        """
+        True if a failure of the current case stops the run. Runners skip the
+        expensive extra feedback (false references, custom tests and such) for
+        this case, since its report is the last one anyway.
+        """
+        
+        return bool(self.fail_fast) and self.failed + 1 >= self.fail_fast
+            
+    def grade(self):
+        if self.grader is None:
+            return None
+        if self.incremental:
+            return self.grader.score()
+        return self.grader(self.cases)
+
+
+def _present_call_with(test, target, args):
+    # presents the call with a snapshot of the arguments taken before the call
+    current = test.args
+    test.args = args
+    try:
+        return test.present_call(target)
+    finally:
+        test.args = current
+
+def _flush_debug(debug_msgs):
+    """
+    Outputs debug messages that have been held back during a test case.
+    """
+    
+    for msg, format_args in debug_msgs:
+        output(msg, Codes.DEBUG, **format_args)
+    debug_msgs.clear()
+
 
 def run_test_cases(category, test_target, st_module, test_cases, lang, 
                    parent_object=None,
@@ -129,9 +226,29 @@ def run_test_cases(category, test_target, st_module, test_cases, lang,
                    test_recurrence=True,
                    validate_exception=False,
                    new_test=defaults.default_new_test,
-                   grader=defaults.pass_fail_grader):
-
+                   grader=defaults.pass_fail_grader,
+                   debug_on_fail_only=False,
+                   fail_fast=0,
+                   ordering=None,
+                   restore_state=False):
 
+    # If debug_on_fail_only is set, test vectors and student results are only
+    # presented for cases that fail. Presenters are called when a message is
+    # output, so this saves rendering the values of passing cases. Messages that
+    # are output anyway only skip rendering if their content doesn't include
+    # the value. Messages that are held back until after the call show the
+    # arguments from a copy taken before the call, because the student function
+    # may change them.
+    # If fail_fast is set, testing stops after that many failed cases, and the
+    # case that stops it gets no additional tests. See TestRun for the
+    # supported test case sources and graders.
+    # If an ordering (see pysenpai.checking.ordering) is given, cases are run
+    # in the order it chooses but reported in the declared order.
+    # If restore_state is set, the student module's state is recorded before
+    # the first case and restored before each case and after the last one (see
+    # ModuleSnapshot).
+    # Test cases with files get them as an in-memory file system during the
+    # call, and files written by the student are in virtual_fs.written.
 
     # One time preparations
     save = sys.stdout
@@ -147,16 +264,30 @@ def run_test_cases(category, test_target, st_module, test_cases, lang,
     json_output.new_test(
         msgs.get_msg("TargetName", lang)["content"].format(name=test_target)
     )
+    emit(TEST_START, test=category, target=test_target)
     if parent_object is None:
         parent_object = st_module
+        
+    if ordering is not None:
+        test_cases = list(test_cases)
+        declared = {id(test): i for i, test in enumerate(test_cases)}
+        test_cases = ordering.order(test_cases, test_target)
+        ran = []
 
     prev_res = None
     prev_out = None
     
     o = StringOutput()
+    test_run = TestRun(test_cases, grader, fail_fast)
+    snapshot = ModuleSnapshot(st_module) if restore_state else None
 
-    for i, test in enumerate(test_cases):
+    for i, test in enumerate(test_run):
         json_output.new_run()
+        emit(CASE_START, index=i, tag=test.tag)
+        if ordering is not None:
+            ran.append(test)
+        if snapshot is not None:
+            snapshot.restore()
 
         if show_module:
             output(
@@ -166,109 +297,164 @@ def run_test_cases(category, test_target, st_module, test_cases, lang,
 
         try:
             inps = test.inputs
-            sys.stdin = io.StringIO("\n".join([str(x) for x in inps]))
+            sys.stdin = InputProvider(inps)
         except IndexError:
             inps = []
+        lazy_inputs = not isinstance(inps, (list, tuple))
+        if lazy_inputs:
+            # only the inputs that were read can be shown, after the call
+            inps = sys.stdin.read_inputs
 
+        debug_msgs = []
         if test.args:
-            output(
-                msgs.get_msg("PrintTestVector", lang), Codes.DEBUG,
-                args=test.present_object("arg", test.args),
-                call=test.present_call(test_target)
-            )
+            deferred = debug_on_fail_only or lazy_inputs
+            try:
+                stored_args = copy.deepcopy(test.args) if deferred else test.args
+            except Exception:
+                stored_args = None
+            if stored_args is None:
+                # arguments that can't be copied are presented before the call
+                vector = dict(
+                    args=test.present_object("arg", test.args),
+                    call=test.present_call(test_target)
+                )
+            else:
+                vector = dict(
+                    args=LazyPresentation(test.present_object, "arg", stored_args),
+                    call=LazyPresentation(_present_call_with, test, test_target, stored_args)
+                )
+            debug_msgs.append((msgs.get_msg("PrintTestVector", lang), vector))
         if test.inputs:
-            output(
-                msgs.get_msg("PrintInputVector", lang), Codes.DEBUG,
-                inputs=test.present_object("input", test.inputs)
-            )
+            debug_msgs.append((
+                msgs.get_msg("PrintInputVector", lang),
+                dict(inputs=LazyPresentation(test.present_object, "input", inps))
+            ))
         if test.data:
-            output(
-                msgs.get_msg("PrintTestData", lang), Codes.DEBUG,
-                data=test.present_object("data", test.data)
-            )
-
+            debug_msgs.append((
+                msgs.get_msg("PrintTestData", lang),
+                dict(data=LazyPresentation(test.present_object, "data", test.data))
+            ))
+        if not debug_on_fail_only and not lazy_inputs:
+            _flush_debug(debug_msgs)
 
         # Test preparations
         sys.stdout = o
         o.clear()
 
         # Calling the student function
+        emit(CALL_START, target=test_target)
         try:
-            res = test.wrap(st_module, test_target)
+            with virtual_fs.activated(getattr(test, "files", None)):
+                res = test.wrap(st_module, test_target)
         except NotCallable as e:
             sys.stdout = save
+            emit(CALL_END, target=test_target, error="NotCallable")
             output(msgs.get_msg("IsNotFunction", lang), Codes.ERROR, name=e.callable_name)
+            emit(CASE_END, index=i, correct=False)
+            emit(TEST_END, test=category, target=test_target)
             return 0
         except BaseException as e:
             if validate_exception:
                 res = e
             else:
                 sys.stdout = save
+                _flush_debug(debug_msgs)
                 etype, evalue, etrace = sys.exc_info()
                 ename = evalue.__class__.__name__
                 emsg = str(evalue)
+                emit(CALL_END, target=test_target, error=ename)
                 elineno, eline = get_exception_line(st_module, etrace)
-                output(msgs.get_msg(ename, lang, default="GenericErrorMsg"), Codes.ERROR,
-                    emsg=emsg,
-                    ename=ename
-                )
+                # format_args of the exception may repeat the explicit values
+                format_args = dict(getattr(evalue, "format_args", {}), emsg=emsg, ename=ename)
+                output(msgs.get_msg(ename, lang, default="GenericErrorMsg"), Codes.ERROR, **format_args)
                 output(msgs.get_msg("PrintExcLine", lang), Codes.DEBUG,
                     lineno=elineno, line=eline
                 )
                 test.teardown()
+                emit(CASE_END, index=i, correct=False)
                 continue
 
         # Validating function results
         sys.stdout = save
+        emit(CALL_END, target=test_target)
+        emit(OUTPUT_CAPTURED, length=len(o.content))
+        if not debug_on_fail_only:
+            _flush_debug(debug_msgs)
         if not hide_output:
             output(msgs.get_msg("PrintStudentOutput", lang), Codes.INFO, output=o.content)
 
         try:
             st_out = test.parse(o.content)
         except OutputParseError as e:
+            _flush_debug(debug_msgs)
             output(msgs.get_msg("OutputParseError", lang), Codes.INCORRECT,
                 reason=str(e)
             )
             output(msgs.get_msg("OutputPatternInfo", lang), Codes.INFO)
             test.teardown()
+            emit(CASE_END, index=i, correct=False)
             continue
             
-        output(msgs.get_msg("PrintStudentResult", lang), Codes.DEBUG, 
-            res=test.present_object("res", res),
-            parsed=test.present_object("parsed", st_out),
-            output=o.content
-        )
+        debug_msgs.append((
+            msgs.get_msg("PrintStudentResult", lang),
+            dict(
+                res=LazyPresentation(test.present_object, "res", res),
+                parsed=LazyPresentation(test.present_object, "parsed", st_out),
+                output=o.content
+            )
+        ))
+        if not debug_on_fail_only:
+            _flush_debug(debug_msgs)
 
         # Validate results
         try: 
             test.validate_result(res, st_out, o.content)
+            emit(VALIDATION, correct=True)
             output(msgs.get_msg("CorrectResult", lang), Codes.CORRECT)
         except AssertionError as e:
             # Result was incorrect
-            output(msgs.get_msg(e, lang, "IncorrectResult"), Codes.INCORRECT)
+            emit(VALIDATION, correct=False, reason=str(e))
+            _flush_debug(debug_msgs)
+            output(msgs.get_msg(e, lang, "IncorrectResult"), Codes.INCORRECT, **getattr(e, "format_args", {}))
             output(
                 msgs.get_msg("PrintReference", lang),
                 Codes.DEBUG,
-                ref=test.present_object("ref", test.ref_result)
+                ref=LazyPresentation(test.present_object, "ref", test.ref_result)
             )
 
-            output(msgs.get_msg("AdditionalTests", lang), Codes.INFO)
+            if not test_run.final_failure:
+                output(msgs.get_msg("AdditionalTests", lang), Codes.INFO)
                 
-            # Extra feedback
-            for msg_key, format_args in test.feedback(res, st_out, o.content):
-                output(msgs.get_msg(msg_key, lang), Codes.INFO, **format_args)
+                # Extra feedback
+                for msg_key, format_args in test.feedback(res, st_out, o.content):
+                    output(msgs.get_msg(msg_key, lang), Codes.INFO, **format_args)
 
         if test.output_validator:
             try: 
                 test.validate_output(o.content)
                 output(msgs.get_msg("CorrectMessage", lang), Codes.CORRECT)
             except AssertionError as e:                
+                _flush_debug(debug_msgs)
                 output(msgs.get_msg(e, lang, "IncorrectMessage"), Codes.INCORRECT)
                 output(msgs.get_msg("MessageInfo", lang), Codes.INFO)
                 output(msgs.get_msg("PrintStudentOutput", lang), Codes.INFO, output=o.content)
         
         test.teardown()
+        emit(CASE_END, index=i, correct=not case_failed(test))
         prev_res = res
         prev_out = st_out
     
-    return grader(test_cases)
+    if ordering is not None:
+        ordering.update(test_target, [
+            (ordering.case_key(test, declared[id(test)]), case_failed(test)) for test in ran
+        ])
+        runs = json_output["tests"][-1]["runs"]
+        runs[:] = [run for test, run in sorted(zip(ran, runs), key=lambda pair: declared[id(pair[0])])]
+    
+    if test_run.stopped:
+        output(msgs.get_msg("FailFastStop", lang), Codes.INFO, failed=test_run.failed)
+    
+    if snapshot is not None:
+        snapshot.restore()
+    emit(TEST_END, test=category, target=test_target)
+    return test_run.grade()
@@ -4,7 +4,9 @@ import pysenpai.callbacks.defaults as defaults
 from pysenpai.output import json_output
 from pysenpai.messages import load_messages, Codes
 from pysenpai.output import output
+from pysenpai.checking.testcase import TestRun, case_failed
 from pysenpai.utils.internal import StringOutput, get_exception_line
+from pysenpai.tracing import emit, TEST_START, TEST_END, CASE_START, CASE_END, CALL_START, CALL_END, VALIDATION
 
 class ValueTestCase:
 
@@ -53,7 +55,8 @@ class ValueTestCase:
 def value_test(st_value, test_cases, lang,
                msg_module="pysenpai",
                custom_msgs={},
-               grader=defaults.pass_fail_grader):
+               grader=defaults.pass_fail_grader,
+               fail_fast=0):
 
     msgs = load_messages(lang, "value", module=msg_module)
     msgs.update(custom_msgs)
@@ -64,22 +67,30 @@ def value_test(st_value, test_cases, lang,
     json_output.new_test(
         msgs.get_msg("TargetName", lang)["content"].format(name="")
     )
+    emit(TEST_START, test="value", target="")
 
-    for i, test in enumerate(test_cases):
+    test_run = TestRun(test_cases, grader, fail_fast)
+    for i, test in enumerate(test_run):
         json_output.new_run()
+        emit(CASE_START, index=i, tag=test.tag)
+        emit(CALL_START, target="")
         try:
             res = test.wrap(st_value, None)
         except BaseException:
             etype, evalue, etrace = sys.exc_info()
             ename = evalue.__class__.__name__
             emsg = str(evalue)
+            emit(CALL_END, target="", error=ename)
             output(msgs.get_msg(ename, lang, default="GenericErrorMsg"), Codes.ERROR,
                 emsg=emsg,
                 ename=ename
             )
             test.teardown()
+            emit(CASE_END, index=i, correct=False)
             continue
 
+        emit(CALL_END, target="")
+
         output(msgs.get_msg("PrintStudentResult", lang), Codes.DEBUG,
             res=test.present_object("res", res),
             parsed="",
@@ -88,25 +99,33 @@ def value_test(st_value, test_cases, lang,
 
         try:
             test.validate_result(res, None, None)
+            emit(VALIDATION, correct=True)
             output(msgs.get_msg("CorrectResult", lang), Codes.CORRECT)
         except AssertionError as e:
             # Result was incorrect
-            output(msgs.get_msg(e, lang, "IncorrectResult"), Codes.INCORRECT)
+            emit(VALIDATION, correct=False, reason=str(e))
+            output(msgs.get_msg(e, lang, "IncorrectResult"), Codes.INCORRECT, **getattr(e, "format_args", {}))
             output(
                 msgs.get_msg("PrintReference", lang),
                 Codes.DEBUG,
                 ref=test.present_object("ref", test.ref_result)
             )
 
-            output(msgs.get_msg("AdditionalTests", lang), Codes.INFO)
+            if not test_run.final_failure:
+                output(msgs.get_msg("AdditionalTests", lang), Codes.INFO)
 
-            # Extra feedback
-            for msg_key, format_args in test.feedback(res, None, None):
-                output(msgs.get_msg(msg_key, lang), Codes.INFO, **format_args)
+                # Extra feedback
+                for msg_key, format_args in test.feedback(res, None, None):
+                    output(msgs.get_msg(msg_key, lang), Codes.INFO, **format_args)
 
         test.teardown()
+        emit(CASE_END, index=i, correct=not case_failed(test))
+
+    if test_run.stopped:
+        output(msgs.get_msg("FailFastStop", lang), Codes.INFO, failed=test_run.failed)
 
-    return grader(test_cases)
+    emit(TEST_END, test="value", target="")
+    return test_run.grade()
 
 
 
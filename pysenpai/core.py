@@ -7,10 +7,14 @@ import os.path
 import re
 import sys
 import pysenpai.callbacks.defaults as defaults
-from pysenpai.output import json_output
+from pysenpai.output import json_output, dumps, to_compact
 from pysenpai.messages import load_messages, Codes 
 from pysenpai.output import output
-from pysenpai.utils.internal import FNAME_PAT, CommaSplitAction, StringOutput, get_exception_line
+from pysenpai.utils.cache import DEFAULT_CACHE_DIR, result_cache
+from pysenpai.utils.capture import DEFAULT_CAPACITY, fd_capture
+from pysenpai.utils.imports import submission_finder
+from pysenpai.utils.internal import FNAME_PAT, CommaSplitAction, InputProvider, StringOutput, get_exception_line
+from pysenpai.tracing import emit, TEST_START, TEST_END, CALL_START, CALL_END, OUTPUT_CAPTURED
 
 # expose basic checking interface through this module
 from pysenpai.messages import TranslationDict
@@ -28,9 +32,29 @@ def end():
     
     You can pipe the output to the cli_print script to get a more readable 
     representation when testing checkers in a command line interface.
+    
+    If compact encoding has been enabled with :func:`set_report_encoding`, the
+    document is printed in compact form. If the result cache is in use, the
+    document is either printed from the cache or stored into it. Reports of
+    checkers that ended with an uncaught exception are never stored.
+    
+    If fd capture is active, the document is written into the protected report
+    descriptor and the capture is stopped.
     """
+    
+    if result_cache.hit is not None:
+        report = result_cache.hit
+    elif json_output.compact_encoding:
+        report = dumps(to_compact(json_output), json_output.fast_serializer)
+    else:
+        report = dumps(json_output, json_output.fast_serializer)
         
-    print(json.dumps(json_output))
+    if fd_capture.active:
+        fd_capture.write_report(report)
+        fd_capture.stop()
+    else:
+        print(report)
+    result_cache.store(report)
     
 atexit.register(end)
 
@@ -46,6 +70,86 @@ def init_test(name, max_score):
 def set_result(correct, score):
     json_output.update_result(correct, score)
 
+def set_report_limits(max_size=None, deduplicate=False):
+    """
+    Limits the size of the evaluation report. If *max_size* is given, message
+    contents are truncated once their total size exceeds it. If *deduplicate* is
+    True, identical long values (typically student output) are stored only once
+    per test run. See :meth:`~output.JsonOutput.set_size_budget` and
+    :meth:`~output.JsonOutput.set_deduplication`.
+    """
+    
+    json_output.set_size_budget(max_size)
+    json_output.set_deduplication(deduplicate)
+
+def enable_fd_capture(capacity=DEFAULT_CAPACITY):
+    """
+    enable_fd_capture([capacity=262144])
+    
+    Enables file descriptor level output capture for the rest of the checker run.
+    Anything written into stdout and stderr, including writes that bypass 
+    sys.stdout such as os.write, C extensions and subprocesses, is captured into
+    ring buffers that keep the last *capacity* bytes of each. Student output 
+    therefore can no longer corrupt the evaluation report, which is written into
+    a separate descriptor by :func:`end`. 
+    
+    Note that the checker's own prints and tracebacks are captured too, so this 
+    should be enabled only after the checker has been debugged. 
+    """
+    
+    fd_capture.start(capacity)
+
+def keep_bytecode_in_memory():
+    """
+    Makes the submission import finder keep compiled bytecode of submitted files
+    in memory instead of writing __pycache__ folders into the submission 
+    directories. Call this before :func:`load_module`.
+    """
+    
+    submission_finder.keep_bytecode_in_memory()
+
+def enable_result_cache(files, lang, path=DEFAULT_CACHE_DIR):
+    """
+    enable_result_cache(files, lang[, path=".pysenpai_cache"])
+    
+    Enables the verdict cache for this checker run. Call this right after 
+    :func:`parse_command` with the files and language it returned. If the same
+    submission has been evaluated before with the same checker, command line
+    arguments, message catalogs and PySenpai version, the stored report is
+    printed and the checker exits immediately. Otherwise the report is stored
+    into the cache at *path* when the checker exits normally. Helper modules
+    that the checker has imported from its own directory by this point are
+    part of the checker.
+    
+    Checkers whose results depend on randomized test vectors without a fixed
+    seed must not enable the cache, or need to call 
+    :func:`disable_result_cache`. The cache is also disabled by the --no-cache
+    command line option. 
+    """
+    
+    if result_cache.enable(files, lang, path):
+        sys.exit()
+
+def disable_result_cache():
+    """
+    Disables the verdict cache for this run, also when called after 
+    :func:`enable_result_cache` - the report will not be stored.
+    """
+    
+    result_cache.disable()
+
+def set_report_encoding(compact=False, fast=False):
+    """
+    Selects the encoding of the evaluation report. With *compact* set to True
+    the report is printed using short keys and without empty triggers and hints
+    (see :func:`~output.to_compact`). Use :func:`~output.from_compact` to get the
+    standard document back. With *fast* set to True the report is serialized 
+    with orjson if it's installed (see :func:`~output.dumps`).
+    """
+    
+    json_output.set_compact_encoding(compact)
+    json_output.set_fast_serializer(fast)
+
 
 def parse_command():
     """
@@ -58,13 +162,15 @@ def parse_command():
     * -q --questions : enabled question types (integers) as comma-separated string
     * -c --check : check a routine exercise answer (and generate another)
     * -r --request : request new routine exercise instance
+    * --no-cache : disable the verdict cache (see :func:`enable_result_cache`)
     
     Everything else is considered as files to test.
 
     Returns all files' basenames as a list and the language as a separate value.
     
-    If the files are located in subfolders, adds the folders to the path. This makes them
-    importable later.
+    The files are registered to the submission import finder (see 
+    :mod:`~pysenpai.utils.imports`), which makes them importable later by module name 
+    regardless of the folder they are in.
     
     When writing checkers, this is typically the first function to call. 
     """
@@ -109,14 +215,23 @@ def parse_command():
         help="target amount of correct answers for routine exercise"
     )
     
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        dest="no_cache",
+        default=False,
+        help="disable the verdict cache"
+    )
+    
     args = parser.parse_args()
+    if args.no_cache:
+        result_cache.disable()
     if args.request or args.check:
         with open(args.files[0]) as s:
             return json.load(s), args
 
     for i, path in enumerate(args.files):
-        if os.path.dirname(path):
-            sys.path.insert(0, os.path.dirname(path))
+        submission_finder.register(path)
         #args.files[i] = os.path.basename(path)
     
     return args.files, args.lang    
@@ -141,7 +256,7 @@ def load_module(module_path,
     * *custom_msgs* - a TranslationDict object that includes additions/overrides 
       to the default import messages
     * *inputs* - input vector to be given to the program; inputs are automatically joined 
-      by newlines and made into a StringIO object that replaces standard input. When 
+      by newlines and made into an InputProvider object that replaces standard input. When 
       calling this function you need to provide inputs that allow the program to execute
       without errors. 
     * *hide_output* - a flag to hide or show output, by default output is hidden
@@ -152,7 +267,8 @@ def load_module(module_path,
        
     Before attempting to import the student module, the function checks whether the 
     filename is a proper Python module name. None is returned if the filename is
-    invalid. This also happens if the module has the same name as a Python library module.
+    invalid. This also happens if the module has the same name as a Python library module,
+    or as a module of an installed library.
     
     If importing the student module results in an exception, the exception's name is
     looked up from the message dictionary and the corresponding error message is
@@ -165,7 +281,6 @@ def load_module(module_path,
     Otherwise the module object is returned.    
     """
 
-    save = sys.stdout
     msgs = load_messages(lang, "import")
     msgs.update(custom_msgs)
     
@@ -173,28 +288,31 @@ def load_module(module_path,
     
     json_output.new_test(msgs.get_msg("LoadingModule", lang)["content"].format(name=module_name))
     json_output.new_run()
+    emit(TEST_START, test="import", target=module_name)
     
     if not module_name.endswith(".py"):
         output(msgs.get_msg("MissingFileExtension", lang), Codes.ERROR)
+        emit(TEST_END, test="import", target=module_name)
         return None
 
     name = module_name.rsplit(".py", 1)[0]
     if not FNAME_PAT.fullmatch(name):    
         output(msgs.get_msg("BadModuleName", lang), Codes.ERROR, name=module_name)
+        emit(TEST_END, test="import", target=module_name)
         return None
         
     pyver = "{}.{}".format(sys.version_info.major, sys.version_info.minor)
         
     if name in sys.stdlib_module_names:
         output(msgs.get_msg("SystemModuleName", lang), Codes.ERROR, name=module_name)
+        emit(TEST_END, test="import", target=module_name)
         return None
         
-    if inputs:
-        sys.stdin = io.StringIO("\n".join([str(i) for i in inputs]))
+    if not skip_name_check and not submission_finder.register(module_path):
+        output(msgs.get_msg("LibraryModuleName", lang), Codes.ERROR, name=module_name)
+        emit(TEST_END, test="import", target=module_name)
+        return None
         
-    o = StringOutput()
-    sys.stdout = o
-
     # Skip the if __name__ == "__main__": check by replacing the line with if True:
     # This solution seems very janky but there probably isn't a better one
     if skip_name_check:
@@ -208,22 +326,80 @@ def load_module(module_path,
         with open(f"{name}.py", "w", encoding="utf-8") as target:
             for line in lines:
                 target.write(line)
+        if not submission_finder.register(f"{name}.py"):
+            output(msgs.get_msg("LibraryModuleName", lang), Codes.ERROR, name=module_name)
+            emit(TEST_END, test="import", target=module_name)
+            return None
+
+    st_module = _execute_module(
+        lambda: importlib.import_module(name), name, msgs, lang, 
+        inputs, hide_output, allow_output, presenter
+    )
+    emit(TEST_END, test="import", target=module_name)
+    return st_module
+
+def load_code_module(name, source, 
+                     lang="en", 
+                     custom_msgs={}, 
+                     inputs=[], 
+                     hide_output=True, 
+                     allow_output=True, 
+                     presenter=defaults.default_input_presenter):
+    """
+    load_code_module(name, source[, lang="en"][, kwarg1][, ...]) -> CodeModule
+    
+    Like :func:`load_module`, but the module is made from *source* in memory as
+    a :class:`~pysenpai.utils.generation.CodeModule` called *name* and executed
+    once. The output is captured and errors, including syntax errors, are
+    reported with the same messages as in load_module, in which case None is
+    returned. The other arguments are the same as in load_module.
+    """
+    
+    from pysenpai.utils.generation import CodeModule
+    
+    msgs = load_messages(lang, "import")
+    msgs.update(custom_msgs)
+    
+    json_output.new_test(msgs.get_msg("LoadingModule", lang)["content"].format(name=name))
+    json_output.new_run()
+    emit(TEST_START, test="import", target=name)
+    
+    st_module = _execute_module(
+        lambda: CodeModule(name, source).execute(), name, msgs, lang, 
+        inputs, hide_output, allow_output, presenter
+    )
+    emit(TEST_END, test="import", target=name)
+    return st_module
+
+def _execute_module(execute, name, msgs, lang, inputs, hide_output, allow_output, presenter):
+    # runs the student module with captured output and reports errors
+    save = sys.stdout
+    if inputs:
+        sys.stdin = InputProvider(inputs)
+        
+    o = StringOutput()
+    sys.stdout = o
 
+    emit(CALL_START, target=name)
     try:        
-        st_module = importlib.import_module(name)
+        st_module = execute()
     except:
         sys.stdout = save
         etype, evalue, etrace = sys.exc_info()
         ename = evalue.__class__.__name__
         emsg = str(evalue)
+        emit(CALL_END, target=name, error=ename)
         #elineno, eline = get_exception_line(st_module, etrace)
-        output(msgs.get_msg(ename, lang, default="GenericErrorMsg"), Codes.ERROR, 
+        format_args = dict(getattr(evalue, "format_args", {}),
             ename=ename, emsg=emsg, inputs=presenter(inputs)
         )
+        output(msgs.get_msg(ename, lang, default="GenericErrorMsg"), Codes.ERROR, **format_args)
         if inputs:
             output(msgs.get_msg("PrintInputVector", lang), Codes.DEBUG, inputs=presenter(inputs))
     else:
         sys.stdout = save
+        emit(CALL_END, target=name)
+        emit(OUTPUT_CAPTURED, length=len(o.content))
         if not allow_output and o.content:
             output(msgs.get_msg("DisallowedOutput", lang), Codes.ERROR, output=o.content)
         elif not hide_output:
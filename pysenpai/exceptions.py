@@ -46,4 +46,31 @@ class NotCallable(Exception):
     def __init__(self, name):
         super().__init__(self)
         self.callable_name = name
-        
\ No newline at end of file
+        
+
+class ValidationFailure(AssertionError):
+    """
+    This exception can be raised by validators instead of a plain assert when
+    the failure message needs more context than its message key. The
+    exception's string form is the message key, so it is handled exactly like
+    a failed assert in the test functions. Any keyword arguments given as
+    *format_args* are made available to format specifiers inside the message.
+    """
+
+    def __init__(self, msg_key, **format_args):
+        super().__init__(msg_key)
+        self.format_args = format_args
+
+
+class InputExhausted(EOFError):
+    """
+    Raised by :class:`~pysenpai.utils.internal.InputProvider` when the student
+    code asks for more input than the test provides. The test functions show 
+    the message that corresponds to this exception's name instead of the generic
+    EOFError message. The number of inputs that were read is available as 
+    *consumed* inside the message.
+    """
+    
+    def __init__(self, consumed):
+        super().__init__("all {} inputs have already been read".format(consumed))
+        self.format_args = {"consumed": consumed}
@@ -1,3 +1,31 @@
+import json
+import re
+
+from pysenpai.messages import Codes
+from pysenpai.utils.internal import LazyPresentation
+from pysenpai.tracing import emit, MESSAGE
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Format arguments at least this long are stored as blobs when deduplication
+# is enabled
+BLOB_MIN_LENGTH = 1024
+BLOB_REF = "\x00blob:{}\x00"
+BLOB_REF_PAT = re.compile("\x00blob:([0-9]+)\x00")
+TRUNCATION_NOTE = "\n[...]"
+
+# Messages with these flags are never dropped when the size budget runs out,
+# only truncated to at least this many characters
+ESSENTIAL_FLAGS = (Codes.CORRECT, Codes.INCORRECT, Codes.ERROR)
+ESSENTIAL_MIN_LENGTH = 200
+
+# Marker for documents in the compact encoding, see to_compact
+COMPACT_ENCODING = "compact"
+
+
 class JsonOutput(dict):
     """
     This class represents the JSON output of PySenpai. It is a dictionary with
@@ -21,6 +49,12 @@ class JsonOutput(dict):
             "score": 0,
             "max": 0
         })
+        self.size_budget = None
+        self.deduplicate = False
+        self.compact_encoding = False
+        self.fast_serializer = False
+        self._used = 0
+        self._blob_ids = {}
         
     def set_tester(self, name):
         """
@@ -34,6 +68,90 @@ class JsonOutput(dict):
     def set_max_score(self, value):
         self.__getitem__("result")["max"] = value
         
+    def set_size_budget(self, max_size):
+        """
+        Sets the total size budget of the document's message contents in
+        characters (None means unlimited). When the budget runs out, further
+        messages are truncated. Messages that are not CORRECT, INCORRECT or
+        ERROR are dropped entirely once there is no budget left. The document
+        is marked with "truncated": true if anything was cut.
+        """
+        
+        self.size_budget = max_size
+        
+    def set_deduplication(self, enabled):
+        """
+        If enabled, long string values given to messages are stored once per
+        run in the run's "blobs" dictionary and messages refer to them with
+        a reference token. Consumers need to call :func:`expand_blobs` to get
+        the standard document back.
+        """
+        
+        self.deduplicate = enabled
+        
+    def set_compact_encoding(self, enabled):
+        """
+        If enabled, the document is printed in the compact encoding produced
+        by :func:`to_compact` when the checker exits. 
+        """
+        
+        self.compact_encoding = enabled
+        
+    def set_fast_serializer(self, enabled):
+        """
+        If enabled, the document is serialized with orjson when it's installed.
+        See :func:`dumps` for the differences to the standard serializer.
+        """
+        
+        self.fast_serializer = enabled
+        
+    def _fit(self, text, essential):
+        if self.size_budget is None:
+            return text
+        
+        remaining = self.size_budget - self._used
+        if len(text) <= remaining:
+            self._used += len(text)
+            return text
+        
+        if essential:
+            keep = max(remaining, ESSENTIAL_MIN_LENGTH)
+            if len(text) <= keep:
+                self._used += len(text)
+                return text
+        elif remaining > 0:
+            keep = remaining
+        else:
+            self.__setitem__("truncated", True)
+            return None
+        self.__setitem__("truncated", True)
+        for match in BLOB_REF_PAT.finditer(text):
+            if match.start() >= keep:
+                break
+            if keep < match.end():
+                # blob references are never cut in half
+                keep = match.start()
+                break
+        self._used += keep
+        return text[:keep] + TRUNCATION_NOTE
+        
+    def store_blob(self, text, essential=False):
+        """
+        Stores *text* in the current run's blobs unless it's already there, and
+        returns the reference token that replaces it in message content. The
+        blob is fitted into the size budget like the content of an *essential*
+        message if the message that first refers to it is essential.
+        """
+        
+        try:
+            key = self._blob_ids[text]
+        except KeyError:
+            key = str(len(self._blob_ids))
+            self._blob_ids[text] = key
+            run = self.__getitem__("tests")[-1]["runs"][-1]
+            run.setdefault("blobs", {})[key] = self._fit(text, essential) or TRUNCATION_NOTE
+        return BLOB_REF.format(key)
+        
     def new_test(self, title):
         """
         This is called when a new test begins, i.e. when one of the test 
@@ -57,6 +175,7 @@ class JsonOutput(dict):
         self.__getitem__("tests")[-1]["runs"].append({
             "output": []
         })
+        self._blob_ids = {}
         
     def new_msg(self, content, flag, triggers=[], hints=[]):
         """
@@ -66,6 +185,10 @@ class JsonOutput(dict):
         are explained in more detail under :ref:`output-messages`. 
         """
         
+        content = self._fit(content, flag in ESSENTIAL_FLAGS)
+        if content is None:
+            return
+        
         self.__getitem__("tests")[-1]["runs"][-1]["output"].append({
             "msg": content,
             "flag": flag,
@@ -78,20 +201,23 @@ class JsonOutput(dict):
         result["correct"] = correct
         result["score"] = score
         
-    def grind_params(self, template, var_names, values, question):
+    def grind_params(self, template, var_names, values, question, stats=None):
         """
         Adds grind parameters to the output. These are used only when the checker
         is a grind type checker and is used to generate a new task instance. 
+        Session statistics can be included as *stats* so that they are passed
+        back to the checker with the next answer.
         """
         
-        self.__setitem__("grind_params", 
-            {
-                "template": template,
-                "variables": var_names,
-                "values": values, 
-                "question": question
-            }
-        )
+        params = {
+            "template": template,
+            "variables": var_names,
+            "values": values, 
+            "question": question
+        }
+        if stats is not None:
+            params["stats"] = stats
+        self.__setitem__("grind_params", params)
 
     def wrap_to(self, wrapper_dict, keyname):
         """
@@ -112,6 +238,118 @@ class JsonOutput(dict):
         self.update(wrapper_dict)
 
 
+class _BlobArgument(object):
+    """
+    Wraps a format argument so that it's stored as a blob when formatted, if
+    the formatted value is long enough. *essential* tells whether the message
+    being formatted is essential.
+    """
+    
+    def __init__(self, value, essential=False):
+        self.value = value
+        self.essential = essential
+        
+    def __format__(self, spec):
+        text = format(self.value, spec)
+        if len(text) < BLOB_MIN_LENGTH:
+            return text
+        return json_output.store_blob(text, self.essential)
+
+
+def expand_blobs(document):
+    """
+    Replaces blob reference tokens in the messages of a *document* with the
+    blob contents and removes the blobs, turning a deduplicated document back
+    into the standard form. The document is modified in place and returned.
+    """
+    
+    for test in document.get("tests", []):
+        for run in test["runs"]:
+            blobs = run.pop("blobs", {})
+            if not blobs:
+                continue
+            for msg in run["output"]:
+                msg["msg"] = BLOB_REF_PAT.sub(lambda m: blobs.get(m.group(1), ""), msg["msg"])
+    return document
+
+
+def _compact_msg(msg):
+    compact = {"m": msg["msg"], "f": msg["flag"]}
+    if msg.get("triggers"):
+        compact["t"] = msg["triggers"]
+    if msg.get("hints"):
+        compact["h"] = msg["hints"]
+    return compact
+
+
+def to_compact(document):
+    """
+    Returns the compact encoding of a *document*. In the compact encoding
+    message keys are shortened to their first letter, empty triggers and hints
+    are omitted and the output key of runs becomes "o". The document is marked
+    with "encoding": "compact". Everything else is unchanged.
+    """
+    
+    compact = dict(document)
+    compact["encoding"] = COMPACT_ENCODING
+    compact["tests"] = []
+    for test in document.get("tests", []):
+        runs = []
+        for run in test["runs"]:
+            compact_run = {key: value for key, value in run.items() if key != "output"}
+            compact_run["o"] = [_compact_msg(msg) for msg in run["output"]]
+            runs.append(compact_run)
+        compact["tests"].append(dict(test, runs=runs))
+    return compact
+
+
+def from_compact(document):
+    """
+    Converts a compact encoded *document* back into the standard document
+    format. Documents that are not compact encoded are returned as is.
+    """
+    
+    if document.get("encoding") != COMPACT_ENCODING:
+        return document
+    
+    standard = {key: value for key, value in document.items() if key != "encoding"}
+    standard["tests"] = []
+    for test in document.get("tests", []):
+        runs = []
+        for run in test["runs"]:
+            standard_run = {key: value for key, value in run.items() if key != "o"}
+            standard_run["output"] = [
+                {
+                    "msg": msg["m"],
+                    "flag": msg["f"],
+                    "triggers": msg.get("t", []),
+                    "hints": msg.get("h", [])
+                }
+                for msg in run["o"]
+            ]
+            runs.append(standard_run)
+        standard["tests"].append(dict(test, runs=runs))
+    return standard
+
+
+def dumps(document, fast=False):
+    """
+    Serializes a *document* into a JSON string with the standard library json
+    module. If *fast* is True and orjson is installed, orjson is used instead.
+    Its output differs slightly: non-ASCII characters are not escaped and NaN
+    and infinities become null. Documents that orjson can't serialize, e.g.
+    ones with non-string keys or integers over 64 bits, fall back to the json
+    module.
+    """
+    
+    if fast and orjson is not None:
+        try:
+            return orjson.dumps(document).decode("utf-8")
+        except (TypeError, orjson.JSONEncodeError):
+            pass
+    return json.dumps(document)
+
+
 def output(msg, flag, **format_args):
     """
     Outputs message into the JSON document. Just a shorthand that makes the
@@ -119,11 +357,17 @@ def output(msg, flag, **format_args):
     """
     
     if msg["content"]:
+        if json_output.deduplicate:
+            essential = flag in ESSENTIAL_FLAGS
+            for key, value in format_args.items():
+                if isinstance(value, (str, LazyPresentation)):
+                    format_args[key] = _BlobArgument(value, essential)
         json_output.new_msg(
             msg["content"].format(**format_args), 
             flag,
             msg.get("triggers", []),
             msg.get("hints", [])
         )
+        emit(MESSAGE, flag=flag)
 
 json_output = JsonOutput()
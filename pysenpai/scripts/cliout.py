@@ -1,5 +1,6 @@
 import json
 import sys
+from pysenpai.output import expand_blobs, from_compact
 
 def read_lines():
     lines = sys.stdin.read().split("\n")
@@ -11,9 +12,10 @@ def read_lines():
         else:
             break
     
-    return log
+    return from_compact(log)
 
 def print_log(log):
+    expand_blobs(log)
     for test in log["tests"]:
         print(test["title"])
         for i, run in enumerate(test["runs"], start=1):
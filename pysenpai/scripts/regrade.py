@@ -0,0 +1,235 @@
+import argparse
+import concurrent.futures
+import csv
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+
+from pysenpai.output import from_compact
+
+CSV_FIELDS = ["submission", "correct", "score", "max", "seconds", "returncode", "error"]
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Regrade stored submissions with a checker"
+    )
+    parser.add_argument("checker", help="checker file to run")
+    parser.add_argument(
+        "submissions",
+        help="directory of submissions, or a manifest file listing one submission path per line"
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of checkers to run at the same time"
+    )
+    parser.add_argument(
+        "-o", "--output",
+        default="regrade.jsonl",
+        help="results file, CSV if the name ends with .csv, JSONL otherwise"
+    )
+    parser.add_argument(
+        "-p", "--pattern",
+        default=".py",
+        help="file name ending of submissions when reading a directory"
+    )
+    parser.add_argument(
+        "-l", "--lang",
+        default="en",
+        help="locale to run the checker with"
+    )
+    parser.add_argument(
+        "-t", "--timeout",
+        type=float,
+        default=None,
+        help="time limit for a single checker run in seconds"
+    )
+    parser.add_argument(
+        "--prelint",
+        action="store_true",
+        help="lint all submissions in one PyLint session before grading and let pylint_test use the results"
+    )
+    parser.add_argument(
+        "--lint-options",
+        default="",
+        help="PyLint options for --prelint, must match the checker's extra_options or the results are not used"
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_false",
+        dest="resume",
+        help="regrade everything even if the results file has earlier results"
+    )
+    return parser.parse_args()
+
+def list_submissions(source, pattern):
+    """
+    Lists submission paths from a directory (recursively, files ending with
+    *pattern*) or from a manifest file.
+    """
+
+    if os.path.isdir(source):
+        paths = []
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith(pattern):
+                    paths.append(os.path.abspath(os.path.join(root, name)))
+        return paths
+
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, encoding="utf-8") as manifest:
+        return [
+            os.path.join(base, line.strip()) for line in manifest
+            if line.strip() and not line.startswith("#")
+        ]
+
+def read_done(path):
+    """
+    Reads submissions that already have a result in the results file at *path*.
+    """
+
+    if not os.path.exists(path):
+        return set()
+
+    with open(path, encoding="utf-8", newline="") as results:
+        if path.endswith(".csv"):
+            return {row["submission"] for row in csv.DictReader(results)}
+        done = set()
+        for line in results:
+            try:
+                done.add(json.loads(line)["submission"])
+            except (json.JSONDecodeError, KeyError):
+                # partially written line from an interrupted run
+                pass
+        return done
+
+def grade(checker, submission, lang, timeout):
+    """
+    Runs *checker* for one *submission* in a child interpreter with its own
+    temporary working directory, and returns the result record.
+    """
+
+    record = {
+        "submission": submission,
+        "correct": False,
+        "score": 0,
+        "max": 0,
+        "seconds": 0.0,
+        "returncode": None,
+        "error": ""
+    }
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="pysen-regrade-") as workdir:
+        try:
+            proc = subprocess.run(
+                [sys.executable, checker, submission, "-l", lang],
+                cwd=workdir,
+                stdin=subprocess.DEVNULL,
+                capture_output=True,
+                text=True,
+                timeout=timeout
+            )
+        except subprocess.TimeoutExpired:
+            record["error"] = "timeout"
+        else:
+            record["returncode"] = proc.returncode
+            try:
+                report = from_compact(json.loads(proc.stdout.strip().splitlines()[-1]))
+                record.update(
+                    correct=report["result"]["correct"],
+                    score=report["result"]["score"],
+                    max=report["result"]["max"]
+                )
+            except (IndexError, json.JSONDecodeError, KeyError):
+                stderr_lines = proc.stderr.strip().splitlines()
+                record["error"] = stderr_lines[-1] if stderr_lines else "no report"
+
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+def main():
+    args = parse_args()
+    checker = os.path.abspath(args.checker)
+    submissions = list_submissions(args.submissions, args.pattern)
+    done = read_done(args.output) if args.resume else set()
+    pending = [path for path in submissions if path not in done]
+
+    print(
+        f"{len(submissions)} submissions, {len(submissions) - len(pending)} already graded",
+        file=sys.stderr
+    )
+
+    lint_path = None
+    if args.prelint and pending:
+        from pysenpai.checking.lint import LINT_RESULTS_ENV, lint_many
+
+        lint_start = time.perf_counter()
+        # checkers run in empty working directories, so PyLint's configuration
+        # discovery must start from one as well
+        with tempfile.TemporaryDirectory(prefix="pysen-regrade-") as lint_dir:
+            lint_results = lint_many(
+                pending, shlex.split(args.lint_options), jobs=args.jobs, directory=lint_dir
+            )
+        lint_file = tempfile.NamedTemporaryFile(
+            prefix="pysen-regrade-lint-", suffix=".json", delete=False
+        )
+        lint_file.close()
+        lint_path = lint_file.name
+        lint_results.save(lint_path)
+        os.environ[LINT_RESULTS_ENV] = lint_path
+        print("Linted in {:.1f} s".format(time.perf_counter() - lint_start), file=sys.stderr)
+
+    is_csv = args.output.endswith(".csv")
+    mode = "a" if args.resume else "w"
+    write_header = is_csv and not (
+        args.resume and os.path.exists(args.output) and os.path.getsize(args.output)
+    )
+
+    totals = {"graded": 0, "correct": 0, "errors": 0}
+    start = time.perf_counter()
+    with open(args.output, mode, encoding="utf-8", newline="") as results:
+        if is_csv:
+            writer = csv.DictWriter(results, fieldnames=CSV_FIELDS)
+            if write_header:
+                writer.writeheader()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as pool:
+            futures = [
+                pool.submit(grade, checker, path, args.lang, args.timeout) for path in pending
+            ]
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    record = future.result()
+                    if is_csv:
+                        writer.writerow(record)
+                    else:
+                        results.write(json.dumps(record) + "\n")
+                    results.flush()
+                    totals["graded"] += 1
+                    totals["correct"] += int(bool(record["correct"]))
+                    totals["errors"] += int(bool(record["error"]))
+            except KeyboardInterrupt:
+                for future in futures:
+                    future.cancel()
+                print("Interrupted, run again to resume", file=sys.stderr)
+
+    if lint_path:
+        os.remove(lint_path)
+
+    elapsed = time.perf_counter() - start
+    print(
+        "Graded: {graded}, correct: {correct}, errors: {errors}".format(**totals),
+        file=sys.stderr
+    )
+    print(
+        "Time: {:.1f} s, {:.2f} submissions / s".format(
+            elapsed, totals["graded"] / elapsed if elapsed else 0
+        ),
+        file=sys.stderr
+    )
@@ -0,0 +1,159 @@
+"""
+Tracing hooks for observing checker runs. Test functions emit events at key
+points of the test (see the event name constants below) and listeners added
+with :func:`add_listener` receive them. When there are no listeners, emitting
+an event costs one function call.
+
+Listeners are called as listener(event, timestamp, data) where timestamp is
+from :func:`time.perf_counter` and data is a dictionary of event specific
+values. Events that come in start/end pairs can be turned into timing spans
+with :class:`SpanRecorder`, and the recorded spans can be viewed in a trace
+viewer after converting them with :func:`export_chrome_trace`.
+"""
+
+import atexit
+import json
+import time
+
+TEST_START = "test_start"
+TEST_END = "test_end"
+CASE_START = "case_start"
+CASE_END = "case_end"
+CALL_START = "call_start"
+CALL_END = "call_end"
+OUTPUT_CAPTURED = "output_captured"
+VALIDATION = "validation"
+MESSAGE = "message"
+
+SPAN_EVENTS = {
+    TEST_START: ("test", True),
+    TEST_END: ("test", False),
+    CASE_START: ("case", True),
+    CASE_END: ("case", False),
+    CALL_START: ("call", True),
+    CALL_END: ("call", False),
+}
+
+_listeners = []
+
+
+def add_listener(listener, events=None):
+    """
+    Adds a *listener* that is called for every emitted event, or only for the
+    event names in *events* if given.
+    """
+
+    _listeners.append((listener, frozenset(events) if events else None))
+
+def remove_listener(listener):
+    _listeners[:] = [(l, events) for l, events in _listeners if l is not listener]
+
+def emit(event, **data):
+    """
+    Sends *event* with keyword arguments as its data to all listeners.
+    """
+
+    if not _listeners:
+        return
+    timestamp = time.perf_counter()
+    for listener, events in _listeners:
+        if events is None or event in events:
+            listener(event, timestamp, data)
+
+
+class SpanRecorder(object):
+    """
+    Listener that writes timing records into a JSON lines file at *path*. Start
+    and end events of tests, cases and student calls become span records with
+    a start time and duration in seconds, other events become instant records.
+    An end event also ends the spans nested in the ended one, and spans that
+    are still open when the recorder is closed end at that point.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "w", encoding="utf-8")
+        self.stack = []
+        self.origin = time.perf_counter()
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, default=str) + "\n")
+
+    def _end(self, timestamp):
+        name, start, data = self.stack.pop()
+        self._write({
+            "name": name,
+            "ts": start - self.origin,
+            "dur": timestamp - start,
+            "args": data
+        })
+
+    def __call__(self, event, timestamp, data):
+        try:
+            name, starting = SPAN_EVENTS[event]
+        except KeyError:
+            self._write({"name": event, "ts": timestamp - self.origin, "args": data})
+            return
+
+        if starting:
+            self.stack.append((name, timestamp, data))
+            return
+
+        if not any(open_name == name for open_name, start, open_data in self.stack):
+            return
+        while self.stack:
+            ended = self.stack[-1][0]
+            self._end(timestamp)
+            if ended == name:
+                break
+
+    def close(self):
+        if self.file.closed:
+            return
+        timestamp = time.perf_counter()
+        while self.stack:
+            self._end(timestamp)
+        self.file.close()
+
+
+def record_spans(path="pysenpai_trace.jsonl"):
+    """
+    Starts recording timing records into *path* using :class:`SpanRecorder`.
+    The file is closed automatically when the checker exits. Returns the
+    recorder.
+    """
+
+    recorder = SpanRecorder(path)
+    add_listener(recorder)
+    atexit.register(recorder.close)
+    return recorder
+
+def export_chrome_trace(records_path, trace_path):
+    """
+    Converts a timing records file written by :class:`SpanRecorder` into the
+    Chrome trace event format, which can be opened in trace viewers such as
+    chrome://tracing or Perfetto.
+    """
+
+    events = []
+    with open(records_path, encoding="utf-8") as records:
+        for line in records:
+            record = json.loads(line)
+            event = {
+                "name": record["args"].get("target") or record["name"],
+                "cat": record["name"],
+                "ts": record["ts"] * 1e6,
+                "pid": 1,
+                "tid": 1,
+                "args": record["args"],
+            }
+            if "dur" in record:
+                event["ph"] = "X"
+                event["dur"] = record["dur"] * 1e6
+            else:
+                event["ph"] = "i"
+                event["s"] = "t"
+            events.append(event)
+
+    with open(trace_path, "w", encoding="utf-8") as trace:
+        json.dump({"traceEvents": events}, trace)
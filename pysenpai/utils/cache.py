@@ -0,0 +1,163 @@
+"""
+This module implements the optional verdict cache. Evaluation reports are
+stored under a key that is computed from everything that can affect the
+report: the submitted files, the checker source and its helper modules, the
+command line arguments, PySenpai's message catalogs and the PySenpai version. When the same key is seen again the stored report
+can be returned without running any tests.
+"""
+
+import hashlib
+import os
+import sys
+import tempfile
+from importlib import metadata, resources
+
+DEFAULT_CACHE_DIR = ".pysenpai_cache"
+
+
+def _version():
+    try:
+        return metadata.version("PySenpai")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+def _hash_file(digest, path):
+    digest.update(os.path.basename(path).encode("utf-8"))
+    with open(path, "rb") as source:
+        for chunk in iter(lambda: source.read(65536), b""):
+            digest.update(chunk)
+
+def checker_dependencies(checker, files=()):
+    """
+    Returns the source files of the modules that have been imported from the
+    *checker*'s directory or its subdirectories, excluding the checker itself
+    and the submitted *files*. These are the checker's own helper modules.
+    """
+
+    base = os.path.dirname(os.path.abspath(checker))
+    excluded = {os.path.abspath(path) for path in files}
+    excluded.add(os.path.abspath(checker))
+    dependencies = set()
+    for module in list(sys.modules.values()):
+        path = getattr(module, "__file__", None)
+        if not path or not path.endswith(".py"):
+            continue
+        path = os.path.abspath(path)
+        if path.startswith(base + os.sep) and path not in excluded and os.path.exists(path):
+            dependencies.add(path)
+    return sorted(dependencies)
+
+def compute_key(files, lang, checker=None, args=None):
+    """
+    compute_key(files, lang[, checker=None][, args=None]) -> str
+
+    Computes the cache key for a checker run. The key is a SHA-256 hash of the
+    PySenpai version, *lang*, the message catalogs, the *checker* source file
+    (the __main__ module by default), the helper modules it has imported from
+    its own directory (see :func:`checker_dependencies`), the command line
+    arguments *args* (sys.argv without the file names by default) and the
+    names and contents of the submitted *files*.
+    """
+
+    digest = hashlib.sha256()
+    digest.update(_version().encode("utf-8"))
+    digest.update(lang.encode("utf-8"))
+
+    with resources.as_file(resources.files("pysenpai").joinpath("msg_data")) as msg_path:
+        for root, dirs, names in os.walk(msg_path):
+            dirs.sort()
+            for name in sorted(names):
+                _hash_file(digest, os.path.join(root, name))
+
+    if checker is None:
+        checker = getattr(sys.modules["__main__"], "__file__", None)
+    if checker:
+        _hash_file(digest, checker)
+        for path in checker_dependencies(checker, files):
+            digest.update(os.path.relpath(path, os.path.dirname(os.path.abspath(checker))).encode("utf-8"))
+            _hash_file(digest, path)
+
+    if args is None:
+        args = [arg for arg in sys.argv[1:] if arg not in files]
+    for arg in args:
+        digest.update(b"\x00" + arg.encode("utf-8"))
+
+    for path in files:
+        _hash_file(digest, path)
+
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    """
+    The verdict cache of the running checker. It's managed through
+    :func:`~core.enable_result_cache` and :func:`~core.disable_result_cache`
+    and checkers should not need to use it directly.
+    """
+
+    def __init__(self):
+        self.path = None
+        self.key = None
+        self.hit = None
+        self.disabled = False
+        self.crashed = False
+
+    def _entry_path(self):
+        return os.path.join(self.path, self.key[:2], self.key + ".json")
+
+    def enable(self, files, lang, path=DEFAULT_CACHE_DIR, checker=None):
+        """
+        Computes the key for this run and looks it up. Returns True if a stored
+        report was found. Does nothing if the cache has been disabled.
+        """
+
+        if self.disabled:
+            return False
+
+        self.path = path
+        self.key = compute_key(files, lang, checker)
+        self._watch_crashes()
+        try:
+            with open(self._entry_path(), encoding="utf-8") as entry:
+                self.hit = entry.read()
+        except OSError:
+            self.hit = None
+        return self.hit is not None
+
+    def _watch_crashes(self):
+        # uncaught exceptions end the checker with a partial report, which
+        # must not be stored
+        previous = sys.excepthook
+
+        def excepthook(*exc_info):
+            self.crashed = True
+            previous(*exc_info)
+
+        sys.excepthook = excepthook
+
+    def disable(self):
+        """
+        Disables the cache for this run: nothing is looked up or stored.
+        """
+
+        self.disabled = True
+
+    def store(self, report):
+        """
+        Stores the serialized *report* for the current key, unless the cache is
+        not in use, the report was itself read from the cache or the checker
+        ended with an uncaught exception.
+        """
+
+        if self.key is None or self.disabled or self.hit is not None or self.crashed:
+            return
+
+        entry_path = self._entry_path()
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(entry_path))
+        with os.fdopen(fd, "w", encoding="utf-8") as entry:
+            entry.write(report)
+        os.replace(temp_path, entry_path)
+
+
+result_cache = ResultCache()
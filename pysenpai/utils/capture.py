@@ -0,0 +1,224 @@
+"""
+This module implements file descriptor level output capture. Normally student
+output is captured by replacing sys.stdout with a
+:class:`~pysenpai.utils.internal.StringOutput` object, which misses everything
+written directly into file descriptors 1 and 2 (os.write, C extensions,
+sys.__stdout__, subprocesses). When fd capture is enabled with
+:func:`~pysenpai.core.enable_fd_capture`, both descriptors are redirected into
+pipes that a reader thread drains into bounded ring buffers. Only the last
+*capacity* bytes written to each descriptor are kept, so memory use stays fixed
+regardless of how much is written. Whatever is written into descriptor 2 is
+also passed through to the original stderr, so that errors, including the
+checker's own tracebacks, are not lost.
+
+The evaluation report is written into a duplicate of the original stdout
+descriptor that is not inherited by subprocesses.
+"""
+
+import os
+import select
+import sys
+import threading
+
+DEFAULT_CAPACITY = 256 * 1024
+TRUNCATION_MARK = "[...]\n"
+
+
+class RingBuffer(object):
+    """
+    Byte buffer that keeps the last *capacity* bytes written into it. The
+    number of bytes that have been discarded is kept in *dropped* and the
+    number of bytes written in total in *written*, which readers use as the
+    position of the buffer's end.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = bytearray()
+        self.dropped = 0
+        self.written = 0
+        self._text = None
+
+    def write(self, data):
+        self.written += len(data)
+        if len(data) > self.capacity:
+            self.dropped += len(data) - self.capacity
+            data = data[-self.capacity:]
+        self.data += data
+        overflow = len(self.data) - self.capacity
+        if overflow > 0:
+            self.dropped += overflow
+            del self.data[:overflow]
+        self._text = None
+
+    def clear(self):
+        self.data.clear()
+        self.dropped = 0
+        self.written = 0
+        self._text = None
+
+    def text(self, start=0):
+        """
+        Returns the buffer contents written after position *start* decoded as
+        UTF-8. If some of them have been discarded, the text starts with a
+        truncation mark.
+        """
+
+        if self._text is not None and self._text[0] == start:
+            return self._text[1]
+
+        first = self.written - len(self.data)
+        if start >= first:
+            text = self.data[start - first:].decode("utf-8", errors="replace")
+        else:
+            text = TRUNCATION_MARK + self.data.decode("utf-8", errors="replace")
+        self._text = (start, text)
+        return text
+
+
+class FdCapture(object):
+    """
+    Redirects file descriptors 1 and 2 into ring buffers while active. There is
+    one instance, :data:`fd_capture`, that is managed through
+    :func:`~pysenpai.core.enable_fd_capture`. While it's active, StringOutput
+    objects write into and read from its buffers so that output written through
+    Python and directly into the descriptors ends up in the same place.
+    """
+
+    def __init__(self):
+        self.active = False
+        self.lock = threading.Lock()
+
+    def start(self, capacity=DEFAULT_CAPACITY):
+        if self.active:
+            return
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+        self.report_fd = os.dup(1)
+        self.saved_fds = {2: os.dup(2)}
+        self.buffers = {}
+        self.pipes = {}
+        for fd in (1, 2):
+            read_end, write_end = os.pipe()
+            os.dup2(write_end, fd)
+            os.close(write_end)
+            os.set_blocking(read_end, False)
+            self.pipes[fd] = read_end
+            self.buffers[fd] = RingBuffer(capacity)
+
+        self.active = True
+        self.thread = threading.Thread(target=self._reader, daemon=True)
+        self.thread.start()
+
+    def _drain(self, fd):
+        # lock must be held
+        while True:
+            try:
+                data = os.read(self.pipes[fd], 65536)
+            except BlockingIOError:
+                return
+            if not data:
+                return
+            self.buffers[fd].write(data)
+            if fd in self.saved_fds:
+                self._pass_through(self.saved_fds[fd], data)
+
+    def _pass_through(self, target, data):
+        while data:
+            try:
+                written = os.write(target, data)
+            except OSError:
+                return
+            data = data[written:]
+
+    def _reader(self):
+        # keeps the pipes from filling up while student code is running
+        pipes = list(self.pipes.values())
+        while self.active:
+            ready, _, _ = select.select(pipes, [], [], 0.05)
+            if ready:
+                with self.lock:
+                    for fd in self.pipes:
+                        self._drain(fd)
+
+    def _flush_streams(self):
+        for stream in (sys.__stdout__, sys.__stderr__):
+            try:
+                stream.flush()
+            except (AttributeError, OSError, ValueError):
+                pass
+
+    def write(self, fd, text):
+        """
+        Writes *text* from Python code into the buffer of *fd*, after
+        collecting anything already written into the descriptor itself.
+        """
+
+        self._flush_streams()
+        with self.lock:
+            self._drain(fd)
+            self.buffers[fd].write(text.encode("utf-8", errors="replace"))
+
+    def read(self, fd, start=0):
+        """
+        Returns what has been written into *fd* after position *start* (see
+        :meth:`position`) as text, as far as it's still kept in the buffer.
+        """
+
+        self._flush_streams()
+        with self.lock:
+            self._drain(fd)
+            return self.buffers[fd].text(start)
+
+    def position(self, fd):
+        """
+        Returns the current end position of the buffer of *fd*. Readers that
+        share the buffer read from their own start positions.
+        """
+
+        self._flush_streams()
+        with self.lock:
+            self._drain(fd)
+            return self.buffers[fd].written
+
+    def clear(self, fd):
+        self._flush_streams()
+        with self.lock:
+            self._drain(fd)
+            self.buffers[fd].clear()
+
+    def write_report(self, report):
+        """
+        Writes the evaluation report and a newline into the protected report
+        descriptor.
+        """
+
+        data = (report + "\n").encode("utf-8")
+        while data:
+            written = os.write(self.report_fd, data)
+            data = data[written:]
+
+    def stop(self):
+        """
+        Restores the original descriptors. Output captured so far is
+        discarded, except that what is left of stderr is passed through.
+        """
+
+        if not self.active:
+            return
+
+        self._flush_streams()
+        self.active = False
+        self.thread.join()
+        with self.lock:
+            self._drain(2)
+        os.dup2(self.report_fd, 1)
+        os.dup2(self.saved_fds[2], 2)
+        os.close(self.saved_fds[2])
+        for read_end in self.pipes.values():
+            os.close(read_end)
+        os.close(self.report_fd)
+
+
+fd_capture = FdCapture()
@@ -1,21 +1,46 @@
 import inspect
 import random
 import re
+from collections import deque
 from pysenpai.exceptions import NoMatchingObject
 
 import_as_pat = re.compile("import (?P<module>[A-Za-z0-9_]+) as (?P<alias>[A-Za-z0-9_ÄäÖö]+)")
 
 class CallLogger(object):
+    """
+    Object that can replace a module or an object in the student code and logs
+    the attributes accessed and the arguments of calls made through it. If
+    *max_calls* is given, only that many latest entries are kept and the 
+    number of discarded calls is counted in *dropped*.
+    """
 
-    def __init__(self):
-        self.calls = []
-        self.args = []
-        self.kwargs = []
+    def __init__(self, max_calls=None):
+        if max_calls:
+            self.calls = deque(maxlen=max_calls)
+            self.args = deque(maxlen=max_calls)
+            self.kwargs = deque(maxlen=max_calls)
+        else:
+            self.calls = []
+            self.args = []
+            self.kwargs = []
+        self.max_calls = max_calls
+        self.dropped = 0
 
     def __call__(self, *args, **kwargs):
         self.args.append(args)
         self.kwargs.append(kwargs)
         
+    def record(self, name, args, kwargs):
+        """
+        Logs a call to *name* with *args* and *kwargs* as one entry.
+        """
+        
+        if self.max_calls and len(self.calls) == self.max_calls:
+            self.dropped += 1
+        self.calls.append(name)
+        self.args.append(args)
+        self.kwargs.append(kwargs)
+        
     def __getattr__(self, attr):
         self.calls.append(attr)
         return self
@@ -94,10 +119,12 @@ def replace_module(st_module, module_name, object):
     setattr(st_module, module_name, object)
     return original
 
-def determine_question(history, completed, active, target):
+def determine_question(history, completed, active, target, session_stats=None):
     '''
     Determines what and if a question needs to be asked. 
     - Depends on cmd line argument and the amount of correct questions answered.
+    - Answer counts are read from session_stats instead of history if given
+      (see pysenpai.utils.generation.new_session_stats).
     '''
     if completed:
         return random.choice(active), None, None
@@ -106,8 +133,11 @@ def determine_question(history, completed, active, target):
     remaining = 0
     done = 0
     for cq in active:
-        correct = history.count([cq, True])
-        incorrect = history.count([cq, False])
+        if session_stats is None:
+            correct = history.count([cq, True])
+            incorrect = history.count([cq, False])
+        else:
+            correct, incorrect = session_stats["counts"].get(str(cq), (0, 0))
         done += correct
         if correct < target or correct <= incorrect:
             choices.append(cq)
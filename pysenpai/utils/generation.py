@@ -6,8 +6,17 @@ a task that is scored based on how many individual questions have been answered
 
 """
 
+import json
+import linecache
+import os
+import pickle
 import random
 import string
+import threading
+import time
+import types
+import uuid
+import warnings
 import pysenpai.callbacks.defaults as defaults
 from pysenpai.callbacks.convenience import vars_validator
 from pysenpai.checking.testcase import FunctionTestCase, ProgramTestCase
@@ -17,14 +26,84 @@ from pysenpai.checking.testcase import FunctionTestCase, ProgramTestCase
 RANDOM = 0
 SERIAL = 1
 
+RECENT_WINDOW = 10
+
+# Pregenerated references that are older than this (in seconds) are removed
+# when the pool is filled
+REFERENCE_TTL = 24 * 60 * 60
+
+
+class CodeModule(types.ModuleType):
+    """
+    A module that is constructed from source code in memory instead of being
+    imported from a file. The code is compiled once, and executed again every
+    time :meth:`execute` is called. The source is registered into
+    :mod:`linecache` under a pseudo filename so that exception lines and
+    :func:`inspect.getsource` work like they do for regular modules.
+    """
+
+    def __init__(self, name, source):
+        super().__init__(name)
+        self.__file__ = "<{}>".format(name)
+        self.__source__ = source
+        lines = source.splitlines(True)
+        linecache.cache[self.__file__] = (len(source), None, lines, self.__file__)
+        self.__compiled__ = compile(source, self.__file__, "exec")
+
+    def execute(self):
+        """
+        Runs the module code in a clean namespace, i.e. all names set by previous
+        executions are removed first.
+        """
+
+        for name in [name for name in self.__dict__ if not name.startswith("__")]:
+            del self.__dict__[name]
+        exec(self.__compiled__, self.__dict__)
+        return self
+
 
 class CommonBase:
 
     QUESTION_CLASS = -1
 
+    # QuestionPool that pregenerated references are looked up from, see
+    # QuestionPool.serve_references
+    reference_pool = None
+
+    @classmethod
+    def pregenerate_reference(cls, params):
+        """
+        Computes the reference for *params* without creating the test case.
+        Used by :class:`QuestionPool` to pregenerate references.
+        """
+
+        return cls.__new__(cls)._make_reference(params)
+
+    def _reference(self, params):
+        if self.reference_pool is not None:
+            found, reference = self.reference_pool.reference(params)
+            if found:
+                return reference
+        return self._make_reference(params)
+
     def construct_module(self, answer, params):
         return answer
 
+    def build_module(self, answer, params, name="temp_module", lang="en", **options):
+        """
+        Constructs the answer into a :class:`CodeModule` and executes it once,
+        without touching the file system. The returned module can be used in
+        place of an imported temp_module. The answer is run like in
+        :func:`~pysenpai.core.load_module`: its output is captured, and if it
+        raises an exception (including SyntaxError), the error is reported with
+        the import messages and None is returned. *options* are passed to
+        :func:`~pysenpai.core.load_code_module`.
+        """
+
+        from pysenpai.core import load_code_module
+
+        return load_code_module(name, self.construct_module(answer, params), lang, **options)
+
     @property
     def extra_messages(self):
         return {}
@@ -47,7 +126,7 @@ class ProgramBase(CommonBase, ProgramTestCase):
 
     def __init__(self, params):
         super().__init__(
-            ref_result=self._make_reference(params),
+            ref_result=self._reference(params),
             validator=vars_validator,
             presenters={
                 "res": defaults.default_vars_presenter,
@@ -60,7 +139,10 @@ class ProgramBase(CommonBase, ProgramTestCase):
         return [self]
 
     def wrap(self, st_module, target):
-        super().wrap(st_module, target)
+        if isinstance(st_module, CodeModule):
+            st_module.execute()
+        else:
+            super().wrap(st_module, target)
         return st_module
 
 
@@ -68,7 +150,7 @@ class FunctionBase(CommonBase, FunctionTestCase):
 
     def __init__(self, params):
         super().__init__(
-            ref_result=self._make_reference(params),
+            ref_result=self._reference(params),
         )
 
     @property
@@ -82,15 +164,264 @@ class FunctionBase(CommonBase, FunctionTestCase):
 
 
 
+class QuestionPool:
+    """
+    A pool of pregenerated question instances stored in a directory, with one
+    subdirectory for each language and question class. Each instance is the
+    return value of the question's generate method stored as a JSON file.
+    Instances are handed out by atomically renaming their file, so concurrent
+    checker processes can share the same pool safely. 
+
+    *questions* is the same dictionary of question objects keyed by question
+    class that is given to :func:`process_results`. The pool is kept at *size*
+    instances per class by calling :meth:`fill`. A checker process handles one
+    answer and exits, which ends any refill thread it has started, so the pool
+    should be refilled by a long-running process that calls
+    :meth:`refill_forever`, or by calling :meth:`fill` periodically, e.g. from
+    cron::
+
+        pool = QuestionPool("/var/lib/pool", questions, "en")
+        pool.refill_forever(interval=5)
+
+    :meth:`start_refill` runs the same loop in a daemon thread for processes
+    that keep running, such as a checker server. *lang* is the default language
+    of the instances.
+
+    For questions that are :class:`CommonBase` subclasses (or their instances),
+    the reference is pregenerated as well. Other questions are stored without
+    one, with a warning. It's stored on the server side in the pool's refs
+    directory, so it's never sent to the client with the params. The params
+    carry the reference's id in meta["pool_id"]. A checker that calls
+    :meth:`serve_references` gets the stored reference when the answer is
+    checked, instead of computing it again. References that haven't been used
+    within *reference_ttl* seconds are removed by :meth:`fill`.
+
+    The params go through JSON like they do when they are sent to the client,
+    so generate must return JSON compatible params: tuples become lists and
+    dictionary keys become strings. References are stored with pickle and keep
+    their types.
+    """
+
+    def __init__(self, path, questions, lang, size=20, reference_ttl=REFERENCE_TTL):
+        self.path = path
+        self.questions = questions
+        self.lang = lang
+        self.size = size
+        self.reference_ttl = reference_ttl
+        self._stop = threading.Event()
+
+    def _class_dir(self, question_class, lang=None):
+        path = os.path.join(self.path, lang or self.lang, str(question_class))
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _ref_path(self, pool_id):
+        return os.path.join(self.path, "refs", pool_id + ".pickle")
+
+    def _store_reference(self, question, instance):
+        question_type = question if isinstance(question, type) else type(question)
+        if not issubclass(question_type, CommonBase):
+            warnings.warn(
+                "{} is not a CommonBase question, its instances are pooled without "
+                "pregenerated references".format(question_type.__name__),
+                stacklevel=3
+            )
+            return
+        try:
+            reference = question.pregenerate_reference(instance)
+        except NotImplementedError:
+            return
+
+        pool_id = uuid.uuid4().hex
+        ref_path = self._ref_path(pool_id)
+        os.makedirs(os.path.dirname(ref_path), exist_ok=True)
+        with open(ref_path + ".tmp", "wb") as ref_file:
+            pickle.dump(reference, ref_file)
+        os.replace(ref_path + ".tmp", ref_path)
+        instance.setdefault("meta", {})["pool_id"] = pool_id
+
+    def _prune_references(self):
+        ref_dir = os.path.join(self.path, "refs")
+        if not os.path.isdir(ref_dir):
+            return
+        limit = time.time() - self.reference_ttl
+        with os.scandir(ref_dir) as entries:
+            for entry in entries:
+                try:
+                    if entry.stat().st_mtime < limit:
+                        os.remove(entry.path)
+                except OSError:
+                    pass
+
+    def fill(self, question_classes=None, lang=None):
+        """
+        Generates instances in *lang* (the pool's language by default) until
+        each question class (all by default) has at least *size* instances in
+        the pool. Returns the number of instances generated.
+        """
+
+        lang = lang or self.lang
+        generated = 0
+        for question_class in question_classes or self.questions.keys():
+            class_dir = self._class_dir(question_class, lang)
+            available = len([name for name in os.listdir(class_dir) if name.endswith(".json")])
+            for i in range(self.size - available):
+                question = self.questions[question_class]
+                instance = question.generate(lang)
+                self._store_reference(question, instance)
+                name = uuid.uuid4().hex
+                temp_path = os.path.join(class_dir, name + ".tmp")
+                with open(temp_path, "w", encoding="utf-8") as instance_file:
+                    json.dump(instance, instance_file)
+                os.replace(temp_path, os.path.join(class_dir, name + ".json"))
+                generated += 1
+        self._prune_references()
+        return generated
+
+    def take(self, question_class, lang=None):
+        """
+        Takes one instance of *question_class* in *lang* (the pool's language
+        by default) from the pool. If the pool is empty, the instance is
+        generated on the spot instead.
+        """
+
+        lang = lang or self.lang
+        class_dir = self._class_dir(question_class, lang)
+        claimed_suffix = ".{}.taken".format(os.getpid())
+        with os.scandir(class_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".json"):
+                    continue
+                claimed = entry.path + claimed_suffix
+                try:
+                    os.rename(entry.path, claimed)
+                except OSError:
+                    # another process claimed it first
+                    continue
+                with open(claimed, encoding="utf-8") as instance_file:
+                    instance = json.load(instance_file)
+                os.remove(claimed)
+                return instance
+
+        return self.questions[question_class].generate(lang)
+
+    def reference(self, params):
+        """
+        reference(params) -> (found, reference)
+
+        Looks up the pregenerated reference of the instance *params*. Returns
+        (False, None) if there is none.
+        """
+
+        pool_id = (params.get("meta") or {}).get("pool_id")
+        if not pool_id or not all(c in string.hexdigits for c in pool_id):
+            return False, None
+        try:
+            with open(self._ref_path(pool_id), "rb") as ref_file:
+                return True, pickle.load(ref_file)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return False, None
+
+    def serve_references(self):
+        """
+        Makes :class:`FunctionBase` and :class:`ProgramBase` questions use the
+        references pregenerated into this pool.
+        """
+
+        CommonBase.reference_pool = self
+
+    def refill_forever(self, interval=1.0):
+        """
+        Calls :meth:`fill` every *interval* seconds until :meth:`stop_refill`
+        is called. This blocks, so it's meant to be the main loop of a separate
+        long-running refill process.
+        """
+
+        self._stop.clear()
+        self._refill(interval)
+
+    def _refill(self, interval):
+        while not self._stop.is_set():
+            self.fill()
+            self._stop.wait(interval)
+
+    def start_refill(self, interval=1.0):
+        """
+        Starts a daemon thread that runs :meth:`refill_forever` until
+        :meth:`stop_refill` is called. Returns the thread. The thread ends when
+        the process exits, so this only keeps the pool filled in processes
+        that keep running after the current answer has been checked.
+        """
+
+        self._stop.clear()
+        thread = threading.Thread(target=self._refill, args=(interval, ), daemon=True)
+        thread.start()
+        return thread
+
+    def stop_refill(self):
+        self._stop.set()
+
+
+def new_session_stats(window=RECENT_WINDOW):
+    """
+    Creates an empty session statistics state. The state is a JSON compatible
+    dictionary that replaces the answer history for scheduling purposes. It
+    contains correct and incorrect counters for each question class (keyed by
+    the class as a string), the total number of correct answers, the last answer
+    and a list of at most *window* most recent answers.
+    """
+
+    return {
+        "counts": {},
+        "correct": 0,
+        "last": None,
+        "recent": [],
+        "window": window
+    }
+
+def update_session_stats(session_stats, question_class, correct):
+    """
+    Records one answer into *session_stats* in constant time and returns the
+    updated state. 
+    """
+
+    counts = session_stats["counts"].setdefault(str(question_class), [0, 0])
+    if correct:
+        counts[0] += 1
+        session_stats["correct"] += 1
+    else:
+        counts[1] += 1
+    session_stats["last"] = [question_class, correct]
+    session_stats["recent"].append([question_class, correct])
+    del session_stats["recent"][:-session_stats["window"]]
+    return session_stats
+
+def session_stats_from_history(history, window=RECENT_WINDOW):
+    """
+    Builds session statistics from an existing answer *history*. Used for
+    converting sessions that were started before statistics were kept.
+    """
+
+    session_stats = new_session_stats(window)
+    for question_class, correct in history:
+        update_session_stats(session_stats, question_class, correct)
+    return session_stats
+
 def basic_scoring(stats, done, remaining):
     return int(remaining <= 0), remaining <= 0
 
 def process_results(questions, history, max_score, active, target, lang,
                     scoring_function=basic_scoring,
-                    mode=RANDOM):
+                    mode=RANDOM,
+                    session_stats=None,
+                    pool=None):
     '''
     Determines what and if a question needs to be asked.
     - Depends on cmd line argument and the amount of correct questions answered.
+    - If session_stats (see new_session_stats) is given, it's used instead of
+      counting answers from history, and it's included in the result.
+    - If pool (a QuestionPool) is given, the next question is taken from it
+      instead of being generated.
     '''
 
     choices = []
@@ -99,8 +430,11 @@ def process_results(questions, history, max_score, active, target, lang,
     done = 0
     extra_correct = 0
     for qc in active:
-        correct = history.count([qc, True])
-        incorrect = history.count([qc, False])
+        if session_stats is None:
+            correct = history.count([qc, True])
+            incorrect = history.count([qc, False])
+        else:
+            correct, incorrect = session_stats["counts"].get(str(qc), (0, 0))
         done += correct
         if correct < target:
             choices.append(qc)
@@ -115,19 +449,36 @@ def process_results(questions, history, max_score, active, target, lang,
         choices = active
 
     if mode == RANDOM:
-        next_q = questions[random.choice(choices)].generate(lang)
+        next_class = random.choice(choices)
     elif mode == SERIAL:
-        next_q = questions[len([record for record in history if record[1]]) % len(active)].generate(lang)
-
-    return {
-        "correct": bool(history) and history[-1][1],
-        "question_class": history and history[-1][0],
+        if session_stats is None:
+            total_correct = len([record for record in history if record[1]])
+        else:
+            total_correct = session_stats["correct"]
+        next_class = total_correct % len(active)
+
+    if pool is None:
+        next_q = questions[next_class].generate(lang)
+    else:
+        next_q = pool.take(next_class, lang)
+
+    if session_stats is None:
+        last = history and history[-1]
+    else:
+        last = session_stats["last"]
+
+    result = {
+        "correct": bool(last) and last[1],
+        "question_class": last[0] if last else [],
         "score": score,
         "max": max_score,
         "completed": completed,
         "progress": f"{done} / {done + remaining - extra_correct}",
         "next": next_q
     }
+    if session_stats is not None:
+        result["stats"] = session_stats
+    return result
 
 
 def write_module(constructed_code, name="temp_module.py"):
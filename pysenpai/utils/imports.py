@@ -0,0 +1,97 @@
+"""
+This module implements the import finder for submitted files. Instead of adding
+the submission directories to sys.path, each submitted file is registered to
+:data:`submission_finder` under its module name. The finder is first in
+sys.meta_path and resolves registered names with a dictionary lookup, so
+the rest of the checker's imports are not slowed down and other files in the
+submission directories can't be imported by accident.
+
+Files whose module name is already provided by a library installed for the
+checker are not registered, so a submission can never shadow the checker's
+own dependencies. :func:`~pysenpai.core.load_module` reports these files with
+the LibraryModuleName message.
+"""
+
+import importlib.abc
+import importlib.machinery
+import importlib.util
+import os
+import sys
+
+
+class SubmissionLoader(importlib.machinery.SourceFileLoader):
+    """
+    Source file loader that keeps compiled bytecode in the *memory* dictionary
+    instead of writing it into __pycache__ in the submission directory. If
+    *memory* is None, it works like the normal loader.
+    """
+
+    def __init__(self, fullname, path, memory=None):
+        super().__init__(fullname, path)
+        self.memory = memory
+
+    def get_data(self, path):
+        if self.memory is not None and path.endswith(tuple(importlib.machinery.BYTECODE_SUFFIXES)):
+            try:
+                return self.memory[path]
+            except KeyError:
+                raise OSError(path)
+        return super().get_data(path)
+
+    def set_data(self, path, data, *, _mode=0o666):
+        if self.memory is None:
+            super().set_data(path, data, _mode=_mode)
+        else:
+            self.memory[path] = data
+
+
+class SubmissionFinder(importlib.abc.MetaPathFinder):
+    """
+    Meta path finder that maps registered module names to submitted files.
+    There is one instance, :data:`submission_finder`.
+    """
+
+    def __init__(self):
+        self.modules = {}
+        self.shadowing = set()
+        self.memory = None
+
+    def register(self, path):
+        """
+        Registers the file at *path* under its module name and installs the
+        finder if needed. Returns False if the name belongs to an installed
+        library, in which case the file is not registered.
+        """
+
+        name = os.path.splitext(os.path.basename(path))[0]
+        path = os.path.abspath(path)
+        spec = importlib.machinery.PathFinder.find_spec(name)
+        if spec is not None and spec.origin and os.path.abspath(spec.origin) != path:
+            self.shadowing.add(name)
+            return False
+
+        self.modules[name] = path
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+        return True
+
+    def shadows(self, name):
+        return name in self.shadowing
+
+    def keep_bytecode_in_memory(self):
+        if self.memory is None:
+            self.memory = {}
+
+    def find_spec(self, fullname, path=None, target=None):
+        if path is not None:
+            return None
+        try:
+            file_path = self.modules[fullname]
+        except KeyError:
+            return None
+        return importlib.util.spec_from_file_location(
+            fullname, file_path, loader=SubmissionLoader(fullname, file_path, self.memory)
+        )
+
+
+submission_finder = SubmissionFinder()
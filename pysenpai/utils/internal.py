@@ -1,34 +1,66 @@
 import argparse
+import builtins
+import copy
+import linecache
+import os
 import re
+import sys
+import types
+
+from pysenpai.exceptions import InputExhausted
+from pysenpai.utils.capture import fd_capture
 
 FNAME_PAT = re.compile("[a-zA-Z0-9_]+")
 
+_END = object()
+_UNSET = object()
+
 class StringOutput(object):
     """
     This class is used as a replacement for sys.stdout whenever the student code
     is running. It saves the output into a string so that it can be parsed and/or 
     evaluated in the evaluation phase of the test. 
+    
+    If fd level capture is active (see :func:`~pysenpai.core.enable_fd_capture`),
+    the object uses the capture buffer of file descriptor *fd* instead of its own
+    string. The content then also includes output written directly into the 
+    descriptor, and only the end of long output is kept. The buffer is shared,
+    so each object only shows what was written after it was created or last
+    cleared.
     """    
     
     errors = ""
     encoding = "utf-8"
     
-    def __init__(self):
-        self.content = ""
+    def __init__(self, fd=1):
+        self.fd = fd
+        self._content = ""
+        self._start = fd_capture.position(fd) if fd_capture.active else 0
+        
+    @property
+    def content(self):
+        if fd_capture.active:
+            return fd_capture.read(self.fd, self._start)
+        return self._content
     
     def write(self, text):
         """
         Write into the contained string.
         """
         
-        self.content += text
+        if fd_capture.active:
+            fd_capture.write(self.fd, text)
+        else:
+            self._content += text
         
     def clear(self):
         """
         Clear the contained string.
         """
         
-        self.content = ""
+        if fd_capture.active:
+            self._start = fd_capture.position(self.fd)
+        self._content = ""
         
     def flush(self):
         """
@@ -38,6 +70,128 @@ class StringOutput(object):
         pass
 
 
+class InputProvider(object):
+    """
+    This class is used as a replacement for sys.stdin whenever the student code
+    is running. It takes any iterable of *inputs*, including generators, and
+    produces one line per input only when the student code reads it, so large
+    input sets are never materialized in full. The inputs that have been read
+    are kept in *read_inputs* and their count in *consumed*.
+
+    Reading behaves like reading a StringIO object made by joining the inputs
+    with newlines, except that :meth:`readline` raises
+    :class:`~pysenpai.exceptions.InputExhausted` when there is nothing left,
+    which is what :func:`input` ends up doing when it's called too many times.
+    Iterating over the object and :meth:`read` end normally.
+    """
+
+    errors = ""
+    encoding = "utf-8"
+
+    def __init__(self, inputs):
+        self._inputs = iter(inputs)
+        # the first input is fetched when the student code first reads
+        self._next = _UNSET
+        self._buffer = ""
+        self.read_inputs = []
+
+    @property
+    def consumed(self):
+        return len(self.read_inputs)
+
+    def _fill(self):
+        if self._next is _UNSET:
+            self._next = next(self._inputs, _END)
+        if self._next is _END:
+            return False
+
+        value = self._next
+        self._next = next(self._inputs, _END)
+        self.read_inputs.append(value)
+        self._buffer += str(value)
+        if self._next is not _END:
+            self._buffer += "\n"
+        return True
+
+    def _readline(self):
+        while "\n" not in self._buffer and self._fill():
+            pass
+        line, newline, self._buffer = self._buffer.partition("\n")
+        return line + newline
+
+    def readline(self, size=-1):
+        """
+        Returns the next line. Raises InputExhausted if all inputs have
+        been read.
+        """
+
+        line = self._readline()
+        if not line:
+            raise InputExhausted(self.consumed)
+        if 0 <= size < len(line):
+            self._buffer = line[size:] + self._buffer
+            line = line[:size]
+        return line
+
+    def read(self, size=-1):
+        while (size < 0 or len(self._buffer) < size) and self._fill():
+            pass
+        if size < 0:
+            size = len(self._buffer)
+        text, self._buffer = self._buffer[:size], self._buffer[size:]
+        return text
+
+    def readlines(self, hint=-1):
+        return list(self)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self._readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    def readable(self):
+        return True
+
+    def isatty(self):
+        return False
+
+    def close(self):
+        pass
+
+
+class LazyPresentation(object):
+    """
+    This class wraps a presenter call so that it is only made if the message
+    it's given to actually formats the value. Messages that don't include the
+    corresponding format specifier, and messages with empty content, never call
+    the presenter. The presented string is computed at most once.
+    
+    Note that :func:`~pysenpai.output.output` formats messages right away, so
+    the presenter is called when the message is output. Laziness saves work
+    only for messages that are never output, or whose content doesn't use the
+    value.
+    """
+    
+    def __init__(self, presenter, *args):
+        self.presenter = presenter
+        self.args = args
+        self._value = None
+        self._evaluated = False
+        
+    def __str__(self):
+        if not self._evaluated:
+            self._value = self.presenter(*self.args)
+            self._evaluated = True
+        return self._value
+        
+    def __format__(self, spec):
+        return format(str(self), spec)
+
+
 class CommaSplitAction(argparse.Action):
     """
     Action class for argument parsing. Takes a comma separated string and
@@ -49,6 +203,92 @@ class CommaSplitAction(argparse.Action):
         setattr(namespace, self.dest, [int(v) for v in values.split(",")])
 
 
+class ModuleSnapshot(object):
+    """
+    This class records the state of a student *module* so that it can be put
+    back between test cases without reloading the module. The snapshot covers
+
+    * the names in the module's namespace, and in the namespaces of the student's
+      own modules (modules from the same directory) that it has imported
+    * the contents of lists, dictionaries, sets and bytearrays bound to those
+      names (excluding dunder names)
+    * the keys of sys.modules
+    * the builtins named in *builtin_names*
+
+    Namespaces are saved as shallow copies. Containers are deep copied once when
+    the snapshot is taken, and on :meth:`restore` only the containers that no
+    longer compare equal to their copy are restored, in place, from a new deep
+    copy. Containers that can't be deep copied are not restored. Modules imported
+    after the snapshot are removed from sys.modules if they were loaded from
+    source files in the submission's directory or its subdirectories, so that
+    library modules imported by the student code stay loaded.
+    """
+
+    CONTAINER_TYPES = (list, dict, set, bytearray)
+
+    def __init__(self, module, builtin_names=("input", "print", "open", "exit", "quit")):
+        self.namespaces = [module.__dict__]
+        directory = os.path.dirname(os.path.abspath(getattr(module, "__file__", "") or ""))
+        self.directory = directory
+        for value in list(module.__dict__.values()):
+            if (isinstance(value, types.ModuleType) and value is not module
+                and os.path.dirname(os.path.abspath(getattr(value, "__file__", "") or "")) == directory):
+                self.namespaces.append(value.__dict__)
+
+        self.saved = [dict(namespace) for namespace in self.namespaces]
+        self.containers = []
+        seen = set()
+        for namespace in self.saved:
+            for name, value in namespace.items():
+                if name.startswith("__"):
+                    continue
+                if isinstance(value, self.CONTAINER_TYPES) and id(value) not in seen:
+                    seen.add(id(value))
+                    try:
+                        self.containers.append((value, copy.deepcopy(value)))
+                    except Exception:
+                        pass
+
+        self.modules = set(sys.modules)
+        self.builtins = {
+            name: getattr(builtins, name) for name in builtin_names if hasattr(builtins, name)
+        }
+
+    def restore(self):
+        """
+        Puts the recorded state back.
+        """
+
+        for namespace, saved in zip(self.namespaces, self.saved):
+            for name in [name for name in namespace if name not in saved]:
+                del namespace[name]
+            for name, value in saved.items():
+                if namespace.get(name, _END) is not value:
+                    namespace[name] = value
+
+        for container, pristine in self.containers:
+            try:
+                changed = container != pristine
+            except Exception:
+                changed = True
+            if changed:
+                fresh = copy.deepcopy(pristine)
+                if isinstance(container, (list, bytearray)):
+                    container[:] = fresh
+                else:
+                    container.clear()
+                    container.update(fresh)
+
+        for name in set(sys.modules) - self.modules:
+            origin = getattr(sys.modules[name], "__file__", None) or ""
+            if (origin.endswith(".py") and not name.startswith("pysenpai")
+                and os.path.abspath(origin).startswith(self.directory + os.sep)):
+                del sys.modules[name]
+
+        for name, value in self.builtins.items():
+            setattr(builtins, name, value)
+
+
 def reset_locals(module):
     """
     This function ensures that the student module is clean after each execution.
@@ -100,7 +340,6 @@ def get_exception_line(module, etrace):
     except IndexError:
         return "?", ""
         
-    with open(module.__file__) as cf:
-        for i in range(st_last_frame.f_lineno):
-            code = cf.readline()
-        return st_last_frame.f_lineno, code.strip()
+    linecache.checkcache(module.__file__)
+    code = linecache.getline(module.__file__, st_last_frame.f_lineno)
+    return st_last_frame.f_lineno, code.strip()
@@ -0,0 +1,265 @@
+"""
+Stub modules for libraries that are slow to import or need a display, such as
+matplotlib, turtle and tkinter. When a :class:`StubRegistry` is installed, the
+configured modules (and their submodules) are served as recording fakes to any
+import that happens afterwards, including the student module's. Every call made
+through a fake is logged into a :class:`~pysenpai.utils.checker.CallLogger`
+under its dotted name, e.g. "matplotlib.pyplot.plot" or
+"turtle.Turtle().forward", and the log can be compared against a reference
+trace with :func:`match_call_trace`.
+
+Install the registry before :func:`~pysenpai.core.load_module`::
+
+    stubs = install_stubs(["matplotlib", "turtle"])
+    st_module = load_module(files[0], lang)
+    ...
+    match_call_trace(stubs.log, [("turtle.forward", (100,), {})])
+
+Modules that have already been imported when the registry is installed are not
+replaced.
+"""
+
+import dis
+import importlib.abc
+import importlib.machinery
+import sys
+import types
+
+from pysenpai.exceptions import ValidationFailure
+from pysenpai.utils.checker import CallLogger
+
+DEFAULT_MAX_CALLS = 10000
+
+BINARY_OPERATORS = {
+    "add": "+", "sub": "-", "mul": "*", "matmul": "@", "truediv": "/",
+    "floordiv": "//", "mod": "%", "pow": "**", "and": "&", "or": "|", "xor": "^",
+    "lshift": "<<", "rshift": ">>"
+}
+UNARY_OPERATORS = {"neg": "-", "pos": "+", "invert": "~", "abs": "abs"}
+
+
+def _unpack_count(frame):
+    # the number of targets when the caller unpacks the object, e.g. a, b = stub
+    for instruction in dis.get_instructions(frame.f_code):
+        if instruction.offset == frame.f_lasti:
+            if instruction.opname == "UNPACK_SEQUENCE":
+                return instruction.arg
+            if instruction.opname == "UNPACK_EX":
+                return (instruction.arg & 0xFF) + (instruction.arg >> 8)
+            return 0
+    return 0
+
+
+class RecordingStub(object):
+    """
+    Fake object that stands for everything reached through a stub module.
+    Attribute access returns a new stub with a longer name and calling logs the
+    call and returns a stub for its result.
+
+    Stubs also support the protocols that code commonly uses on the objects of
+    such libraries. Indexing, arithmetic and with blocks give new stubs.
+    Unpacking gives as many stubs as there are targets (e.g.
+    ``fig, ax = plt.subplots()``), other iteration gives nothing, and
+    comparisons are False. Numeric conversions give zero and len gives 0.
+    """
+
+    def __init__(self, name, log):
+        self._name = name
+        self._log = log
+
+    def __getattr__(self, attr):
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        return RecordingStub("{}.{}".format(self._name, attr), self._log)
+
+    def __call__(self, *args, **kwargs):
+        self._log.record(self._name, args, kwargs)
+        return RecordingStub(self._name + "()", self._log)
+
+    def __getitem__(self, key):
+        return RecordingStub("{}[{!r}]".format(self._name, key), self._log)
+
+    def __setitem__(self, key, value):
+        pass
+
+    def __delitem__(self, key):
+        pass
+
+    def __iter__(self):
+        count = _unpack_count(sys._getframe(1))
+        return iter([RecordingStub("{}[{}]".format(self._name, i), self._log) for i in range(count)])
+
+    def __len__(self):
+        return 0
+
+    def __contains__(self, item):
+        return False
+
+    def __bool__(self):
+        return True
+
+    def __int__(self):
+        return 0
+
+    def __float__(self):
+        return 0.0
+
+    def __index__(self):
+        return 0
+
+    def __enter__(self):
+        return RecordingStub(self._name + ".__enter__()", self._log)
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __lt__(self, other):
+        return False
+
+    __le__ = __gt__ = __ge__ = __lt__
+
+    def __repr__(self):
+        return "<stub {}>".format(self._name)
+
+
+def _binary_operator(symbol, reflected):
+    def operator(self, other):
+        if reflected:
+            name = "({!r} {} {})".format(other, symbol, self._name)
+        else:
+            name = "({} {} {!r})".format(self._name, symbol, other)
+        return RecordingStub(name, self._log)
+    return operator
+
+def _unary_operator(symbol):
+    def operator(self):
+        return RecordingStub("{}({})".format(symbol, self._name), self._log)
+    return operator
+
+for _name, _symbol in BINARY_OPERATORS.items():
+    setattr(RecordingStub, "__{}__".format(_name), _binary_operator(_symbol, False))
+    setattr(RecordingStub, "__r{}__".format(_name), _binary_operator(_symbol, True))
+for _name, _symbol in UNARY_OPERATORS.items():
+    setattr(RecordingStub, "__{}__".format(_name), _unary_operator(_symbol))
+
+
+class StubModule(types.ModuleType):
+    """
+    Module object served by :class:`StubRegistry`. Names that are not set on
+    the module are looked up as :class:`RecordingStub` objects.
+    """
+
+    def __init__(self, name, log):
+        super().__init__(name)
+        self.__path__ = []
+        self._log = log
+
+    def __getattr__(self, attr):
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        return RecordingStub("{}.{}".format(self.__name__, attr), self._log)
+
+
+class StubRegistry(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    """
+    Meta path finder and loader that serves :class:`StubModule` objects for
+    the top-level module names in *names* and all of their submodules. Calls
+    are logged into *log*, a CallLogger that keeps at most *max_calls* calls.
+    """
+
+    def __init__(self, names, max_calls=DEFAULT_MAX_CALLS):
+        self.names = set(names)
+        self.log = CallLogger(max_calls)
+
+    def covers(self, fullname):
+        return fullname.split(".", 1)[0] in self.names
+
+    def find_spec(self, fullname, path=None, target=None):
+        if self.covers(fullname):
+            return importlib.machinery.ModuleSpec(fullname, self, is_package=True)
+        return None
+
+    def create_module(self, spec):
+        return StubModule(spec.name, self.log)
+
+    def exec_module(self, module):
+        pass
+
+    def install(self):
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        """
+        Removes the registry and the stub modules it has served from
+        sys.modules.
+        """
+
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+        for name, module in list(sys.modules.items()):
+            if isinstance(module, StubModule) and self.covers(name):
+                del sys.modules[name]
+
+
+def install_stubs(names, max_calls=DEFAULT_MAX_CALLS):
+    """
+    install_stubs(names[, max_calls=10000]) -> StubRegistry
+
+    Creates a :class:`StubRegistry` for the module names in *names* and
+    installs it first in sys.meta_path.
+    """
+
+    registry = StubRegistry(names, max_calls)
+    registry.install()
+    return registry
+
+def match_call_trace(log, reference, compare_args=True):
+    """
+    match_call_trace(log, reference[, compare_args=True])
+
+    Compares the calls in the CallLogger *log* to *reference*, a list of
+    (name, args, kwargs) tuples, or plain names if *compare_args* is False.
+    Raises :class:`~pysenpai.exceptions.ValidationFailure` with the key
+    fail_call_trace at the first difference, so it can be used inside
+    validators and custom tests. The message gets the position of the
+    difference (from 1) and the expected and actual calls.
+
+    If the log has discarded calls because it was full, the trace can't be
+    compared and the key is fail_call_trace_truncated instead, with the number
+    of calls made (*calls*) and kept (*kept*) in the message.
+    """
+
+    recorded = list(log)
+    dropped = getattr(log, "dropped", 0)
+    if dropped:
+        raise ValidationFailure(
+            "fail_call_trace_truncated",
+            calls=dropped + len(recorded),
+            kept=len(recorded)
+        )
+    for i in range(max(len(recorded), len(reference))):
+        expected = reference[i] if i < len(reference) else None
+        try:
+            actual = recorded[i] if compare_args else recorded[i][0]
+        except IndexError:
+            actual = None
+        if compare_args and expected is not None:
+            expected = tuple(expected)
+        if actual != expected:
+            raise ValidationFailure(
+                "fail_call_trace",
+                position=i + 1,
+                expected=_present_call(expected),
+                actual=_present_call(actual)
+            )
+
+def _present_call(call):
+    if call is None:
+        return "-"
+    if isinstance(call, str):
+        return call
+    name, args, kwargs = call
+    parts = [repr(arg) for arg in args]
+    parts.extend("{}={!r}".format(key, value) for key, value in kwargs.items())
+    return "{}({})".format(name, ", ".join(parts))
@@ -0,0 +1,426 @@
+"""
+This module implements the in-memory file system that student code sees while
+it's being called in a test case that has fixture files. When
+:data:`virtual_fs` is active, open (including pathlib's), os.stat and os.lstat
+(and with them os.path.exists, isfile, isdir, getsize and pathlib's exists,
+is_file, is_dir), os.listdir, os.scandir (and with it os.walk, glob and
+pathlib's iterdir and glob), os.mkdir and os.remove are served from the
+fixtures. Files the student writes are kept in memory and can be examined by
+validators through :attr:`VirtualFS.written` until the next case starts::
+
+    def file_validator(ref, res, parsed):
+        assert virtual_fs.written.get("result.txt") == ref, "fail_output_file"
+
+Fixtures are given as a dictionary of paths (relative to the working directory)
+and contents, which can be strings (stored as UTF-8), bytes, or
+:class:`MappedFixture` objects for large read-only files that are read through
+a memory map instead of being loaded into memory.
+
+Paths without a fixture are passed through to the real file system for
+reading. Writing and removing never touch the real file system.
+"""
+
+import builtins
+import contextlib
+import errno
+import io
+import mmap
+import os
+import stat
+
+_real_open = builtins.open
+_real_stat = os.stat
+_real_lstat = os.lstat
+_real_listdir = os.listdir
+_real_scandir = os.scandir
+_real_mkdir = os.mkdir
+_real_remove = os.remove
+
+
+class MappedFixture(object):
+    """
+    Read-only fixture backed by the real file at *path*. The file is memory
+    mapped when it's opened, so its content is never copied as a whole.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    @property
+    def size(self):
+        return _real_stat(self.path).st_size
+
+
+class _MappedReader(io.RawIOBase):
+
+    def __init__(self, path):
+        with _real_open(path, "rb") as source:
+            size = os.fstat(source.fileno()).st_size
+            self._map = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._map[self._pos:self._pos + len(buffer)]
+        buffer[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._map)
+        self._pos = max(0, offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        if not self.closed and isinstance(self._map, mmap.mmap):
+            self._map.close()
+        super().close()
+
+
+class _WriteBuffer(io.BytesIO):
+    # commits its content into the file system when closed
+
+    def __init__(self, vfs, path, initial=b""):
+        super().__init__(initial)
+        self._vfs = vfs
+        self._path = path
+
+    def close(self):
+        if not self.closed:
+            self._vfs._commit(self._path, self.getvalue())
+        super().close()
+
+
+class _DirEntry(object):
+    # os.DirEntry look-alike for the results of VirtualFS.scandir
+
+    def __init__(self, vfs, directory, name):
+        self._vfs = vfs
+        self.name = name
+        self.path = os.path.join(directory, name)
+
+    def __fspath__(self):
+        return self.path
+
+    def __repr__(self):
+        return "<DirEntry {!r}>".format(self.name)
+
+    def stat(self, follow_symlinks=True):
+        return self._vfs.stat(self.path)
+
+    def inode(self):
+        return self.stat().st_ino
+
+    def is_dir(self, follow_symlinks=True):
+        try:
+            return stat.S_ISDIR(self.stat().st_mode)
+        except OSError:
+            return False
+
+    def is_file(self, follow_symlinks=True):
+        try:
+            return stat.S_ISREG(self.stat().st_mode)
+        except OSError:
+            return False
+
+    def is_symlink(self):
+        try:
+            return stat.S_ISLNK(self._vfs.lstat(self.path).st_mode)
+        except OSError:
+            return False
+
+
+class _ScandirIterator(object):
+    # iterator and context manager like the one returned by os.scandir
+
+    def __init__(self, entries):
+        self._entries = iter(entries)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._entries)
+
+    def close(self):
+        self._entries = iter(())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class VirtualFS(object):
+    """
+    The in-memory file system. There is one instance, :data:`virtual_fs`,
+    which the test runners activate around student calls.
+    """
+
+    def __init__(self):
+        self.active = False
+        self.root = None
+        self.files = {}
+        self.dirs = set()
+        self.deleted = set()
+        self.changed = set()
+
+    def _path(self, path):
+        return os.path.normpath(os.path.join(self.root, os.fsdecode(os.fspath(path))))
+
+    def _relative(self, path):
+        return os.path.relpath(path, self.root)
+
+    def _commit(self, path, data):
+        self.files[path] = data
+        self.changed.add(path)
+        self.deleted.discard(path)
+
+    def activate(self, files, root=None):
+        """
+        Activates the file system with *files*, a dictionary of fixture paths
+        and contents. Paths are relative to *root*, which is the current
+        working directory by default. Files written in the previous activation
+        are discarded.
+        """
+
+        self.root = os.path.abspath(root or os.getcwd())
+        self.reset()
+        for path, content in files.items():
+            path = self._path(path)
+            if isinstance(content, str):
+                content = content.encode("utf-8")
+            self.files[path] = content
+            parent = os.path.dirname(path)
+            while parent != self.root and parent not in self.dirs and parent != os.path.dirname(parent):
+                self.dirs.add(parent)
+                parent = os.path.dirname(parent)
+
+        builtins.open = io.open = self.open
+        os.stat = self.stat
+        os.lstat = self.lstat
+        os.listdir = self.listdir
+        os.scandir = self.scandir
+        os.mkdir = self.mkdir
+        os.remove = os.unlink = self.remove
+        self.active = True
+
+    def deactivate(self):
+        """
+        Puts the real file system functions back. Written files remain
+        available in :attr:`written`.
+        """
+
+        if not self.active:
+            return
+        builtins.open = io.open = _real_open
+        os.stat = _real_stat
+        os.lstat = _real_lstat
+        os.listdir = _real_listdir
+        os.scandir = _real_scandir
+        os.mkdir = _real_mkdir
+        os.remove = os.unlink = _real_remove
+        self.active = False
+
+    @contextlib.contextmanager
+    def activated(self, files, root=None):
+        """
+        Context manager that activates the file system for the duration of
+        the block. If *files* is None, the real file system is used and only
+        the files written in the previous activation are discarded.
+        """
+
+        if files is None:
+            self.reset()
+            yield self
+            return
+        self.activate(files, root)
+        try:
+            yield self
+        finally:
+            self.deactivate()
+
+    def reset(self):
+        """
+        Discards all fixtures and written files.
+        """
+
+        self.files = {}
+        self.dirs = set()
+        self.deleted = set()
+        self.changed = set()
+
+    @property
+    def written(self):
+        """
+        Dictionary of files written during the last activation, with paths
+        relative to the root as keys and contents decoded as UTF-8 (bytes if
+        decoding fails) as values.
+        """
+
+        written = {}
+        for path in self.changed:
+            if path in self.files:
+                try:
+                    written[self._relative(path)] = self.files[path].decode("utf-8")
+                except UnicodeDecodeError:
+                    written[self._relative(path)] = self.files[path]
+        return written
+
+    def _exists(self, path):
+        if path in self.deleted:
+            return False
+        if path in self.files or path in self.dirs:
+            return True
+        try:
+            _real_stat(path)
+        except OSError:
+            return False
+        return True
+
+    def _check_parent(self, path, name):
+        # files and directories can only be created in existing directories
+        parent = os.path.dirname(path)
+        if parent in self.files:
+            raise NotADirectoryError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), name)
+        if parent in self.dirs:
+            return
+        try:
+            real_dir = parent not in self.deleted and stat.S_ISDIR(_real_stat(parent).st_mode)
+        except OSError:
+            real_dir = False
+        if not real_dir:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), name)
+
+    def _content(self, path):
+        content = self.files[path]
+        if isinstance(content, MappedFixture):
+            with _real_open(content.path, "rb") as source:
+                content = source.read()
+        return content
+
+    def open(self, file, mode="r", buffering=-1, encoding=None, errors=None, newline=None, closefd=True, opener=None):
+        if isinstance(file, int):
+            return _real_open(file, mode, buffering, encoding, errors, newline, closefd, opener)
+
+        path = self._path(file)
+        writing = any(flag in mode for flag in "wax+")
+        if not writing and path not in self.files:
+            if path in self.deleted:
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), file)
+            return _real_open(file, mode, buffering, encoding, errors, newline, closefd, opener)
+
+        if path in self.dirs:
+            raise IsADirectoryError(errno.EISDIR, os.strerror(errno.EISDIR), file)
+        exists = self._exists(path)
+        if not exists:
+            self._check_parent(path, file)
+        if "x" in mode and exists:
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), file)
+        if ("r" in mode or "a" in mode) and exists and path not in self.files:
+            # copy on write from the real file system
+            with _real_open(path, "rb") as source:
+                self.files[path] = source.read()
+        elif "r" in mode and not exists:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), file)
+
+        if not writing:
+            content = self.files[path]
+            if isinstance(content, MappedFixture):
+                raw = io.BufferedReader(_MappedReader(content.path))
+            else:
+                raw = io.BytesIO(content)
+        elif "w" in mode or "x" in mode:
+            raw = _WriteBuffer(self, path)
+            self._commit(path, b"")
+        else:
+            raw = _WriteBuffer(self, path, self._content(path) if path in self.files else b"")
+            if "a" in mode:
+                raw.seek(0, io.SEEK_END)
+
+        if "b" in mode:
+            return raw
+        return io.TextIOWrapper(raw, encoding=encoding or "utf-8", errors=errors, newline=newline)
+
+    def stat(self, path, *args, **kwargs):
+        return self._stat(_real_stat, path, *args, **kwargs)
+
+    def lstat(self, path, *args, **kwargs):
+        return self._stat(_real_lstat, path, *args, **kwargs)
+
+    def _stat(self, real_stat, path, *args, **kwargs):
+        if isinstance(path, int):
+            return real_stat(path, *args, **kwargs)
+
+        full = self._path(path)
+        if full in self.deleted:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+        if full in self.files:
+            content = self.files[full]
+            size = content.size if isinstance(content, MappedFixture) else len(content)
+            return os.stat_result((stat.S_IFREG | 0o644, 0, 0, 1, 0, 0, size, 0, 0, 0))
+        if full in self.dirs:
+            return os.stat_result((stat.S_IFDIR | 0o755, 0, 0, 2, 0, 0, 0, 0, 0, 0))
+        return real_stat(path, *args, **kwargs)
+
+    def listdir(self, path="."):
+        if isinstance(path, int):
+            return _real_listdir(path)
+
+        full = self._path(path)
+        try:
+            names = set(_real_listdir(full))
+        except OSError:
+            if full not in self.dirs:
+                raise
+            names = set()
+        for entry in list(self.files) + list(self.dirs):
+            if os.path.dirname(entry) == full:
+                names.add(os.path.basename(entry))
+        names.difference_update(
+            os.path.basename(entry) for entry in self.deleted if os.path.dirname(entry) == full
+        )
+        return sorted(names)
+
+    def scandir(self, path="."):
+        if isinstance(path, int):
+            return _real_scandir(path)
+
+        directory = os.fspath(path)
+        names = self.listdir(directory)
+        if isinstance(directory, bytes):
+            names = [os.fsencode(name) for name in names]
+        return _ScandirIterator(_DirEntry(self, directory, name) for name in names)
+
+    def mkdir(self, path, mode=0o777, *args, **kwargs):
+        full = self._path(path)
+        if self._exists(full):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), path)
+        self._check_parent(full, path)
+        self.dirs.add(full)
+        self.deleted.discard(full)
+
+    def remove(self, path, *args, **kwargs):
+        full = self._path(path)
+        if full in self.dirs:
+            raise IsADirectoryError(errno.EISDIR, os.strerror(errno.EISDIR), path)
+        if not self._exists(full):
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+        self.files.pop(full, None)
+        self.changed.discard(full)
+        self.deleted.add(full)
+
+
+virtual_fs = VirtualFS()